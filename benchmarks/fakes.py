@@ -0,0 +1,254 @@
+"""
+Fake backends for benchmarks - a canned Gmail API and a fake psutil process table
+"""
+import base64
+import email
+import email.policy
+import itertools
+import random
+import time
+import types
+from typing import Dict, List, Optional
+
+import psutil
+from googleapiclient.errors import HttpError
+
+
+class FakeResponse(dict):
+    """Minimal httplib2-style response for HttpError"""
+
+    def __init__(self, status: int):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = "Fake Gmail error"
+
+
+class FakeGmail:
+    """
+    Canned Gmail API backend mimicking googleapiclient's resource chain:
+    fake.users().messages().list(...).execute()
+
+    latency is seconds per upstream call, error_rate the fraction of calls
+    failing with HTTP 500, body_bytes the size of each message body.
+    """
+
+    def __init__(self, message_count: int = 200, body_bytes: int = 2048,
+                 latency: float = 0.0, error_rate: float = 0.0, seed: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls: Dict[str, int] = {}
+        self.sent: List[dict] = []
+        self._ids = itertools.count(1)
+        self.store = [self._make_message(i, body_bytes) for i in range(message_count)]
+        self.by_id = {m['id']: m for m in self.store}
+        self.history_id = 1000
+        self.attachments: Dict[str, str] = {}
+        self.drafts: Dict[str, dict] = {}
+
+    def _make_message(self, i: int, body_bytes: int) -> dict:
+        text = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * (body_bytes // 56 + 1))[:body_bytes]
+        data = base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+        return {
+            'id': f"msg{i:06d}",
+            'threadId': f"thr{i // 3:06d}",
+            'labelIds': ['INBOX'] + (['UNREAD'] if i % 2 else []),
+            'snippet': text[:100],
+            'payload': {
+                'mimeType': 'multipart/alternative',
+                'headers': [
+                    {'name': 'From', 'value': f"Sender {i % 17} <sender{i % 17}@example.com>"},
+                    {'name': 'To', 'value': 'me@example.com'},
+                    *([{'name': 'Cc', 'value': f"Colleague {i % 7} <colleague{i % 7}@example.org>"}] if i % 5 == 0 else []),
+                    {'name': 'Subject', 'value': f"Benchmark message {i}"},
+                    {'name': 'Date', 'value': 'Mon, 1 Jan 2024 10:00:00 +0000'},
+                    {'name': 'Message-ID', 'value': f"<msg{i}@example.com>"},
+                ],
+                'parts': [
+                    {'mimeType': 'text/plain', 'body': {'size': len(text), 'data': data}},
+                ],
+            },
+        }
+
+    # Resource chain
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, userId='me', maxResults=100, q='', pageToken=None, **kwargs):
+        start = int(pageToken or 0)
+        page = self.messages_page(start, maxResults)
+        return self._request('messages.list', page)
+
+    def messages_page(self, start: int, size: int) -> dict:
+        page = {'messages': [{'id': m['id'], 'threadId': m['threadId']}
+                             for m in self.store[start:start + size]],
+                'resultSizeEstimate': len(self.store)}
+        if start + size < len(self.store):
+            page['nextPageToken'] = str(start + size)
+        return page
+
+    def get(self, userId='me', id=None, format='full', **kwargs):
+        message = self.by_id.get(id)
+        if message is None:
+            return self._request('messages.get', None, status=404)
+        return self._request('messages.get', self.raw_message(message) if format == 'raw' else message)
+
+    def raw_message(self, message: dict) -> dict:
+        """A message in format='raw': the RFC 822 source, base64url-encoded"""
+        headers = ''.join(f"{h['name']}: {h['value']}\r\n" for h in message['payload']['headers'])
+        parts = message['payload'].get('parts') or [message['payload']]
+        text = base64.urlsafe_b64decode(parts[0]['body'].get('data', '')).decode('utf-8')
+        source = f"{headers}Content-Type: text/plain; charset=utf-8\r\n\r\n{text}\r\n".encode('utf-8')
+        return {
+            'id': message['id'],
+            'threadId': message['threadId'],
+            'labelIds': message['labelIds'],
+            'internalDate': '1704103200000',
+            'sizeEstimate': len(source),
+            'raw': base64.urlsafe_b64encode(source).decode('ascii'),
+        }
+
+    def send(self, userId='me', body=None, **kwargs):
+        sent = {'id': f"sent{next(self._ids):06d}", 'threadId': (body or {}).get('threadId', 'thrsent')}
+        self.sent.append(body or {})
+        return self._request('messages.send', sent)
+
+    def add_attachment(self, message_id: str, filename: str, mime_type: str, data: bytes) -> str:
+        """Attach data to a stored message; returns the attachment id"""
+        attachment_id = f"att{len(self.attachments):06d}"
+        self.attachments[attachment_id] = base64.urlsafe_b64encode(data).decode('ascii')
+        self.by_id[message_id]['payload']['parts'].append({
+            'mimeType': mime_type, 'filename': filename,
+            'body': {'attachmentId': attachment_id, 'size': len(data)},
+        })
+        return attachment_id
+
+    def attachment(self, attachment_id: str) -> Optional[dict]:
+        data = self.attachments.get(attachment_id)
+        if data is None:
+            return None
+        return {'attachmentId': attachment_id, 'size': len(base64.urlsafe_b64decode(data)), 'data': data}
+
+    def label_list(self) -> dict:
+        label_ids = sorted({label for m in self.store for label in m['labelIds']})
+        return {'labels': [{'id': label, 'name': label, 'type': 'system'} for label in label_ids]}
+
+    def label(self, label_id: str) -> Optional[dict]:
+        messages = [m for m in self.store if label_id in m['labelIds']]
+        if not messages:
+            return None
+        unread = [m for m in messages if 'UNREAD' in m['labelIds']]
+        return {'id': label_id, 'name': label_id, 'type': 'system',
+                'messagesTotal': len(messages), 'messagesUnread': len(unread),
+                'threadsTotal': len({m['threadId'] for m in messages}),
+                'threadsUnread': len({m['threadId'] for m in unread})}
+
+    def save_draft(self, draft_id: Optional[str], message: dict) -> dict:
+        """Create (draft_id None) or replace a draft from a {'raw', 'threadId'} message"""
+        parsed = email.message_from_bytes(base64.urlsafe_b64decode(message['raw']), policy=email.policy.default)
+        text = parsed.get_body(('plain',)).get_content() if parsed.get_body(('plain',)) else ''
+        draft_id = draft_id or f"r{next(self._ids):06d}"
+        self.drafts[draft_id] = {'id': draft_id, 'message': {
+            'id': f"dmsg{next(self._ids):06d}",
+            'threadId': message.get('threadId') or f"thrd{draft_id}",
+            'labelIds': ['DRAFT'],
+            'payload': {
+                'mimeType': 'text/plain',
+                'headers': [{'name': name, 'value': str(value)} for name, value in parsed.items()],
+                'body': {'data': base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')},
+            },
+        }}
+        return self.drafts[draft_id]
+
+    def send_draft(self, draft_id: str) -> Optional[dict]:
+        draft = self.drafts.pop(draft_id, None)
+        if draft is None:
+            return None
+        self.sent.append({'draft_id': draft_id})
+        return {'id': f"sent{len(self.sent):06d}", 'threadId': draft['message']['threadId']}
+
+    def threads_page(self, start: int, size: int) -> dict:
+        thread_ids = sorted({m['threadId'] for m in self.store})
+        page = {'threads': [{'id': t, 'historyId': str(self.history_id)} for t in thread_ids[start:start + size]],
+                'resultSizeEstimate': len(thread_ids)}
+        if start + size < len(thread_ids):
+            page['nextPageToken'] = str(start + size)
+        return page
+
+    def thread(self, thread_id: str) -> Optional[dict]:
+        messages = [m for m in self.store if m['threadId'] == thread_id]
+        if not messages:
+            return None
+        return {'id': thread_id, 'historyId': str(self.history_id), 'messages': messages}
+
+    def profile(self) -> dict:
+        return {'emailAddress': 'me@example.com', 'messagesTotal': len(self.store),
+                'threadsTotal': len({m['threadId'] for m in self.store}),
+                'historyId': str(self.history_id)}
+
+    def _request(self, method: str, result: Optional[dict], status: int = 200):
+        return FakeRequest(self, method, result, status)
+
+
+class FakeRequest:
+    """A pending fake API call; execute() applies latency and injected errors"""
+
+    def __init__(self, gmail: FakeGmail, method: str, result: Optional[dict], status: int):
+        self.gmail = gmail
+        self.method = method
+        self.result = result
+        self.status = status
+
+    def execute(self, http=None, num_retries=0):
+        gmail = self.gmail
+        gmail.calls[self.method] = gmail.calls.get(self.method, 0) + 1
+        if gmail.latency:
+            time.sleep(gmail.latency)
+        if self.status != 200 or (gmail.error_rate and gmail.random.random() < gmail.error_rate):
+            status = self.status if self.status != 200 else 500
+            raise HttpError(FakeResponse(status), b'{"error": {"message": "fake error"}}')
+        return self.result
+
+
+class FakeProcess:
+    """Stand-in for psutil.Process with canned attributes"""
+
+    def __init__(self, pid: int, name: str, exe: str, cmdline: List[str]):
+        self.pid = pid
+        self.info = {'pid': pid, 'name': name}
+        self._exe = exe
+        self._cmdline = cmdline
+
+    def exe(self):
+        return self._exe
+
+    def cmdline(self):
+        return self._cmdline
+
+    def kill(self):
+        pass
+
+
+def fake_psutil(process_count: int = 300, app_names: Optional[List[str]] = None):
+    """
+    Build a module-like object exposing process_iter() over a fake process
+    table. app_names get one running process each; the rest are filler.
+    """
+    app_names = app_names or []
+    processes = []
+    for pid, name in enumerate(app_names, start=1000):
+        processes.append(FakeProcess(pid, name, f"/usr/bin/{name}", [f"/usr/bin/{name}"]))
+    for pid in range(len(processes), process_count):
+        name = f"worker{pid}"
+        processes.append(FakeProcess(20000 + pid, name, f"/usr/sbin/{name}", [name, "--serve"]))
+
+    module = types.SimpleNamespace(
+        process_iter=lambda attrs=None: iter(processes),
+        NoSuchProcess=psutil.NoSuchProcess,
+        AccessDenied=psutil.AccessDenied,
+        ZombieProcess=psutil.ZombieProcess,
+    )
+    return module
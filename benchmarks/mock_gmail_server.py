@@ -0,0 +1,188 @@
+"""
+Mock Gmail REST server - serves FakeGmail data over the real Gmail URL layout
+
+Used to exercise AsyncGmailClient without Google: point the client at it
+in-process with httpx.ASGITransport(app=create_app(...)), or run it as a
+server and set GMAIL_API_BASE_URL:
+
+    uvicorn benchmarks.mock_gmail_server:app --port 8900
+"""
+import asyncio
+import hashlib
+import json
+import re
+import uuid
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from benchmarks.fakes import FakeGmail
+from services.gmail_async_client import encode_multipart, parse_multipart
+
+
+def _not_found(what: str) -> Tuple[int, Dict]:
+    return 404, {'error': {'code': 404, 'message': f"{what} not found"}}
+
+
+def dispatch(gmail: FakeGmail, verb: str, path: str, query: Dict[str, Any],
+             body: Optional[Dict]) -> Tuple[int, Dict]:
+    """Answer one Gmail REST call from the fake mailbox"""
+    def param(name, default=None):
+        value = query.get(name, default)
+        return value[0] if isinstance(value, list) else value
+
+    route_key = f"{verb} {re.sub(r'/[^/]*[0-9][^/]*', '/{id}', path)}"
+    gmail.calls[route_key] = gmail.calls.get(route_key, 0) + 1
+    if gmail.error_rate and gmail.random.random() < gmail.error_rate:
+        return 500, {'error': {'code': 500, 'message': 'fake error'}}
+
+    route = re.match(r'^/gmail/v1/users/[^/]+/(.*)$', path)
+    if not route:
+        return _not_found(path)
+    resource = route.group(1)
+
+    if verb == 'GET' and resource == 'profile':
+        return 200, gmail.profile()
+    if verb == 'GET' and resource == 'messages':
+        return 200, gmail.messages_page(int(param('pageToken', 0) or 0), int(param('maxResults', 100)))
+    if verb == 'POST' and resource == 'messages/send':
+        gmail.sent.append(body or {})
+        return 200, {'id': f"sent{len(gmail.sent):06d}", 'threadId': (body or {}).get('threadId', 'thrsent')}
+    if verb == 'POST' and resource == 'messages/batchModify':
+        for message_id in (body or {}).get('ids', []):
+            message = gmail.by_id.get(message_id)
+            if message:
+                labels = [l for l in message['labelIds'] if l not in body.get('removeLabelIds', [])]
+                message['labelIds'] = labels + [l for l in body.get('addLabelIds', []) if l not in labels]
+        return 204, None
+    if verb == 'POST' and resource == 'messages/batchDelete':
+        deleted = set((body or {}).get('ids', []))
+        gmail.store = [m for m in gmail.store if m['id'] not in deleted]
+        for message_id in deleted:
+            gmail.by_id.pop(message_id, None)
+        return 204, None
+    attachment_route = re.match(r'^messages/[^/]+/attachments/([^/]+)$', resource)
+    if verb == 'GET' and attachment_route:
+        attachment = gmail.attachment(attachment_route.group(1))
+        return (200, attachment) if attachment else _not_found('Attachment')
+    if verb == 'GET' and resource.startswith('messages/'):
+        message = gmail.by_id.get(resource.split('/', 1)[1])
+        if message and param('format') == 'raw':
+            message = gmail.raw_message(message)
+        return (200, message) if message else _not_found('Message')
+    if verb == 'GET' and resource == 'labels':
+        return 200, gmail.label_list()
+    if verb == 'GET' and resource.startswith('labels/'):
+        label = gmail.label(resource.split('/', 1)[1])
+        return (200, label) if label else _not_found('Label')
+    if verb == 'GET' and resource == 'drafts':
+        return 200, {'drafts': [{'id': d['id'], 'message': {'id': d['message']['id']}} for d in gmail.drafts.values()]}
+    if verb == 'POST' and resource == 'drafts':
+        return 200, gmail.save_draft(None, body['message'])
+    if verb == 'POST' and resource == 'drafts/send':
+        sent = gmail.send_draft(body['id'])
+        return (200, sent) if sent else _not_found('Draft')
+    if resource.startswith('drafts/'):
+        draft_id = resource.split('/', 1)[1]
+        if draft_id not in gmail.drafts:
+            return _not_found('Draft')
+        if verb == 'GET':
+            return 200, gmail.drafts[draft_id]
+        if verb == 'PUT':
+            return 200, gmail.save_draft(draft_id, body['message'])
+        if verb == 'DELETE':
+            del gmail.drafts[draft_id]
+            return 204, None
+    if verb == 'GET' and resource == 'threads':
+        return 200, gmail.threads_page(int(param('pageToken', 0) or 0), int(param('maxResults', 100)))
+    if verb == 'GET' and resource.startswith('threads/'):
+        thread = gmail.thread(resource.split('/', 1)[1])
+        return (200, thread) if thread else _not_found('Thread')
+    if verb == 'GET' and resource == 'history':
+        return 200, {'historyId': str(gmail.history_id)}
+    return _not_found(resource)
+
+
+def create_app(gmail: Optional[FakeGmail] = None) -> FastAPI:
+    gmail = gmail or FakeGmail()
+    app = FastAPI(title="Mock Gmail API")
+    app.state.gmail = gmail
+
+    @app.post("/batch/gmail/v1")
+    async def batch(request: Request):
+        if gmail.latency:
+            await asyncio.sleep(gmail.latency)
+        parts = []
+        for _, start_line, _, payload in parse_multipart(request.headers['content-type'], await request.body()):
+            verb, target = start_line.split()[:2]
+            url = urlsplit(target)
+            status, result = dispatch(gmail, verb, url.path, parse_qs(url.query),
+                                      json.loads(payload) if payload else None)
+            parts.append(
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                f"Content-Type: application/json\r\n\r\n".encode('ascii')
+                + (json.dumps(result).encode('utf-8') if result is not None else b'')
+            )
+        boundary = "batch_mock_response"
+        return Response(
+            content=encode_multipart(parts, boundary, id_prefix='response-item'),
+            media_type=f"multipart/mixed; boundary={boundary}"
+        )
+
+    # Resumable uploads: session id -> {'size', 'received', 'sha256', 'metadata'}
+    uploads: Dict[str, Dict] = {}
+
+    @app.post("/upload/gmail/v1/users/{user_id}/messages/send")
+    async def start_upload(user_id: str, request: Request):
+        session_id = uuid.uuid4().hex
+        body = await request.body()
+        uploads[session_id] = {
+            'size': int(request.headers['x-upload-content-length']),
+            'received': 0,
+            'sha256': hashlib.sha256(),
+            'metadata': json.loads(body) if body else {},
+        }
+        return Response(headers={'Location': f"{str(request.base_url).rstrip('/')}/upload/session/{session_id}"})
+
+    @app.put("/upload/session/{session_id}")
+    async def upload_chunk(session_id: str, request: Request):
+        upload = uploads.get(session_id)
+        if upload is None:
+            return JSONResponse(status_code=404, content={'error': {'code': 404, 'message': 'Upload session not found'}})
+        if gmail.latency:
+            await asyncio.sleep(gmail.latency)
+        content_range = request.headers.get('content-range', '')
+        chunk = await request.body()
+        if gmail.error_rate and chunk and gmail.random.random() < gmail.error_rate:
+            return JSONResponse(status_code=503, content={'error': {'code': 503, 'message': 'fake error'}})
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+)', content_range)
+        if match and int(match.group(1)) == upload['received']:
+            upload['sha256'].update(chunk)
+            upload['received'] += len(chunk)
+        if upload['received'] >= upload['size']:
+            sent = {'id': f"sent{len(gmail.sent) + 1:06d}", 'threadId': upload['metadata'].get('threadId', 'thrsent')}
+            gmail.sent.append(dict(upload['metadata'], size=upload['size'], sha256=upload['sha256'].hexdigest()))
+            del uploads[session_id]
+            return JSONResponse(content=sent)
+        headers = {'Range': f"bytes=0-{upload['received'] - 1}"} if upload['received'] else {}
+        return Response(status_code=308, headers=headers)
+
+    @app.api_route("/gmail/v1/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+    async def api(path: str, request: Request):
+        if gmail.latency:
+            await asyncio.sleep(gmail.latency)
+        body = await request.body()
+        status, result = dispatch(
+            gmail, request.method, f"/gmail/v1/{path}",
+            parse_qs(request.url.query), json.loads(body) if body else None
+        )
+        if result is None:
+            return Response(status_code=status)
+        return JSONResponse(status_code=status, content=result)
+
+    return app
+
+
+app = create_app()
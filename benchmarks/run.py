@@ -0,0 +1,234 @@
+"""
+Benchmark runner - drives the FastAPI app in-process against fake backends
+
+Usage:
+    python -m benchmarks.run --concurrency 1,10,50 --requests 500
+    python -m benchmarks.run --latency-ms 20 --error-rate 0.01 --body-bytes 16384
+    python -m benchmarks.run --compare bench_results/baseline.json
+
+Results are written as JSON to bench_results/ (or --output) so runs from
+different builds can be compared offline with --compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+import psutil
+
+from benchmarks.fakes import FakeGmail, fake_psutil
+
+# Endpoint scenarios: name -> (method, path, json body)
+ENDPOINTS = {
+    "health": ("GET", "/health", None),
+    "gmail_list": ("GET", "/gmail/messages?max_results=10", None),
+    "gmail_get": ("GET", "/gmail/messages/msg000007", None),
+    "gmail_send": ("POST", "/gmail/send", {"to": "bench@example.com", "subject": "Bench", "body": "hello"}),
+    "apps_list": ("GET", "/apps/list", None),
+}
+
+FAKE_APPS = ["benchapp1", "benchapp2", "benchapp3"]
+
+
+def load_app(args):
+    """Import the FastAPI app with fake Gmail and process backends installed"""
+    os.environ.setdefault('APP_CONFIG_PATH', os.path.join(tempfile.gettempdir(), 'bench_app_config.json'))
+    os.environ.setdefault('GOOGLE_TOKEN_PATH', os.path.join(tempfile.gettempdir(), 'bench_token.json'))
+    # Measure the handlers, not the per-client rate limiter
+    os.environ.setdefault('ADMISSION_ENABLED', 'false')
+
+    import main
+    import services.process_matcher as process_matcher
+
+    fake_gmail = FakeGmail(
+        message_count=args.messages,
+        body_bytes=args.body_bytes,
+        latency=args.latency_ms / 1000.0,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    gmail_service = main.get_gmail_service()
+    if args.backend == "httpx":
+        # Native async client against the mock REST server, in-process
+        from benchmarks.mock_gmail_server import create_app
+        from services.gmail_async_client import AsyncGmailClient
+
+        async def token():
+            return "bench-token"
+
+        gmail_service.use_backend(AsyncGmailClient(
+            token_provider=token,
+            base_url="http://mock-gmail",
+            transport=httpx.ASGITransport(app=create_app(fake_gmail)),
+        ))
+    else:
+        gmail_service.use_service(fake_gmail)
+
+    process_matcher.psutil = fake_psutil(args.processes, FAKE_APPS)
+    app_control = main.get_app_control_service()
+    app_control.app_configs = {
+        name: {"path": sys.executable, "type": "executable", "match": {"name": name}}
+        for name in FAKE_APPS
+    }
+    app_control._matchers.clear()
+    return main.app, fake_gmail
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(app, name: str, concurrency: int, total: int) -> Dict:
+    """Fire `total` requests at one endpoint with `concurrency` in flight"""
+    method, path, body = ENDPOINTS[name]
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        rss_before = psutil.Process().memory_info().rss
+        tracemalloc.start()
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_after = psutil.Process().memory_info().rss
+
+    latencies.sort()
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "rss_delta_kb": round((rss_after - rss_before) / 1024, 1),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict, baseline_path: str, threshold: float) -> int:
+    """Print per-scenario deltas against a baseline; return the number of regressions"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+
+    regressions = 0
+    print(f"\nComparison against {baseline_path} (rev {baseline['meta'].get('git_rev')})")
+    print(f"{'scenario':<24}{'rps':>12}{'p50':>12}{'p99':>12}")
+    for result in current["results"]:
+        key = (result["endpoint"], result["concurrency"])
+        if key not in previous:
+            continue
+        old = previous[key]
+
+        def delta(field):
+            return (result[field] - old[field]) / old[field] * 100 if old[field] else 0.0
+
+        rps, p50, p99 = delta("throughput_rps"), delta("p50_ms"), delta("p99_ms")
+        regressed = rps < -threshold or p99 > threshold
+        regressions += regressed
+        label = f"{key[0]}@{key[1]}"
+        print(f"{label:<24}{rps:>+11.1f}%{p50:>+11.1f}%{p99:>+11.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark API endpoints against fake backends")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help="Comma-separated scenarios: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,10,50", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fake Gmail latency per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake Gmail calls that fail")
+    parser.add_argument("--body-bytes", type=int, default=2048, help="Fake message body size")
+    parser.add_argument("--messages", type=int, default=200, help="Fake mailbox size")
+    parser.add_argument("--processes", type=int, default=300, help="Fake process table size")
+    parser.add_argument("--backend", choices=["discovery", "httpx"], default="discovery",
+                        help="Gmail backend: discovery client on a fake, or httpx client on the mock server")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Result file (default: bench_results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Baseline result file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Regression threshold in percent for --compare")
+    return parser.parse_args(argv)
+
+
+async def run(args) -> Dict:
+    app, fake_gmail = load_app(args)
+    results = []
+    for name in args.endpoints.split(","):
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            result = await run_scenario(app, name.strip(), concurrency, args.requests)
+            results.append(result)
+            print(f"{name:<12} c={concurrency:<4} {result['throughput_rps']:>9.1f} rps  "
+                  f"p50 {result['p50_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+                  f"errors {result['errors']}")
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_rev": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            "upstream_calls": fake_gmail.calls,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+
+    output = args.output or os.path.join(
+        "bench_results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        if compare(report, args.compare, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,17 @@
 """
 Helper script to complete Gmail authentication
-Usage: python complete_gmail_auth.py YOUR_AUTH_CODE
+Usage: python complete_gmail_auth.py YOUR_AUTH_CODE STATE
 """
 import asyncio
 import sys
 import requests
 
-async def complete_auth(code: str):
+async def complete_auth(code: str, state: str):
     """Complete Gmail authentication with the provided code"""
     try:
         response = requests.post(
             f"http://localhost:8000/gmail/auth/callback",
-            params={"code": code}
+            params={"code": code, "state": state}
         )
         
         if response.status_code == 200:
@@ -26,11 +26,11 @@ async def complete_auth(code: str):
         return False
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python complete_gmail_auth.py YOUR_AUTH_CODE")
-        print("\nTo get the authorization URL, visit: http://localhost:8000/gmail/auth/url")
+    if len(sys.argv) < 3:
+        print("Usage: python complete_gmail_auth.py YOUR_AUTH_CODE STATE")
+        print("\nTo get the authorization URL and its state, visit: http://localhost:8000/gmail/auth/url")
         sys.exit(1)
     
-    code = sys.argv[1]
-    asyncio.run(complete_auth(code))
+    code, state = sys.argv[1], sys.argv[2]
+    asyncio.run(complete_auth(code, state))
 
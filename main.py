@@ -1,18 +1,31 @@
 """
 GPT Backend - API server for Gmail management and app control
 """
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, File, Form, Header, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
+import asyncio
+import base64
+import json
+import logging
 import os
+import threading
+import time
+import uuid
+from urllib.parse import quote
 from dotenv import load_dotenv
 
-from services.gmail_service import GmailService
-from services.app_control_service import AppControlService
+from services.deadlines import DeadlineExceeded, DeadlineMiddleware
+from services.logs import get_logger, log_sampled, request_id_var, route_var, setup_logging, stats as log_stats
+from services.profiling import profiler, span
+from services.startup import startup_report
+
+startup_report.mark("main_import_started")
 
 load_dotenv()
+setup_logging()
 
 app = FastAPI(
     title="GPT Backend API",
@@ -20,7 +33,101 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# CORS middleware to allow ChatGPT/OpenAI to call this API
+# Per-request stage timings; slow requests are kept for /debug/slow
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    trace = profiler.start(request.method, request.url.path)
+    try:
+        return await call_next(request)
+    finally:
+        profiler.finish(trace)
+
+
+# Rate limits, route concurrency limits and load shedding (see services/admission.py)
+ADMISSION_EXEMPT = {'/', '/health', '/ready', '/oauth2callback'}
+_admission = None
+
+
+def get_admission_controller():
+    global _admission
+    if _admission is None:
+        from services.admission import AdmissionController
+        from services.shared_store import get_shared_store
+        _admission = AdmissionController(get_shared_store())
+    return _admission
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    if request.url.path in ADMISSION_EXEMPT or os.getenv('ADMISSION_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return await call_next(request)
+    from services.admission import Rejected
+
+    controller = get_admission_controller()
+    client = controller.client_key(
+        request.headers.get('x-api-key'),
+        request.client.host if request.client else None,
+        request.headers.get('x-forwarded-for')
+    )
+    try:
+        controller.check_rate(client)
+        async with controller.slot(request.url.path):
+            return await call_next(request)
+    except Rejected as rejected:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": rejected.reason},
+            headers={"Retry-After": str(max(1, round(rejected.retry_after)))}
+        )
+
+
+# Per-request deadlines (X-Request-Timeout or REQUEST_TIMEOUT_SECONDS); reads are
+# cancelled when the client disconnects or the deadline passes (see services/deadlines.py)
+app.add_middleware(DeadlineMiddleware)
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
+
+
+# Request ids for log correlation, plus access logs: errors and slow requests
+# always, the rest sampled at LOG_ACCESS_SAMPLE
+access_logger = get_logger('access')
+ACCESS_LOG_SAMPLE = float(os.getenv('LOG_ACCESS_SAMPLE', '0.05'))
+
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    request_id = request.headers.get('x-request-id') or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    route_var.set(f"{request.method} {request.url.path}")
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers['X-Request-ID'] = request_id
+        return response
+    finally:
+        duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        route = request.scope.get('route')
+        fields = {
+            'method': request.method,
+            'path': request.url.path,
+            'route_template': getattr(route, 'path', None),
+            'status': status,
+            'duration_ms': duration_ms,
+        }
+        if status >= 500 or duration_ms >= profiler.threshold_ms:
+            access_logger.warning("Request", extra=fields)
+        else:
+            log_sampled(access_logger, logging.INFO, ACCESS_LOG_SAMPLE, "Request", extra=fields)
+
+
+# CORS middleware to allow ChatGPT/OpenAI to call this API. Added last so it is
+# the outermost layer: preflights are answered before admission control, and
+# 429s and 504s carry CORS headers too.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # In production, specify exact origins
@@ -29,18 +136,155 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-gmail_service = GmailService()
-app_control_service = AppControlService()
+
+# Services are built on first use so the server can answer /health right away
+_gmail_service = None
+_app_control_service = None
+_mail_sync = None
+_thread_digests = None
+_mail_rules = None
+_mail_export = None
+_contacts = None
+_services_lock = threading.Lock()
+_gmail_warm_state = "pending"
+
+
+def get_gmail_service():
+    """Dependency returning the shared GmailService, constructed on first use"""
+    global _gmail_service
+    if _gmail_service is None:
+        with _services_lock, startup_report.phase("gmail_service_init"):
+            if _gmail_service is None:
+                from services.gmail_service import GmailService
+                _gmail_service = GmailService()
+    return _gmail_service
+
+
+def get_app_control_service():
+    """Dependency returning the shared AppControlService, constructed on first use"""
+    global _app_control_service
+    if _app_control_service is None:
+        with _services_lock, startup_report.phase("app_control_service_init"):
+            if _app_control_service is None:
+                from services.app_control_service import AppControlService
+                _app_control_service = AppControlService()
+    return _app_control_service
+
+
+def get_thread_digests():
+    """Dependency returning the shared ThreadDigests store"""
+    global _thread_digests
+    if _thread_digests is None:
+        with _services_lock:
+            if _thread_digests is None:
+                from services.digest import ThreadDigests
+                from services.shared_store import get_shared_store
+                _thread_digests = ThreadDigests(get_shared_store())
+    return _thread_digests
+
+
+def get_mail_rules():
+    """Dependency returning the shared MailRules engine"""
+    global _mail_rules
+    if _mail_rules is None:
+        gmail_service = get_gmail_service()
+        with _services_lock:
+            if _mail_rules is None:
+                from services.mail_rules import MailRules
+                from services.shared_store import get_shared_store
+                _mail_rules = MailRules(gmail_service, get_shared_store(), app_control=get_app_control_service)
+    return _mail_rules
+
+
+def get_contacts():
+    """Dependency returning the shared ContactIndex"""
+    global _contacts
+    if _contacts is None:
+        gmail_service = get_gmail_service()
+        with _services_lock:
+            if _contacts is None:
+                from services.contacts import ContactIndex
+                from services.shared_store import get_shared_store
+                _contacts = ContactIndex(gmail_service, get_shared_store())
+    return _contacts
+
+
+def get_mail_export():
+    """Dependency returning the shared MailExport job runner"""
+    global _mail_export
+    if _mail_export is None:
+        gmail_service = get_gmail_service()
+        with _services_lock:
+            if _mail_export is None:
+                from services.mail_export import MailExport
+                from services.shared_store import get_shared_store
+                _mail_export = MailExport(gmail_service, get_shared_store())
+    return _mail_export
+
+
+def get_mail_sync():
+    """Dependency returning the background MailSync, with digests, rules and contacts subscribed"""
+    global _mail_sync
+    if _mail_sync is None:
+        gmail_service = get_gmail_service()
+        digests = get_thread_digests()
+        rules = get_mail_rules()
+        contacts = get_contacts()
+        with _services_lock:
+            if _mail_sync is None:
+                from services.mail_sync import MailSync
+                from services.shared_store import get_shared_store
+                mail_sync = MailSync(gmail_service, get_shared_store())
+                mail_sync.add_listener(digests.on_messages)
+                mail_sync.add_listener(rules.on_messages)
+                mail_sync.add_listener(contacts.on_messages)
+                mail_sync.add_listener(gmail_service.on_messages_synced)
+                _mail_sync = mail_sync
+    return _mail_sync
+
+
+async def _warm_gmail():
+    """Build the Gmail client in the background after startup"""
+    global _gmail_warm_state
+    _gmail_warm_state = "warming"
+    gmail_service = await asyncio.to_thread(get_gmail_service)
+    with startup_report.phase("gmail_warm_up"):
+        warmed = await asyncio.to_thread(gmail_service.warm_up)
+    _gmail_warm_state = "warm" if warmed else "not_authenticated"
+    startup_report.mark("gmail_warm_finished")
+    if warmed:
+        # Exports whose worker died pick up from their last checkpoint, now and periodically
+        asyncio.create_task(get_mail_export().watch())
+    if os.getenv('MAIL_SYNC_ENABLED', 'true').lower() in ('1', 'true', 'yes'):
+        asyncio.create_task(get_mail_sync().run())
+
+
+@app.on_event("startup")
+async def schedule_warm_up():
+    # Each worker needs its own log writer thread (threads don't survive the fork)
+    setup_logging()
+    startup_report.mark("server_started")
+    asyncio.create_task(_warm_gmail())
 
 
 # Pydantic models for request/response
+class OutgoingAttachment(BaseModel):
+    filename: Optional[str] = None
+    mime_type: Optional[str] = None
+    content_base64: Optional[str] = None
+    # Or forward an attachment of an existing message
+    message_id: Optional[str] = None
+    attachment_id: Optional[str] = None
+
+
 class SendEmailRequest(BaseModel):
     to: EmailStr
     subject: str
     body: str
     cc: Optional[List[EmailStr]] = None
     bcc: Optional[List[EmailStr]] = None
+    html: Optional[str] = None
+    attachments: Optional[List[OutgoingAttachment]] = None
 
 
 class ReplyEmailRequest(BaseModel):
@@ -49,15 +293,128 @@ class ReplyEmailRequest(BaseModel):
     in_reply_to: Optional[str] = None
 
 
+class AttachmentInfo(BaseModel):
+    attachment_id: str
+    filename: str
+    mime_type: str
+    size: int
+
+
 class MessageResponse(BaseModel):
     id: str
     thread_id: str
     from_email: str
     to: List[str]
+    cc: List[str] = []
     subject: str
     body: str
     date: str
     snippet: Optional[str] = None
+    body_raw_size: Optional[int] = None  # bytes before HTML conversion and reply trimming
+    body_size: Optional[int] = None
+    label_ids: List[str] = []
+    attachments: List[AttachmentInfo] = []
+
+
+class ModifyMessagesRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    query: Optional[str] = None
+    add_label_ids: List[str] = []
+    remove_label_ids: List[str] = []
+    max_messages: Optional[int] = None
+
+
+class TrashMessagesRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    query: Optional[str] = None
+    permanent: bool = False
+    max_messages: Optional[int] = None
+
+
+class LabelStats(BaseModel):
+    id: str
+    name: str
+    type: str
+    messages_total: int
+    messages_unread: int
+    threads_total: int
+    threads_unread: int
+
+
+class LabelsResponse(BaseModel):
+    labels: List[LabelStats]
+    cached_at: float
+
+
+class BulkMutationResponse(BaseModel):
+    matched: int
+    succeeded: int
+    failed: int
+    requests: int
+    errors: List[str] = []
+
+
+class DraftRequest(BaseModel):
+    to: Optional[EmailStr] = None
+    subject: str = ""
+    body: str = ""
+    cc: Optional[List[EmailStr]] = None
+    bcc: Optional[List[EmailStr]] = None
+    html: Optional[str] = None
+    thread_id: Optional[str] = None
+
+
+class DraftUpdateRequest(BaseModel):
+    # Omitted fields keep their current value
+    to: Optional[EmailStr] = None
+    subject: Optional[str] = None
+    body: Optional[str] = None
+    cc: Optional[List[EmailStr]] = None
+    bcc: Optional[List[EmailStr]] = None
+    html: Optional[str] = None
+
+
+class DraftResponse(BaseModel):
+    id: str
+    message_id: Optional[str] = None
+    thread_id: Optional[str] = None
+    to: Optional[str] = None
+    cc: Optional[List[str]] = None
+    bcc: Optional[List[str]] = None
+    subject: str = ""
+    body: str = ""
+    html: Optional[str] = None
+    updated_at: float
+    changed: Optional[bool] = None  # create/update only: False when nothing needed sending upstream
+
+
+class RuleCondition(BaseModel):
+    field: str  # from, to, subject, body, snippet, label or attachment
+    op: str = "contains"  # contains, equals, regex or domain
+    value: str
+    negate: bool = False
+
+
+class RuleAction(BaseModel):
+    type: str  # label, remove_label, archive, mark_read, forward, notify or start_app
+    label: Optional[str] = None
+    to: Optional[EmailStr] = None
+    app: Optional[str] = None
+
+
+class RuleRequest(BaseModel):
+    name: str
+    match: str = "all"  # all or any of the conditions
+    conditions: List[RuleCondition]
+    actions: List[RuleAction]
+    enabled: bool = True
+    stop: bool = False  # skip later rules once this one matches
+
+
+class ExportRequest(BaseModel):
+    format: str = "jsonl"  # jsonl (gzip-compressed) or mbox
+    query: Optional[str] = None  # Gmail search; the whole mailbox if omitted
+    max_messages: Optional[int] = None
 
 
 class AppControlRequest(BaseModel):
@@ -72,6 +429,22 @@ class AppControlResponse(BaseModel):
     action: str
 
 
+class ProfilingConfigRequest(BaseModel):
+    enabled: Optional[bool] = None
+    threshold_ms: Optional[float] = None
+    sample_interval_ms: Optional[float] = None
+
+
+def require_admin(request: Request, x_admin_token: Optional[str] = Header(None)):
+    """Allow admin endpoints with ADMIN_TOKEN, or from localhost when no token is set"""
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if admin_token:
+        if x_admin_token != admin_token:
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+    elif request.client is None or request.client.host not in ('127.0.0.1', '::1'):
+        raise HTTPException(status_code=403, detail="Set ADMIN_TOKEN to use admin endpoints remotely")
+
+
 # Health check endpoint
 @app.get("/")
 async def root():
@@ -87,67 +460,471 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the Gmail warm-up has finished, with a startup time breakdown"""
+    is_ready = _gmail_warm_state in ("warm", "not_authenticated")
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "ready": is_ready,
+            "gmail_warmed": _gmail_warm_state == "warm",
+            "gmail": _gmail_warm_state,
+            "startup": startup_report.report()
+        }
+    )
+
+
 # Gmail endpoints
 @app.get("/gmail/messages", response_model=List[MessageResponse])
-async def get_messages(max_results: int = 10, query: Optional[str] = None):
-    """Get Gmail messages"""
+async def get_messages(max_results: int = 10, query: Optional[str] = None, allow_partial: bool = False,
+                       gmail_service=Depends(get_gmail_service)):
+    """Get Gmail messages (allow_partial: return what was fetched in time instead of a 504)"""
     try:
-        messages = await gmail_service.get_messages(max_results=max_results, query=query)
+        with span("gmail.get_messages"):
+            messages = await gmail_service.get_messages(max_results=max_results, query=query)
         return messages
+    except DeadlineExceeded as e:
+        if not allow_partial:
+            raise
+        return JSONResponse(
+            content=e.partial,
+            headers={"X-Partial-Result": "true", "X-Missing-Messages": str(e.missing)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching messages: {str(e)}")
 
 
+@app.get("/gmail/digest")
+async def get_digest(limit: int = 20, mail_sync=Depends(get_mail_sync),
+                     digests=Depends(get_thread_digests)):
+    """Compact per-thread digests of recent mail, precomputed by the background sync"""
+    try:
+        history_id = mail_sync.history_id
+        if history_id is None:
+            # Not seeded yet: start the first sync (one pass across workers) instead of waiting on it
+            mail_sync.start_pass()
+        with span("gmail.digest.load"):
+            threads = digests.list(limit=limit)
+        return {
+            "threads": threads,
+            "history_id": history_id,
+            "synced_at": mail_sync.synced_at,
+            "syncing": history_id is None
+        }
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building digest: {str(e)}")
+
+
 @app.get("/gmail/messages/{message_id}", response_model=MessageResponse)
-async def get_message(message_id: str):
+async def get_message(message_id: str, gmail_service=Depends(get_gmail_service)):
     """Get a specific Gmail message by ID"""
     try:
-        message = await gmail_service.get_message(message_id)
+        with span("gmail.get_message"):
+            message = await gmail_service.get_message(message_id)
         return message
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching message: {str(e)}")
 
 
+def _parse_range(header: Optional[str], size: int):
+    """(start, end) inclusive for a single 'bytes=' range; None for the whole file; ValueError if unsatisfiable"""
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start_text, _, end_text = header[len('bytes='):].strip().partition('-')
+    try:
+        if start_text:
+            start = int(start_text)
+            end = min(int(end_text), size - 1) if end_text else size - 1
+        else:
+            start, end = max(size - int(end_text), 0), size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+async def _file_chunks(path: str, start: int, length: int, chunk_size: int = 64 * 1024):
+    """Stream part of a file without loading it into memory"""
+    import aiofiles
+
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@app.get("/gmail/messages/{message_id}/attachments/{attachment_id}")
+async def get_attachment(message_id: str, attachment_id: str, request: Request,
+                         gmail_service=Depends(get_gmail_service)):
+    """Download an attachment (streamed from the disk cache; supports Range requests)"""
+    try:
+        with span("gmail.get_attachment"):
+            attachment = await gmail_service.get_attachment(message_id, attachment_id)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching attachment: {str(e)}")
+
+    size = attachment['size']
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{attachment["sha256"]}"',
+        'Content-Disposition': f"attachment; filename*=UTF-8''{quote(attachment['filename'])}"
+    }
+    try:
+        byte_range = _parse_range(request.headers.get('range'), size)
+    except ValueError:
+        return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+
+    start, end = byte_range or (0, size - 1)
+    headers['Content-Length'] = str(end - start + 1 if size else 0)
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return StreamingResponse(
+        _file_chunks(attachment['path'], start, end - start + 1),
+        status_code=206 if byte_range else 200,
+        media_type=attachment['mime_type'],
+        headers=headers
+    )
+
+
+def _outgoing_attachment(attachment: OutgoingAttachment) -> dict:
+    if attachment.message_id and attachment.attachment_id:
+        return attachment.model_dump(exclude={'content_base64'})
+    if attachment.content_base64 is None:
+        raise HTTPException(status_code=400, detail="Attachments need content_base64 or message_id + attachment_id")
+    try:
+        data = base64.b64decode(attachment.content_base64, validate=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 content for {attachment.filename}")
+    return {'filename': attachment.filename, 'mime_type': attachment.mime_type, 'data': data}
+
+
 @app.post("/gmail/send")
-async def send_email(request: SendEmailRequest):
-    """Send a new email"""
+async def send_email(request: SendEmailRequest, gmail_service=Depends(get_gmail_service)):
+    """Send a new email (optionally with an HTML alternative and attachments)"""
+    attachments = [_outgoing_attachment(a) for a in request.attachments or []]
     try:
-        message_id = await gmail_service.send_email(
-            to=request.to,
-            subject=request.subject,
-            body=request.body,
-            cc=request.cc,
-            bcc=request.bcc
-        )
+        with span("gmail.send_email"):
+            message_id = await gmail_service.send_email(
+                to=request.to,
+                subject=request.subject,
+                body=request.body,
+                cc=request.cc,
+                bcc=request.bcc,
+                html=request.html,
+                attachments=attachments
+            )
+        return {
+            "success": True,
+            "message": "Email sent successfully",
+            "message_id": message_id
+        }
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error sending email: {str(e)}")
+
+
+@app.post("/gmail/send/upload")
+async def send_email_upload(to: str = Form(...), subject: str = Form(...), body: str = Form(...),
+                            html: Optional[str] = Form(None), cc: Optional[str] = Form(None),
+                            bcc: Optional[str] = Form(None), files: List[UploadFile] = File([]),
+                            gmail_service=Depends(get_gmail_service)):
+    """Send an email with files uploaded as multipart/form-data (spooled to disk, never fully in memory)"""
+    try:
+        with span("gmail.send_email"):
+            message_id = await gmail_service.send_email(
+                to=to,
+                subject=subject,
+                body=body,
+                cc=[a.strip() for a in cc.split(',')] if cc else None,
+                bcc=[a.strip() for a in bcc.split(',')] if bcc else None,
+                html=html,
+                attachments=[
+                    {'filename': f.filename, 'mime_type': f.content_type, 'file': f.file}
+                    for f in files or []
+                ]
+            )
         return {
             "success": True,
             "message": "Email sent successfully",
             "message_id": message_id
         }
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error sending email: {str(e)}")
 
 
 @app.post("/gmail/reply")
-async def reply_email(request: ReplyEmailRequest):
+async def reply_email(request: ReplyEmailRequest, gmail_service=Depends(get_gmail_service)):
     """Reply to an email"""
     try:
-        message_id = await gmail_service.reply_to_email(
-            thread_id=request.thread_id,
-            body=request.body,
-            in_reply_to=request.in_reply_to
-        )
+        with span("gmail.reply_to_email"):
+            message_id = await gmail_service.reply_to_email(
+                thread_id=request.thread_id,
+                body=request.body,
+                in_reply_to=request.in_reply_to
+            )
         return {
             "success": True,
             "message": "Reply sent successfully",
             "message_id": message_id
         }
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error replying to email: {str(e)}")
 
 
+@app.get("/gmail/labels", response_model=LabelsResponse)
+async def get_labels(refresh: bool = False, gmail_service=Depends(get_gmail_service)):
+    """Every label with total/unread message and thread counts (cached; refresh=true bypasses)"""
+    try:
+        with span("gmail.get_labels"):
+            return await gmail_service.get_labels(refresh=refresh)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching labels: {str(e)}")
+
+
+def _require_targets(ids: Optional[List[str]], query: Optional[str]):
+    if not ids and not (query and query.strip()):
+        raise HTTPException(status_code=400, detail="Provide message ids, a query, or both")
+
+
+@app.post("/gmail/messages/modify", response_model=BulkMutationResponse)
+async def modify_messages(request: ModifyMessagesRequest, gmail_service=Depends(get_gmail_service)):
+    """Add/remove labels (ids or names) on many messages at once (e.g. remove UNREAD to mark read, INBOX to archive)"""
+    _require_targets(request.ids, request.query)
+    if not request.add_label_ids and not request.remove_label_ids:
+        raise HTTPException(status_code=400, detail="Provide add_label_ids or remove_label_ids")
+    try:
+        with span("gmail.modify_messages"):
+            return await gmail_service.modify_messages(
+                ids=request.ids,
+                query=request.query,
+                add_label_ids=request.add_label_ids,
+                remove_label_ids=request.remove_label_ids,
+                max_messages=request.max_messages
+            )
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error modifying messages: {str(e)}")
+
+
+@app.post("/gmail/messages/trash", response_model=BulkMutationResponse)
+async def trash_messages(request: TrashMessagesRequest, gmail_service=Depends(get_gmail_service)):
+    """Move many messages to the trash (or delete them permanently)"""
+    _require_targets(request.ids, request.query)
+    try:
+        with span("gmail.trash_messages"):
+            return await gmail_service.trash_messages(
+                ids=request.ids,
+                query=request.query,
+                permanent=request.permanent,
+                max_messages=request.max_messages
+            )
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error trashing messages: {str(e)}")
+
+
+@app.post("/gmail/drafts", response_model=DraftResponse)
+async def create_draft(request: DraftRequest, gmail_service=Depends(get_gmail_service)):
+    """Create a draft"""
+    try:
+        with span("gmail.create_draft"):
+            return await gmail_service.create_draft(**request.model_dump())
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating draft: {str(e)}")
+
+
+@app.get("/gmail/drafts", response_model=List[DraftResponse])
+async def list_drafts(refresh: bool = False, gmail_service=Depends(get_gmail_service)):
+    """Drafts, newest first (synced with Gmail every GMAIL_DRAFTS_TTL seconds; refresh=true syncs now)"""
+    try:
+        with span("gmail.list_drafts"):
+            return await gmail_service.list_drafts(refresh=refresh)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching drafts: {str(e)}")
+
+
+@app.patch("/gmail/drafts/{draft_id}", response_model=DraftResponse)
+async def update_draft(draft_id: str, request: DraftUpdateRequest, gmail_service=Depends(get_gmail_service)):
+    """Edit a draft; Gmail is only called if the content actually changed"""
+    try:
+        with span("gmail.update_draft"):
+            return await gmail_service.update_draft(draft_id, **request.model_dump())
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Draft {draft_id} not found")
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating draft: {str(e)}")
+
+
+@app.post("/gmail/drafts/{draft_id}/send")
+async def send_draft(draft_id: str, gmail_service=Depends(get_gmail_service)):
+    """Send a draft as it is"""
+    try:
+        with span("gmail.send_draft"):
+            message_id = await gmail_service.send_draft(draft_id)
+        return {
+            "success": True,
+            "message": "Draft sent successfully",
+            "message_id": message_id
+        }
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Draft {draft_id} not found")
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error sending draft: {str(e)}")
+
+
+@app.delete("/gmail/drafts/{draft_id}")
+async def delete_draft(draft_id: str, gmail_service=Depends(get_gmail_service)):
+    """Delete a draft"""
+    try:
+        with span("gmail.delete_draft"):
+            await gmail_service.delete_draft(draft_id)
+        return {"success": True, "message": "Draft deleted"}
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting draft: {str(e)}")
+
+
+@app.get("/gmail/rules")
+async def list_rules(mail_rules=Depends(get_mail_rules)):
+    """Mail rules run over newly arriving messages"""
+    return {"rules": mail_rules.list()}
+
+
+@app.post("/gmail/rules")
+async def create_rule(request: RuleRequest, mail_rules=Depends(get_mail_rules)):
+    """Add a rule: when new mail matches the conditions, run the actions"""
+    try:
+        return await mail_rules.add(request.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving rule: {str(e)}")
+
+
+@app.delete("/gmail/rules/{rule_id}")
+async def delete_rule(rule_id: str, mail_rules=Depends(get_mail_rules)):
+    """Delete a rule"""
+    if not mail_rules.remove(rule_id):
+        raise HTTPException(status_code=404, detail=f"Rule {rule_id} not found")
+    return {"success": True, "message": "Rule deleted"}
+
+
+@app.get("/gmail/rules/notifications")
+async def rule_notifications(since: Optional[float] = None, mail_rules=Depends(get_mail_rules)):
+    """Messages flagged by rules with a notify action (since: only those after this timestamp)"""
+    return {"notifications": mail_rules.notifications(since)}
+
+
+@app.get("/gmail/contacts")
+async def search_contacts(prefix: str = "", limit: int = 10, contacts=Depends(get_contacts)):
+    """People you correspond with whose name, address or domain starts with prefix, most frequent and recent first"""
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    try:
+        # Rebuilding the index after mail arrives can take a while; keep it off the event loop
+        with span("gmail.contacts.refresh"):
+            await asyncio.to_thread(contacts.refresh)
+        with span("gmail.contacts.search"):
+            return {"contacts": contacts.search(prefix, limit)}
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching contacts: {str(e)}")
+
+
+@app.post("/gmail/export")
+async def start_export(request: ExportRequest, mail_export=Depends(get_mail_export)):
+    """Start exporting a mailbox (or a search) to a file in the background"""
+    try:
+        return mail_export.start(request.format, request.query, request.max_messages)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting export: {str(e)}")
+
+
+@app.get("/gmail/export")
+async def list_exports(mail_export=Depends(get_mail_export)):
+    """All export jobs, newest first"""
+    return {"exports": mail_export.list()}
+
+
+@app.get("/gmail/export/{export_id}")
+async def export_status(export_id: str, mail_export=Depends(get_mail_export)):
+    """Progress and throughput of an export"""
+    job = mail_export.get(export_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Export {export_id} not found")
+    return job
+
+
+@app.post("/gmail/export/{export_id}/resume")
+async def resume_export(export_id: str, mail_export=Depends(get_mail_export)):
+    """Continue a failed or interrupted export from its last checkpoint"""
+    try:
+        return mail_export.resume(export_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Export {export_id} not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.delete("/gmail/export/{export_id}")
+async def cancel_export(export_id: str, mail_export=Depends(get_mail_export)):
+    """Stop an export after the page it is on"""
+    if not mail_export.cancel(export_id):
+        raise HTTPException(status_code=404, detail=f"Export {export_id} not found")
+    return {"success": True, "message": "Export cancelled"}
+
+
+@app.get("/gmail/export/{export_id}/download")
+async def download_export(export_id: str, mail_export=Depends(get_mail_export)):
+    """The exported file, once the export is done"""
+    job = mail_export.get(export_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Export {export_id} not found")
+    if job['status'] != 'done':
+        raise HTTPException(status_code=409, detail=f"Export {export_id} is {job['status']}")
+    media_type = 'application/mbox' if job['format'] == 'mbox' else 'application/gzip'
+    return FileResponse(job['path'], media_type=media_type, filename=os.path.basename(job['path']))
+
+
 @app.get("/gmail/auth/status")
-async def auth_status():
+async def auth_status(gmail_service=Depends(get_gmail_service)):
     """Check Gmail authentication status"""
     try:
         is_authenticated = await gmail_service.is_authenticated()
@@ -160,33 +937,37 @@ async def auth_status():
 
 
 @app.get("/gmail/auth/url")
-async def get_auth_url():
+async def get_auth_url(gmail_service=Depends(get_gmail_service)):
     """Get Gmail OAuth authorization URL"""
     try:
-        auth_url = await gmail_service.get_authorization_url()
+        auth_url, state = await gmail_service.get_authorization_url()
         return {
             "auth_url": auth_url,
-            "message": "Visit this URL to authorize Gmail access"
+            "state": state,
+            "message": "Visit this URL to authorize Gmail access, then send the code with this state"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating auth URL: {str(e)}")
 
 
 @app.post("/gmail/auth/callback")
-async def auth_callback(code: str, redirect_uri: Optional[str] = None):
-    """Handle OAuth callback and store credentials"""
+async def auth_callback(code: str, state: str, gmail_service=Depends(get_gmail_service)):
+    """Handle OAuth callback and store credentials (state as returned by /gmail/auth/url)"""
     try:
-        await gmail_service.handle_oauth_callback(code, redirect_uri)
+        await gmail_service.handle_oauth_callback(code, state)
         return {
             "success": True,
             "message": "Gmail authentication successful"
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error handling auth callback: {str(e)}")
 
 
 @app.get("/oauth2callback")
-async def oauth2_callback(code: Optional[str] = None, error: Optional[str] = None):
+async def oauth2_callback(code: Optional[str] = None, error: Optional[str] = None,
+                          state: Optional[str] = None, gmail_service=Depends(get_gmail_service)):
     """OAuth2 callback endpoint for web applications"""
     if error:
         return {
@@ -233,10 +1014,8 @@ async def oauth2_callback(code: Optional[str] = None, error: Optional[str] = Non
         return HTMLResponse(content=html_content)
     
     try:
-        # Use Railway URL for redirect
-        railway_url = os.getenv('RAILWAY_PUBLIC_DOMAIN', 'https://web-production-5b9f.up.railway.app')
-        redirect_uri = f"{railway_url}/oauth2callback"
-        await gmail_service.handle_oauth_callback(code, redirect_uri=redirect_uri)
+        # The redirect URI and PKCE verifier come from the flow started at /gmail/auth/url
+        await gmail_service.handle_oauth_callback(code, state)
         html_success = """
         <!DOCTYPE html>
         <html>
@@ -279,18 +1058,20 @@ async def oauth2_callback(code: Optional[str] = None, error: Optional[str] = Non
         </body>
         </html>
         """
-        return HTMLResponse(content=html_error, status_code=500)
+        return HTMLResponse(content=html_error, status_code=400 if isinstance(e, ValueError) else 500)
 
 
 # App control endpoints
 @app.post("/apps/control", response_model=AppControlResponse)
-async def control_app(request: AppControlRequest):
+async def control_app(request: AppControlRequest, app_control_service=Depends(get_app_control_service)):
     """Start or stop an application"""
     try:
         if request.action.lower() == "start":
-            result = await app_control_service.start_app(request.app_name)
+            with span("apps.start_app"):
+                result = await app_control_service.start_app(request.app_name)
         elif request.action.lower() == "stop":
-            result = await app_control_service.stop_app(request.app_name)
+            with span("apps.stop_app"):
+                result = await app_control_service.stop_app(request.app_name)
         else:
             raise HTTPException(status_code=400, detail="Action must be 'start' or 'stop'")
         
@@ -305,10 +1086,11 @@ async def control_app(request: AppControlRequest):
 
 
 @app.get("/apps/list")
-async def list_apps():
+async def list_apps(app_control_service=Depends(get_app_control_service)):
     """List available apps that can be controlled"""
     try:
-        apps = await app_control_service.list_available_apps()
+        with span("apps.list_available_apps"):
+            apps = await app_control_service.list_available_apps()
         return {
             "apps": apps,
             "message": "Available apps for control"
@@ -317,7 +1099,85 @@ async def list_apps():
         raise HTTPException(status_code=500, detail=f"Error listing apps: {str(e)}")
 
 
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+
+
+@app.get("/apps/events")
+async def app_events(request: Request, last_event_id: Optional[int] = None,
+                     app_control_service=Depends(get_app_control_service)):
+    """Server-sent events when apps start, exit or crash (with exit codes and timings)"""
+    header_id = request.headers.get('last-event-id')
+    if last_event_id is None and header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+    events = app_control_service.events
+
+    async def stream():
+        with events.subscribe(last_event_id) as queue:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line; keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Admin endpoints
+@app.get("/debug/slow", dependencies=[Depends(require_admin)])
+async def get_slow_requests():
+    """List sampled slow requests with stage timings and stack profiles"""
+    return profiler.snapshot()
+
+
+@app.put("/debug/slow", dependencies=[Depends(require_admin)])
+async def configure_slow_requests(request: ProfilingConfigRequest):
+    """Enable/disable request profiling or change its threshold at runtime"""
+    profiler.configure(
+        enabled=request.enabled,
+        threshold_ms=request.threshold_ms,
+        sample_interval_ms=request.sample_interval_ms
+    )
+    return profiler.snapshot()
+
+
+@app.delete("/debug/slow", dependencies=[Depends(require_admin)])
+async def clear_slow_requests():
+    """Clear the slow request ring"""
+    profiler.clear()
+    return {"success": True}
+
+
+@app.get("/debug/cache", dependencies=[Depends(require_admin)])
+async def get_cache_stats(gmail_service=Depends(get_gmail_service)):
+    """Hot message cache size, budget and hit/miss/eviction counters (this worker)"""
+    return gmail_service.message_cache.stats()
+
+
+@app.delete("/debug/cache", dependencies=[Depends(require_admin)])
+async def clear_cache(gmail_service=Depends(get_gmail_service)):
+    """Empty the hot message cache"""
+    gmail_service.message_cache.clear()
+    return {"success": True}
+
+
+@app.get("/debug/logs", dependencies=[Depends(require_admin)])
+async def get_log_stats():
+    """Log record counts by level and logger, and records dropped by rate limits"""
+    return log_stats.snapshot()
+
+
+startup_report.mark("main_imported")
+
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    from serve import main
+    main()
 
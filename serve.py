@@ -0,0 +1,114 @@
+"""
+Production server - multi-worker launcher with app preloading
+
+Runs gunicorn with uvicorn workers (uvloop + httptools) when available and
+falls back to uvicorn's own process manager elsewhere (e.g. Windows).
+Use run.py for local development with auto-reload.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def worker_count() -> int:
+    """Workers from WEB_CONCURRENCY, else one per CPU available to this process"""
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.getenv("WEB_CONCURRENCY")))
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(1, min(cpus, int(os.getenv("MAX_WORKERS", "8"))))
+
+
+def _fast_loop_and_http():
+    """Prefer uvloop/httptools, falling back to asyncio/h11 when not installed"""
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "h11"
+    return loop, http
+
+
+try:
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+
+    class FastUvicornWorker(UvicornWorker):
+        """Uvicorn worker pinned to uvloop/httptools with tuned keep-alive"""
+        _loop, _http = _fast_loop_and_http()
+        CONFIG_KWARGS = {
+            "loop": _loop,
+            "http": _http,
+            "timeout_keep_alive": int(os.getenv("KEEPALIVE", "5")),
+        }
+
+    class ProductionApplication(BaseApplication):
+        def __init__(self, app_uri: str, options: dict):
+            self.app_uri = app_uri
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # With preload_app this runs once in the master, before forking
+            from main import app
+            return app
+except ImportError:
+    BaseApplication = None
+
+
+def main():
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", 8000))
+    workers = worker_count()
+    backlog = int(os.getenv("BACKLOG", "2048"))
+    keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+    # Several workers share one host: coordinate caches through the local shared store
+    if workers > 1:
+        os.environ.setdefault("GMAIL_SHARED_CACHE", "true")
+
+    print(f"Starting production server on http://{host}:{port} with {workers} worker(s)")
+
+    if BaseApplication is not None:
+        ProductionApplication("main:app", {
+            "bind": f"{host}:{port}",
+            "workers": workers,
+            "worker_class": "serve.FastUvicornWorker",
+            "preload_app": True,
+            "backlog": backlog,
+            "keepalive": keepalive,
+            "timeout": int(os.getenv("WORKER_TIMEOUT", "60")),
+            "graceful_timeout": int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+            "max_requests": int(os.getenv("MAX_REQUESTS", "0")),
+            "max_requests_jitter": int(os.getenv("MAX_REQUESTS_JITTER", "0")),
+            "accesslog": "-",
+        }).run()
+    else:
+        import uvicorn
+        loop, http = _fast_loop_and_http()
+        uvicorn.run(
+            "main:app",
+            host=host,
+            port=port,
+            workers=workers,
+            loop=loop,
+            http=http,
+            backlog=backlog,
+            timeout_keep_alive=keepalive,
+        )
+
+
+if __name__ == "__main__":
+    main()
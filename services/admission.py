@@ -0,0 +1,188 @@
+"""
+Admission Control - Per-client rate limits, per-route concurrency and load shedding
+"""
+import asyncio
+import contextvars
+import hashlib
+import os
+import time
+from contextlib import asynccontextmanager
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from services.logs import get_logger, log_limited
+
+logger = get_logger('admission')
+
+
+class Rejected(Exception):
+    """A request turned away; retry_after is the suggested wait in seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _key_id(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+def _parse_route_limits(spec: str) -> List[Tuple[str, int]]:
+    """'/gmail/send=2,/gmail/=16' -> [('/gmail/send', 2), ('/gmail/', 16)], longest prefix first"""
+    limits = []
+    for item in spec.split(','):
+        prefix, _, limit = item.strip().partition('=')
+        if prefix and limit:
+            limits.append((prefix, int(limit)))
+    return sorted(limits, key=lambda entry: len(entry[0]), reverse=True)
+
+
+class AdmissionController:
+    """
+    Decides whether a request may run.
+
+    1. Token bucket per client: `rate` requests per second sustained,
+       `burst` at once. A client is its API key when the key is one of
+       API_KEYS, else its IP (taken from X-Forwarded-For when there are
+       TRUSTED_PROXY_HOPS proxies in front). Unknown keys count as the IP,
+       so inventing keys doesn't buy more requests.
+
+       Each worker checks its own in-memory buckets, so admitting a request
+       never waits on the store. Every `sync_interval` seconds a background
+       task adds the tokens the worker spent to the client's bucket in the
+       shared store (in a thread) and takes back what is left after all
+       workers' spending. A worker can run ahead of the others by what it
+       admits between two syncs (at most a burst for a client new to it);
+       the excess is owed back from the shared bucket, so the sustained
+       rate holds across workers.
+    2. Concurrency limit per route prefix, per worker process.
+    3. Load shedding: a request that waits longer than `queue_target`
+       seconds for a route slot is rejected instead of queueing further.
+    """
+
+    def __init__(self, store, rate_per_minute: Optional[float] = None, burst: Optional[int] = None,
+                 route_limits: Optional[str] = None, default_concurrency: Optional[int] = None,
+                 queue_target_ms: Optional[float] = None, api_keys: Optional[str] = None,
+                 trusted_proxy_hops: Optional[int] = None, sync_interval: Optional[float] = None):
+        self.store = store
+        self.rate = (rate_per_minute or float(os.getenv('RATE_LIMIT_PER_MINUTE', '120'))) / 60.0
+        self.burst = burst or int(os.getenv('RATE_LIMIT_BURST', '30'))
+        self.route_limits = _parse_route_limits(
+            route_limits or os.getenv('ADMISSION_ROUTE_LIMITS', '/gmail/send=4,/gmail/reply=4,/gmail/=16,/apps/=4')
+        )
+        self.default_concurrency = default_concurrency or int(os.getenv('ADMISSION_MAX_CONCURRENCY', '64'))
+        self.queue_target = (queue_target_ms or float(os.getenv('ADMISSION_QUEUE_TARGET_MS', '500'))) / 1000.0
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        keys = api_keys if api_keys is not None else os.getenv('API_KEYS', '')
+        self._api_keys = {_key_id(key.strip()) for key in keys.split(',') if key.strip()}
+        self.trusted_proxy_hops = (trusted_proxy_hops if trusted_proxy_hops is not None
+                                   else int(os.getenv('TRUSTED_PROXY_HOPS', '0')))
+        self.sync_interval = sync_interval or float(os.getenv('RATE_LIMIT_SYNC_SECONDS', '1'))
+        # client -> [tokens, updated]; spent tokens not yet added to the shared bucket
+        self._buckets: Dict[str, list] = {}
+        self._spent: Dict[str, int] = {}
+        self._sync_task: Optional[asyncio.Task] = None
+
+    def client_key(self, api_key: Optional[str], client_host: Optional[str],
+                   forwarded_for: Optional[str] = None) -> str:
+        if api_key:
+            key_id = _key_id(api_key)
+            if key_id in self._api_keys:
+                return 'key:' + key_id
+        return f"ip:{self.client_ip(client_host, forwarded_for) or 'unknown'}"
+
+    def client_ip(self, client_host: Optional[str], forwarded_for: Optional[str]) -> Optional[str]:
+        """
+        The caller's address. Each trusted proxy appends the address it got
+        the request from to X-Forwarded-For, so the one added by the
+        outermost trusted proxy is `trusted_proxy_hops` from the end;
+        anything before it was sent by the client and can't be trusted.
+        """
+        hops = self.trusted_proxy_hops
+        if hops <= 0 or not forwarded_for:
+            return client_host
+        addresses = [address.strip() for address in forwarded_for.split(',') if address.strip()]
+        return addresses[-hops] if len(addresses) >= hops else (addresses[0] if addresses else client_host)
+
+    def check_rate(self, client: str):
+        """Take one token from the client's bucket (in memory) or raise Rejected"""
+        self._start_sync()
+        now = time.time()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [float(self.burst), now]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            raise Rejected("Rate limit exceeded", (1 - bucket[0]) / self.rate)
+        bucket[0] -= 1
+        self._spent[client] = self._spent.get(client, 0) + 1
+
+    def _start_sync(self):
+        if self._sync_task is None or self._sync_task.done():
+            # A fresh context, so the loop doesn't carry the first request's ids and deadline
+            self._sync_task = asyncio.get_running_loop().create_task(
+                self._sync_loop(), context=contextvars.Context()
+            )
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            spent, self._spent = self._spent, {}
+            if spent:
+                try:
+                    shared = await asyncio.to_thread(self._sync_shared, spent)
+                except Exception as e:
+                    # Fail open: a busy or broken store leaves each worker with its own limit
+                    log_limited(logger, logging.WARNING, 'rate-limiter', "Rate limiter unavailable: %s", e)
+                    shared = {}
+                now = time.time()
+                for client, tokens in shared.items():
+                    # Spending since the snapshot is already in the local bucket but not in the shared one
+                    self._buckets[client] = [tokens - self._spent.get(client, 0), now]
+            self._forget_idle()
+
+    def _sync_shared(self, spent: Dict[str, int]) -> Dict[str, float]:
+        """Add each client's spending to its shared bucket; return the tokens left (blocking)"""
+        rate, burst = self.rate, self.burst
+        shared = {}
+        for client, count in spent.items():
+            def take(bucket, count=count):
+                now = time.time()
+                tokens, updated = (bucket['tokens'], bucket['updated']) if bucket else (burst, now)
+                # Over-spending between syncs is owed back, up to one burst
+                tokens = max(-burst, min(burst, tokens + (now - updated) * rate) - count)
+                return {'tokens': tokens, 'updated': now}, tokens
+            # Idle buckets refill completely, so they can expire once full again
+            shared[client] = self.store.update(f"rate:{client}", take, ttl=2 * burst / rate + 1)
+        return shared
+
+    def _forget_idle(self):
+        """Drop local buckets that have refilled, so memory follows the active clients"""
+        full_after = self.burst / self.rate
+        now = time.time()
+        for client in [client for client, (tokens, updated) in self._buckets.items()
+                       if client not in self._spent and now - updated > full_after]:
+            del self._buckets[client]
+
+    def _semaphore(self, path: str) -> asyncio.Semaphore:
+        prefix, limit = next(((p, l) for p, l in self.route_limits if path.startswith(p)),
+                             ('*', self.default_concurrency))
+        semaphore = self._semaphores.get(prefix)
+        if semaphore is None:
+            semaphore = self._semaphores[prefix] = asyncio.Semaphore(limit)
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self, path: str):
+        """Hold a concurrency slot for the route; shed the request if the wait passes the target"""
+        semaphore = self._semaphore(path)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_target)
+        except asyncio.TimeoutError:
+            raise Rejected("Server busy, try again shortly", max(1.0, self.queue_target * 2))
+        try:
+            yield
+        finally:
+            semaphore.release()
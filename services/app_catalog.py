@@ -0,0 +1,208 @@
+"""
+App Catalog - Platform-aware default apps and cached executable resolution
+"""
+import os
+import sys
+import shlex
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Default app configurations per platform
+WINDOWS_APPS = {
+    "notepad": {
+        "path": "notepad.exe",
+        "type": "executable"
+    },
+    "calculator": {
+        "path": "calc.exe",
+        "type": "executable"
+    },
+    "chrome": {
+        "path": "C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
+        "type": "executable"
+    },
+    "firefox": {
+        "path": "C:\\Program Files\\Mozilla Firefox\\firefox.exe",
+        "type": "executable"
+    },
+    "vscode": {
+        "path": "code",
+        "type": "command"
+    }
+}
+
+LINUX_APPS = {
+    "notepad": {
+        "path": "gedit",
+        "candidates": ["gnome-text-editor", "gedit", "kate", "mousepad", "xed"],
+        "type": "executable"
+    },
+    "calculator": {
+        "path": "gnome-calculator",
+        "candidates": ["gnome-calculator", "kcalc", "galculator", "mate-calc"],
+        "type": "executable"
+    },
+    "chrome": {
+        "path": "google-chrome",
+        "candidates": ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser"],
+        "type": "executable",
+        # The launchers are scripts (or snap wrappers) that exec the browser binary
+        "match": {"name": ["chrome", "chromium", "chromium-browser"]}
+    },
+    "firefox": {
+        "path": "firefox",
+        "type": "executable",
+        # /usr/bin/firefox may be a script or the snap wrapper; the browser runs as one of these
+        "match": {"name": ["firefox", "firefox-bin", "firefox-esr"]}
+    },
+    "vscode": {
+        "path": "code",
+        "type": "command",
+        "match": {"name": ["code", "code-oss", "codium"]}
+    }
+}
+
+MACOS_APPS = {
+    "notepad": {
+        "path": "/System/Applications/TextEdit.app/Contents/MacOS/TextEdit",
+        "type": "executable"
+    },
+    "calculator": {
+        "path": "/System/Applications/Calculator.app/Contents/MacOS/Calculator",
+        "type": "executable"
+    },
+    "chrome": {
+        "path": "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+        "type": "executable"
+    },
+    "firefox": {
+        "path": "/Applications/Firefox.app/Contents/MacOS/firefox",
+        "type": "executable"
+    },
+    "vscode": {
+        "path": "code",
+        "type": "command"
+    }
+}
+
+# Where freedesktop .desktop launchers live, in lookup order
+DESKTOP_DIRS = [
+    os.path.expanduser("~/.local/share/applications"),
+    "/usr/local/share/applications",
+    "/usr/share/applications",
+    "/var/lib/flatpak/exports/share/applications",
+    "/var/lib/snapd/desktop/applications",
+]
+
+
+def default_apps(platform: Optional[str] = None) -> Dict:
+    """Return the default app catalogue for the given (or current) platform"""
+    platform = platform or sys.platform
+    if platform.startswith("win"):
+        return WINDOWS_APPS
+    if platform == "darwin":
+        return MACOS_APPS
+    return LINUX_APPS
+
+
+def _desktop_exec(desktop_file: str) -> Optional[str]:
+    """Read the Exec= command from a .desktop file, without field codes"""
+    try:
+        with open(desktop_file, 'r', encoding='utf-8', errors='ignore') as f:
+            in_entry = False
+            for line in f:
+                line = line.strip()
+                if line.startswith('['):
+                    in_entry = line == '[Desktop Entry]'
+                elif in_entry and line.startswith('Exec='):
+                    args = [a for a in shlex.split(line[5:]) if not a.startswith('%')]
+                    return args[0] if args else None
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class AppResolver:
+    """
+    Resolves configured app paths to executables once and caches the result.
+
+    The cache is invalidated when PATH changes, when one of the .desktop
+    directories is modified, or explicitly via invalidate().
+    """
+
+    def __init__(self, desktop_dirs: Optional[List[str]] = None):
+        self.desktop_dirs = desktop_dirs if desktop_dirs is not None else DESKTOP_DIRS
+        self._cache: Dict[str, Optional[str]] = {}
+        self._fingerprint = None
+        self._lock = threading.Lock()
+
+    def _current_fingerprint(self) -> Tuple:
+        mtimes = []
+        for directory in self.desktop_dirs:
+            try:
+                mtimes.append(os.stat(directory).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return (os.environ.get('PATH', ''), tuple(mtimes))
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop cached resolutions (all of them, or a single app)"""
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+
+    def resolve(self, name: str, config: Dict) -> Optional[str]:
+        """Return the executable for an app config, or None if unresolvable"""
+        with self._lock:
+            fingerprint = self._current_fingerprint()
+            if fingerprint != self._fingerprint:
+                self._cache.clear()
+                self._fingerprint = fingerprint
+            if name in self._cache:
+                return self._cache[name]
+
+        resolved = self._resolve_uncached(name, config)
+        with self._lock:
+            self._cache[name] = resolved
+        return resolved
+
+    def _resolve_uncached(self, name: str, config: Dict) -> Optional[str]:
+        candidates = list(config.get("candidates") or [])
+        path = config.get("path", "")
+        if path and path not in candidates:
+            candidates.insert(0, path)
+
+        for candidate in candidates:
+            # "command" entries may carry arguments; only the program matters here
+            program = candidate
+            if config.get("type") == "command":
+                try:
+                    program = shlex.split(candidate, posix=os.name != 'nt')[0]
+                except (ValueError, IndexError):
+                    continue
+            if os.path.isabs(program):
+                if os.path.isfile(program) and os.access(program, os.X_OK):
+                    return program
+                continue
+            found = shutil.which(program)
+            if found:
+                return found
+
+        return self._resolve_desktop_entry(config.get("desktop") or name)
+
+    def _resolve_desktop_entry(self, desktop_name: str) -> Optional[str]:
+        filename = desktop_name if desktop_name.endswith('.desktop') else f"{desktop_name}.desktop"
+        for directory in self.desktop_dirs:
+            desktop_file = os.path.join(directory, filename)
+            if not os.path.isfile(desktop_file):
+                continue
+            program = _desktop_exec(desktop_file)
+            if not program:
+                continue
+            found = program if os.path.isabs(program) else shutil.which(program)
+            if found and os.path.isfile(found):
+                return found
+        return None
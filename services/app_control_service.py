@@ -4,39 +4,34 @@ App Control Service - Handles starting and stopping applications
 import os
 import subprocess
 import asyncio
-import psutil
-from typing import Dict, List
+import time
+from typing import Dict, List, Optional, Set
 import json
 
-# Default app configurations
-DEFAULT_APPS = {
-    "notepad": {
-        "path": "notepad.exe",
-        "type": "executable"
-    },
-    "calculator": {
-        "path": "calc.exe",
-        "type": "executable"
-    },
-    "chrome": {
-        "path": "C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
-        "type": "executable"
-    },
-    "firefox": {
-        "path": "C:\\Program Files\\Mozilla Firefox\\firefox.exe",
-        "type": "executable"
-    },
-    "vscode": {
-        "path": "code",
-        "type": "command"
-    }
-}
+from services.app_catalog import AppResolver, default_apps
+from services.app_events import AppEvents
+from services.logs import get_logger
+from services.process_matcher import PROCESS_ERRORS, ProcessMatcher, ProcessSnapshot
+from services.profiling import span
+
+# Default app configurations for the current platform
+DEFAULT_APPS = default_apps()
+
+logger = get_logger('apps')
 
 
 class AppControlService:
     def __init__(self):
         self.config_path = os.getenv('APP_CONFIG_PATH', 'app_config.json')
         self.app_configs = self._load_config()
+        self.resolver = AppResolver()
+        # Process table snapshots are shared by all checks within this window
+        self.snapshot_ttl = float(os.getenv('APP_SNAPSHOT_TTL', '1.0'))
+        self._snapshot = None
+        # Bumped whenever the snapshot is dropped, so an older scan doesn't put it back
+        self._snapshot_epoch = 0
+        self._matchers = {}
+        self.events = AppEvents(self._scan_running)
 
     def _load_config(self) -> Dict:
         """Load app configurations from file or use defaults"""
@@ -48,18 +43,18 @@ class AppControlService:
                     merged = DEFAULT_APPS.copy()
                     merged.update(config)
                     return merged
-            except Exception as e:
-                print(f"Error loading app config: {e}")
-                return DEFAULT_APPS
-        return DEFAULT_APPS
+            except Exception:
+                logger.exception("Error loading app config", extra={'path': self.config_path})
+                return DEFAULT_APPS.copy()
+        return DEFAULT_APPS.copy()
 
     def _save_config(self):
         """Save app configurations to file"""
         try:
             with open(self.config_path, 'w') as f:
                 json.dump(self.app_configs, f, indent=2)
-        except Exception as e:
-            print(f"Error saving app config: {e}")
+        except Exception:
+            logger.exception("Error saving app config", extra={'path': self.config_path})
 
     async def start_app(self, app_name: str) -> Dict[str, any]:
         """Start an application"""
@@ -80,34 +75,44 @@ class AppControlService:
                 "message": f"App '{app_name}' not found in configuration. Use /apps/list to see available apps."
             }
         
+        # Fail fast without forking when the executable can't be found
+        executable = self.resolver.resolve(app_name_lower, app_config)
+        if not executable:
+            return {
+                "success": False,
+                "message": f"Application not found at path: {app_config['path']}"
+            }
+
+        # Output is discarded: nobody reads it, and a full pipe would stall the app
+        streams = dict(
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
         try:
+            spawn_started = time.perf_counter()
             if app_config["type"] == "executable":
                 # Start executable
-                process = await asyncio.create_subprocess_exec(
-                    app_config["path"],
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
+                process = await asyncio.create_subprocess_exec(executable, **streams)
             elif app_config["type"] == "command":
                 # Start command (like 'code' for VS Code)
-                process = await asyncio.create_subprocess_shell(
-                    app_config["path"],
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
+                process = await asyncio.create_subprocess_shell(app_config["path"], **streams)
             else:
                 return {
                     "success": False,
                     "message": f"Unknown app type: {app_config['type']}"
                 }
             
-            # Don't wait for process to finish
+            # Don't wait for process to finish; the event hub awaits its exit
+            self.events.track(app_name_lower, process, (time.perf_counter() - spawn_started) * 1000)
+            self._invalidate_snapshot()
             return {
                 "success": True,
                 "message": f"{app_name} started successfully",
                 "pid": process.pid
             }
         except FileNotFoundError:
+            self.resolver.invalidate(app_name_lower)
             return {
                 "success": False,
                 "message": f"Application not found at path: {app_config['path']}"
@@ -122,13 +127,6 @@ class AppControlService:
         """Stop an application"""
         app_name_lower = app_name.lower()
         
-        # Check if app is running
-        if not await self._is_app_running(app_name_lower):
-            return {
-                "success": True,
-                "message": f"{app_name} is not running"
-            }
-        
         # Get app configuration
         app_config = self.app_configs.get(app_name_lower)
         if not app_config:
@@ -138,17 +136,25 @@ class AppControlService:
             }
         
         try:
-            # Find and kill processes
-            killed_count = 0
-            process_name = os.path.basename(app_config["path"]).lower()
+            # Always act on a fresh snapshot so we never kill a recycled pid
+            snapshot = self._get_snapshot(max_age=0)
+            processes = self._get_matcher(app_name_lower).find(snapshot)
+            if not processes:
+                return {
+                    "success": True,
+                    "message": f"{app_name} is not running"
+                }
             
-            for proc in psutil.process_iter(['pid', 'name']):
+            # Kill matched processes
+            self.events.stopping(app_name_lower)
+            killed_count = 0
+            for proc in processes:
                 try:
-                    if proc.info['name'] and process_name in proc.info['name'].lower():
-                        proc.kill()
-                        killed_count += 1
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                    proc.kill()
+                    killed_count += 1
+                except PROCESS_ERRORS:
                     pass
+            self._invalidate_snapshot()
             
             if killed_count > 0:
                 return {
@@ -166,6 +172,29 @@ class AppControlService:
                 "message": f"Error stopping {app_name}: {str(e)}"
             }
 
+    def _get_snapshot(self, max_age: Optional[float] = None) -> ProcessSnapshot:
+        """Return the shared process snapshot, retaking it when too old"""
+        max_age = self.snapshot_ttl if max_age is None else max_age
+        if self._snapshot is None or self._snapshot.age() > max_age:
+            with span("apps.process_snapshot"):
+                self._snapshot = ProcessSnapshot()
+        return self._snapshot
+
+    def _invalidate_snapshot(self):
+        """Drop the shared snapshot after starting or killing processes"""
+        self._snapshot = None
+        self._snapshot_epoch += 1
+
+    def _get_matcher(self, app_name: str) -> ProcessMatcher:
+        """Return the compiled matcher for an app, rebuilding it if the executable moved"""
+        app_config = self.app_configs[app_name]
+        resolved_path = self.resolver.resolve(app_name, app_config)
+        cached = self._matchers.get(app_name)
+        if cached is None or cached[0] != resolved_path:
+            cached = (resolved_path, ProcessMatcher.from_config(app_config, resolved_path))
+            self._matchers[app_name] = cached
+        return cached[1]
+
     async def _is_app_running(self, app_name: str) -> bool:
         """Check if an app is currently running"""
         app_config = self.app_configs.get(app_name)
@@ -173,41 +202,88 @@ class AppControlService:
             return False
         
         try:
-            process_name = os.path.basename(app_config["path"]).lower()
-            for proc in psutil.process_iter(['name']):
-                try:
-                    if proc.info['name'] and process_name in proc.info['name'].lower():
-                        return True
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    pass
-            return False
+            snapshot = self._get_snapshot()
+            matcher = self._get_matcher(app_name)
+            return any(matcher.matches(snapshot, proc) for proc in snapshot.processes)
         except Exception:
             return False
 
+    async def _scan_running(self, max_age: Optional[float] = None) -> Dict[str, Set[int]]:
+        """
+        Pids of every configured app from a single process snapshot (for the
+        event watcher). The scan runs in a thread on local copies; the new
+        snapshot and any rebuilt matchers are merged back on the event loop.
+        """
+        max_age = self.events.interval / 2 if max_age is None else max_age
+        epoch = self._snapshot_epoch
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.age() > max_age:
+            snapshot = None
+        configs = dict(self.app_configs)
+        matchers = dict(self._matchers)
+
+        def scan():
+            fresh = snapshot
+            if fresh is None:
+                with span("apps.process_snapshot"):
+                    fresh = ProcessSnapshot()
+            rebuilt = {}
+            running = {}
+            for name, app_config in configs.items():
+                try:
+                    resolved_path = self.resolver.resolve(name, app_config)
+                    cached = matchers.get(name)
+                    if cached is None or cached[0] != resolved_path:
+                        cached = rebuilt[name] = (resolved_path, ProcessMatcher.from_config(app_config, resolved_path))
+                except Exception:
+                    continue
+                running[name] = {proc.pid for proc in cached[1].find(fresh)}
+            return fresh, rebuilt, running
+
+        with span("apps.scan_running"):
+            fresh, rebuilt, running = await asyncio.to_thread(scan)
+        if self._snapshot_epoch == epoch and fresh is not self._snapshot:
+            self._snapshot = fresh
+        for name, cached in rebuilt.items():
+            # Skip apps added, changed or removed while the scan ran
+            if self.app_configs.get(name) is configs[name]:
+                self._matchers[name] = cached
+        return running
+
     async def list_available_apps(self) -> List[Dict[str, str]]:
         """List all available apps that can be controlled"""
         apps = []
         for name, config in self.app_configs.items():
             is_running = await self._is_app_running(name)
+            resolved_path = self.resolver.resolve(name, config)
             apps.append({
                 "name": name,
                 "path": config.get("path", ""),
                 "type": config.get("type", "unknown"),
-                "running": is_running
+                "running": is_running,
+                "resolved_path": resolved_path,
+                "available": resolved_path is not None
             })
         return apps
 
-    def add_app(self, name: str, path: str, app_type: str = "executable"):
+    def add_app(self, name: str, path: str, app_type: str = "executable",
+                match: Optional[Dict] = None):
         """Add a new app to the configuration"""
         self.app_configs[name.lower()] = {
             "path": path,
             "type": app_type
         }
+        if match:
+            self.app_configs[name.lower()]["match"] = match
+        self.resolver.invalidate(name.lower())
+        self._matchers.pop(name.lower(), None)
         self._save_config()
 
     def remove_app(self, name: str):
         """Remove an app from the configuration"""
         if name.lower() in self.app_configs:
             del self.app_configs[name.lower()]
+            self.resolver.invalidate(name.lower())
+            self._matchers.pop(name.lower(), None)
             self._save_config()
 
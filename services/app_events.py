@@ -0,0 +1,159 @@
+"""
+App Events - Lifecycle events (started/exited/crashed) for controlled apps
+"""
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Set
+
+from services.logs import get_logger
+
+logger = get_logger('app_events')
+
+# Returns the pids currently running per configured app (one process scan);
+# max_age=0 forces a fresh process snapshot
+Scanner = Callable[..., Awaitable[Dict[str, Set[int]]]]
+
+
+class AppEvents:
+    """
+    Fan-out of app lifecycle events to any number of subscribers.
+
+    Events come from two places: processes this server spawned report
+    their exit code as soon as `process.wait()` returns, and a single
+    shared watcher scans the process table every `interval` seconds to
+    catch apps started or closed outside the API. The watcher only runs
+    while someone is subscribed, and each pass is one scan no matter how
+    many subscribers there are.
+
+    Recent events are kept in a ring so a reconnecting client can resume
+    after the last event id it saw.
+    """
+
+    def __init__(self, scanner: Scanner, interval: Optional[float] = None,
+                 history: Optional[int] = None, queue_size: int = 256):
+        self.scanner = scanner
+        self.interval = interval or float(os.getenv('APP_EVENTS_INTERVAL', '2'))
+        self.recent = deque(maxlen=history or int(os.getenv('APP_EVENTS_HISTORY', '100')))
+        self.queue_size = queue_size
+        self._ids = itertools.count(1)
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._running: Dict[str, Set[int]] = {}
+        # Spawned pid -> (app, monotonic start); their exits come from process.wait()
+        self._spawned: Dict[int, tuple] = {}
+        self._stopping: Dict[str, float] = {}
+        self._watcher: Optional[asyncio.Task] = None
+        self._waiters: Set[asyncio.Task] = set()
+
+    def publish(self, event_type: str, app: str, **fields) -> dict:
+        event = {'id': next(self._ids), 'type': event_type, 'app': app, 'at': time.time(), **fields}
+        self.recent.append(event)
+        for queue in self._subscribers:
+            if queue.full():
+                # A slow client loses its oldest event; the id gap tells it to resync
+                queue.get_nowait()
+            queue.put_nowait(event)
+        logger.info("App %s %s", app, event_type, extra={'event': event})
+        return event
+
+    @contextmanager
+    def subscribe(self, last_event_id: Optional[int] = None) -> Iterator[asyncio.Queue]:
+        """Queue receiving events as they happen, starting with any recent ones after last_event_id"""
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        if last_event_id is not None:
+            for event in list(self.recent)[-self.queue_size:]:
+                if event['id'] > last_event_id:
+                    queue.put_nowait(event)
+        self._subscribers.add(queue)
+        self._ensure_watcher()
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def track(self, app: str, process: asyncio.subprocess.Process, spawn_ms: float):
+        """Report a process the server just spawned and wait for its exit in the background"""
+        started = time.monotonic()
+        self._spawned[process.pid] = (app, started)
+        pids = self._running.setdefault(app, set())
+        was_running = bool(pids)
+        pids.add(process.pid)
+        if not was_running:
+            self.publish('started', app, pid=process.pid, source='spawn', spawn_ms=round(spawn_ms, 3))
+        task = asyncio.create_task(self._wait(app, process, started))
+        self._waiters.add(task)
+        task.add_done_callback(self._waiters.discard)
+
+    def stopping(self, app: str):
+        """Mark an app as being stopped on request, so its exits aren't reported as crashes"""
+        self._stopping[app] = time.monotonic()
+
+    async def _wait(self, app: str, process: asyncio.subprocess.Process, started: float):
+        code = await process.wait()
+        self._spawned.pop(process.pid, None)
+        pids = self._running.get(app, set())
+        pids.discard(process.pid)
+        uptime_ms = round((time.monotonic() - started) * 1000, 3)
+        stopped = self._stopping.get(app, 0.0) >= started
+        if code != 0 and not stopped:
+            self.publish('crashed', app, pid=process.pid, exit_code=code,
+                         signal=-code if code < 0 else None, uptime_ms=uptime_ms)
+        elif not pids:
+            if code == 0 and not stopped and await self._still_running(app, process.pid):
+                # A launcher handed off to the app it started; the app hasn't exited
+                return
+            self.publish('exited', app, pid=process.pid, exit_code=code,
+                         signal=-code if code < 0 else None, uptime_ms=uptime_ms,
+                         reason='stopped' if stopped else 'exited')
+
+    async def _still_running(self, app: str, exited_pid: int) -> bool:
+        """Scan now for processes of app, adding any found to the known state"""
+        try:
+            pids = (await self.scanner(max_age=0)).get(app, set()) - {exited_pid}
+        except Exception:
+            logger.exception("App scan failed")
+            return False
+        if pids:
+            self._running.setdefault(app, set()).update(pids)
+        return bool(pids)
+
+    def observe(self, running: Dict[str, Set[int]], announce: bool = True):
+        """Diff a process scan against the known state and publish the changes"""
+        for app, pids in running.items():
+            known = self._running.setdefault(app, set())
+            # Spawned processes are reported by their waiter, not by the scan
+            spawned = {pid for pid, (owner, _) in self._spawned.items() if owner == app}
+            current = pids | spawned
+            if announce and current and not known:
+                self.publish('started', app, pid=min(current), pids=sorted(current), source='scan')
+            elif announce and known and not current:
+                self.publish('exited', app, pid=min(known), exit_code=None,
+                             reason='stopped' if app in self._stopping else 'exited', source='scan')
+            self._running[app] = current
+            if not current:
+                self._stopping.pop(app, None)
+
+    def _ensure_watcher(self):
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        # The first pass only records the baseline, it doesn't announce it
+        baseline = True
+        while self._subscribers:
+            try:
+                self.observe(await self.scanner(), announce=not baseline)
+                baseline = False
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("App watcher scan failed")
+            await asyncio.sleep(self.interval)
+        self._watcher = None
@@ -0,0 +1,100 @@
+"""
+Attachment Store - Disk-backed, content-addressed cache of attachment bytes
+"""
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional
+
+# Base64 characters decoded per step (a multiple of 4, ~768 KB of output)
+DECODE_CHUNK = 4 * 256 * 1024
+
+
+class AttachmentStore:
+    """
+    Attachment bytes live in files named by their SHA-256, so identical
+    attachments on different messages are stored once. A small index in
+    the shared store maps (message id, attachment id) to the digest plus
+    filename and mime type, so every worker finds what the others fetched.
+
+    Oldest files are evicted once the directory grows past max_bytes.
+    """
+
+    def __init__(self, store, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.store = store
+        self.directory = directory or os.getenv(
+            'ATTACHMENT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'gpt_backend_attachments')
+        )
+        self.max_bytes = max_bytes or int(os.getenv('ATTACHMENT_CACHE_MAX_MB', '512')) * 1024 * 1024
+        self._evict_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def lookup(self, message_id: str, attachment_id: str) -> Optional[dict]:
+        """Cached entry for an attachment, if its file is still on disk"""
+        entry = self.store.get(f"attachment:{message_id}:{attachment_id}")
+        if entry is None:
+            return None
+        try:
+            # Bump mtime so eviction drops the least recently used files first
+            os.utime(self.path_for(entry['sha256']))
+        except OSError:
+            return None
+        return entry
+
+    def put_base64(self, message_id: str, attachment_id: str, data: str,
+                   filename: str, mime_type: str) -> dict:
+        """
+        Decode base64url attachment data to disk a chunk at a time and index
+        it. Blocking; run in a worker thread.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for start in range(0, len(data), DECODE_CHUNK):
+                    chunk = data[start:start + DECODE_CHUNK]
+                    decoded = base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4))
+                    digest.update(decoded)
+                    out.write(decoded)
+                    size += len(decoded)
+            path = self.path_for(digest.hexdigest())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        entry = {'sha256': digest.hexdigest(), 'size': size, 'filename': filename, 'mime_type': mime_type}
+        self.store.set(f"attachment:{message_id}:{attachment_id}", entry)
+        self.evict()
+        return entry
+
+    def evict(self):
+        """Delete least recently used files until the cache fits max_bytes"""
+        with self._evict_lock:
+            files = []
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith('.part'):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    pass
@@ -0,0 +1,213 @@
+"""
+Contacts - Correspondent index built from synced mail, for recipient lookup
+"""
+import heapq
+import math
+import os
+import time
+from bisect import bisect_left, bisect_right
+from email.utils import getaddresses
+from typing import Dict, List, Optional, Tuple
+
+from services.digest import _timestamp
+from services.logs import get_logger
+
+logger = get_logger('contacts')
+
+KEY_PREFIX = 'contact:'
+VERSION_KEY = 'contacts:version'
+ME_KEY = 'contacts:me'
+
+# How much one appearance counts: people you write to matter more than people cc'd to you
+WEIGHT_SENT_TO = 2.0
+WEIGHT_FROM = 1.0
+WEIGHT_RECEIVED_WITH = 0.5
+
+# Message ids remembered per contact, so a re-seeded message isn't counted twice
+RECENT_IDS = 20
+
+
+def _search_keys(contact: dict) -> List[str]:
+    """Strings a prefix can match: the address, its domain, the name and each word of it"""
+    email = contact['email']
+    keys = {email, email.partition('@')[2]}
+    name = contact.get('name', '').lower()
+    if name:
+        keys.add(name)
+        keys.update(name.replace(',', ' ').split())
+    return [key for key in keys if key]
+
+
+class _Snapshot:
+    """The lookup structures for one version of the contacts, replaced as a whole"""
+    __slots__ = ('version', 'keys', 'contacts', 'ranks', 'ranked', 'email_keys')
+
+    def __init__(self, version=None, keys=None, contacts=None, ranks=None, ranked=None, email_keys=None):
+        self.version = version
+        self.keys: List[Tuple[str, str]] = keys or []
+        self.contacts: Dict[str, dict] = contacts or {}
+        self.ranks: Dict[str, float] = ranks or {}
+        self.ranked: List[str] = ranked or []
+        self.email_keys: Dict[str, List[str]] = email_keys or {}
+
+
+class ContactIndex:
+    """
+    Correspondents seen in the From, To and Cc headers of synced mail, with
+    their name, how often and how recently they appear.
+
+    Contacts are stored in the shared store under 'contact:<address>' and
+    updated incrementally by MailSync. Each contact carries a decayed score
+    that combines frequency and recency: every appearance adds its weight
+    and the total halves every `half_life` days.
+
+    Lookups use a sorted list of (search key, address) pairs per worker, so
+    a prefix is two bisects giving the range of matching keys. A narrow
+    range is scanned and ranked; for a broad one (a letter or two) it is
+    cheaper to walk contacts best-first and stop after `limit` matches.
+    The list is rebuilt only after the contacts change, by `refresh` (run
+    in a thread), into a new snapshot that replaces the old one in a single
+    assignment; `search` reads whichever snapshot is current.
+    """
+
+    def __init__(self, gmail_service, store, half_life_days: Optional[float] = None):
+        self.gmail_service = gmail_service
+        self.store = store
+        self.half_life = (half_life_days or float(os.getenv('CONTACTS_HALF_LIFE_DAYS', '30'))) * 86400
+        self._snapshot = _Snapshot()
+
+    def _decayed(self, score: float, scored_at: float, now: float) -> float:
+        return score * 0.5 ** (max(0.0, now - scored_at) / self.half_life)
+
+    async def _own_addresses(self) -> set:
+        me = self.store.get(ME_KEY)
+        if me is None:
+            try:
+                me = (await self.gmail_service.get_profile())['emailAddress'].lower()
+                self.store.set(ME_KEY, me)
+            except Exception:
+                logger.warning("Could not read the mailbox address; it may show up as a contact")
+                return set()
+        return {me}
+
+    async def on_messages(self, messages: List[dict], initial: bool):
+        """MailSync listener: count the correspondents of new messages"""
+        if not messages:
+            return
+        me = await self._own_addresses()
+        sightings: Dict[str, List[tuple]] = {}
+        for message in messages:
+            sent = 'SENT' in message.get('label_ids', [])
+            timestamp = _timestamp(message.get('date', '')) or time.time()
+            senders = getaddresses([message.get('from_email', '')])
+            recipients = getaddresses(message.get('to', []) + message.get('cc', []))
+            weights = [(senders, 0.0 if sent else WEIGHT_FROM),
+                       (recipients, WEIGHT_SENT_TO if sent else WEIGHT_RECEIVED_WITH)]
+            for addresses, weight in weights:
+                for name, address in addresses:
+                    address = address.strip().lower()
+                    if '@' not in address or address in me or not weight:
+                        continue
+                    sightings.setdefault(address, []).append(
+                        (message['id'], name.strip().strip('"\''), timestamp, weight, sent)
+                    )
+
+        for address, seen in sightings.items():
+            def add(contact, address=address, seen=seen):
+                return self._add(contact or self._empty(address), seen), None
+            self.store.update(KEY_PREFIX + address, add)
+        if sightings:
+            self.store.incr(VERSION_KEY)
+
+    def _empty(self, address: str) -> dict:
+        return {
+            'email': address,
+            'name': '',
+            'count': 0,
+            'sent_count': 0,
+            'first_seen': None,
+            'last_seen': 0.0,
+            'score': 0.0,
+            'scored_at': 0.0,
+            'message_ids': [],
+        }
+
+    def _add(self, contact: dict, seen: List[tuple]) -> dict:
+        for message_id, name, timestamp, weight, sent in sorted(seen, key=lambda item: item[2]):
+            if message_id in contact['message_ids']:
+                continue
+            contact['message_ids'] = (contact['message_ids'] + [message_id])[-RECENT_IDS:]
+            contact['count'] += 1
+            contact['sent_count'] += 1 if sent else 0
+            if contact['first_seen'] is None or timestamp < contact['first_seen']:
+                contact['first_seen'] = timestamp
+            if timestamp >= contact['last_seen']:
+                contact['last_seen'] = timestamp
+                # The most recent display name wins
+                contact['name'] = name or contact['name']
+            # Keep the score as of the newest sighting; older mail arrives already decayed
+            reference = max(contact['scored_at'], timestamp)
+            contact['score'] = (self._decayed(contact['score'], contact['scored_at'], reference)
+                                + self._decayed(weight, timestamp, reference))
+            contact['scored_at'] = reference
+        return contact
+
+    def refresh(self):
+        """Rebuild the lookup snapshot if the contacts changed since it was built (blocking)"""
+        version = self.store.get(VERSION_KEY, 0)
+        if version == self._snapshot.version:
+            return
+        contacts = {contact['email']: contact for _, contact in self.store.items(KEY_PREFIX)}
+        email_keys = {email: _search_keys(contact) for email, contact in contacts.items()}
+        # Decay scales every score by the same factor, so this orders contacts
+        # like their decayed scores at any moment, without recomputing per lookup
+        ranks = {
+            email: math.log2(contact['score']) + contact['scored_at'] / self.half_life
+            for email, contact in contacts.items() if contact['score'] > 0
+        }
+        self._snapshot = _Snapshot(
+            version=version,
+            keys=sorted((key, email) for email, keys in email_keys.items() for key in keys),
+            contacts=contacts,
+            ranks=ranks,
+            ranked=sorted(ranks, key=ranks.__getitem__, reverse=True),
+            email_keys=email_keys,
+        )
+
+    def search(self, prefix: str = '', limit: int = 10) -> List[dict]:
+        """
+        Contacts whose address, domain, name or a word of it starts with
+        prefix, best first, from the current snapshot (call refresh first
+        for the latest contacts)
+        """
+        snapshot = self._snapshot
+        keys, ranks = snapshot.keys, snapshot.ranks
+        prefix = ' '.join(prefix.lower().split())
+        start = bisect_left(keys, (prefix,))
+        end = bisect_right(keys, (prefix + '\uffff',))
+        matching = end - start
+        if matching * matching > limit * len(keys):
+            # Broad prefix: matches are dense, so the best-ranked ones come up quickly
+            best = []
+            email_keys = snapshot.email_keys
+            for email in snapshot.ranked:
+                if any(key.startswith(prefix) for key in email_keys[email]):
+                    best.append(email)
+                    if len(best) == limit:
+                        break
+        else:
+            matches = {email for _, email in keys[start:end]}
+            best = heapq.nlargest(limit, matches, key=lambda email: ranks.get(email, -math.inf))
+        now = time.time()
+        return [self._public(snapshot.contacts[email], now) for email in best]
+
+    def _public(self, contact: dict, now: float) -> dict:
+        return {
+            'email': contact['email'],
+            'name': contact['name'],
+            'count': contact['count'],
+            'sent_count': contact['sent_count'],
+            'first_seen': contact['first_seen'],
+            'last_seen': contact['last_seen'],
+            'score': float(f"{self._decayed(contact['score'], contact['scored_at'], now):.4g}"),
+        }
@@ -0,0 +1,176 @@
+"""
+Deadlines - Per-request time budgets, passed down to upstream calls
+"""
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Awaitable, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+# Absolute time.monotonic() by which the current request must be answered
+deadline_var: ContextVar[Optional[float]] = ContextVar('request_deadline', default=None)
+
+# Time kept back from service calls to build and send the (partial) response
+RESPONSE_MARGIN = float(os.getenv('REQUEST_DEADLINE_MARGIN_MS', '250')) / 1000.0
+
+# Only these are cut off on disconnect or deadline; writes always run to completion
+CANCELLABLE_METHODS = ('GET', 'HEAD')
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed; partial holds whatever finished in time"""
+
+    def __init__(self, partial: Optional[list] = None, missing: int = 0):
+        super().__init__("Request deadline exceeded")
+        self.partial = partial or []
+        self.missing = missing
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline (None: no deadline)"""
+    deadline = deadline_var.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def budget() -> Optional[float]:
+    """Seconds service work may still take, leaving RESPONSE_MARGIN to respond"""
+    left = remaining()
+    return None if left is None else max(0.0, left - RESPONSE_MARGIN)
+
+
+async def within(aw: Awaitable[T]) -> T:
+    """Await aw, cancelling it and raising DeadlineExceeded if the budget runs out"""
+    limit = budget()
+    if limit is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, limit)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded()
+
+
+def _parse_route_timeouts(spec: str) -> List[Tuple[str, float]]:
+    """'/gmail/digest=10,/gmail/=25' -> [('/gmail/digest', 10.0), ('/gmail/', 25.0)], longest prefix first"""
+    timeouts = []
+    for item in spec.split(','):
+        prefix, _, seconds = item.strip().partition('=')
+        if prefix and seconds:
+            timeouts.append((prefix, float(seconds)))
+    return sorted(timeouts, key=lambda entry: len(entry[0]), reverse=True)
+
+
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware giving each request a deadline: the client's
+    X-Request-Timeout header (seconds, up to REQUEST_TIMEOUT_MAX) or the
+    route's default (REQUEST_ROUTE_TIMEOUTS prefixes, else
+    REQUEST_TIMEOUT_SECONDS). Services read it through `remaining()`.
+
+    The middleware is the only reader of the ASGI receive channel, so it
+    sees the client disconnect as soon as the server reports it. For reads
+    the handler task is then cancelled, which cancels its upstream calls;
+    the same happens when the deadline passes before the response has
+    started (504). Once a response is streaming, only a disconnect ends it.
+    """
+
+    def __init__(self, app, default_timeout: Optional[float] = None, max_timeout: Optional[float] = None,
+                 route_timeouts: Optional[str] = None):
+        self.app = app
+        self.default_timeout = default_timeout or float(os.getenv('REQUEST_TIMEOUT_SECONDS', '30'))
+        self.max_timeout = max_timeout or float(os.getenv('REQUEST_TIMEOUT_MAX', '300'))
+        self.route_timeouts = _parse_route_timeouts(
+            route_timeouts if route_timeouts is not None else os.getenv('REQUEST_ROUTE_TIMEOUTS', '')
+        )
+
+    def timeout_for(self, scope) -> float:
+        for name, value in scope.get('headers', []):
+            if name == b'x-request-timeout':
+                try:
+                    requested = float(value)
+                except ValueError:
+                    break
+                if requested > 0:
+                    return min(requested, self.max_timeout)
+        path = scope.get('path', '')
+        for prefix, seconds in self.route_timeouts:
+            if path.startswith(prefix):
+                return seconds
+        return self.default_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        timeout = self.timeout_for(scope)
+        token = deadline_var.set(time.monotonic() + timeout)
+        cancellable = scope['method'] in CANCELLABLE_METHODS
+        inbox: asyncio.Queue = asyncio.Queue(1)
+        disconnected = asyncio.Event()
+        response_started = False
+
+        async def listen():
+            # Body chunks go to the app one at a time; after the body, the next message is the disconnect
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected.set()
+                    if inbox.empty():
+                        inbox.put_nowait(message)
+                    return
+                await inbox.put(message)
+
+        async def app_receive():
+            if disconnected.is_set() and inbox.empty():
+                return {'type': 'http.disconnect'}
+            return await inbox.get()
+
+        async def app_send(message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start':
+                response_started = True
+            await send(message)
+
+        # Tasks copy the current context, so the handler sees deadline_var
+        handler = asyncio.create_task(self.app(scope, app_receive, app_send))
+        listener = asyncio.create_task(listen())
+        gone = asyncio.create_task(disconnected.wait())
+        try:
+            wait_for = timeout if cancellable else None
+            while True:
+                done, _ = await asyncio.wait({handler, gone}, timeout=wait_for,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if handler in done:
+                    return handler.result()
+                if gone in done:
+                    if not cancellable:
+                        return await handler
+                    await self._cancel(handler)
+                    if not response_started:
+                        # Nobody will read it; it only records the outcome for the access log
+                        await self._respond(send, 499, b'{"detail": "Client disconnected"}')
+                    return
+                if response_started:
+                    wait_for = None
+                    continue
+                await self._cancel(handler)
+                await self._respond(send, 504, b'{"detail": "Request deadline exceeded"}')
+                return
+        finally:
+            for task in (handler, listener, gone):
+                task.cancel()
+            deadline_var.reset(token)
+
+    async def _cancel(self, task: asyncio.Task):
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    async def _respond(self, send, status: int, body: bytes):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode('ascii'))]})
+        await send({'type': 'http.response.body', 'body': body})
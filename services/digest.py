@@ -0,0 +1,121 @@
+"""
+Thread Digests - Compact per-thread summaries kept up to date by mail sync
+"""
+import os
+from email.utils import getaddresses, parsedate_to_datetime
+from typing import Dict, List, Optional
+
+from services.text_normalize import excerpt
+
+KEY_PREFIX = 'digest:'
+# [thread id, last timestamp] pairs, most recently active first
+INDEX_KEY = 'digests:index'
+
+
+def _timestamp(date: str) -> float:
+    try:
+        return parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return 0.0
+
+
+class ThreadDigests:
+    """
+    Per-thread digests stored in the shared store under 'digest:<thread id>'.
+
+    Each digest holds the subject, participants, message count, the last
+    few snippets and a cleaned excerpt of the newest message. Digests are
+    updated incrementally from synced messages (see MailSync), so serving
+    them never touches Gmail.
+
+    A recency index under 'digests:index' orders the threads by their
+    newest message, so listing reads only the digests it returns. Only the
+    `max_threads` most recently active threads are kept; older digests
+    are deleted as new threads arrive.
+    """
+
+    def __init__(self, store, snippets_per_thread: Optional[int] = None,
+                 excerpt_chars: Optional[int] = None, max_threads: Optional[int] = None):
+        self.store = store
+        self.snippets_per_thread = snippets_per_thread or int(os.getenv('DIGEST_SNIPPETS', '3'))
+        self.excerpt_chars = excerpt_chars or int(os.getenv('DIGEST_EXCERPT_CHARS', '400'))
+        self.max_threads = max_threads or int(os.getenv('DIGEST_MAX_THREADS', '500'))
+
+    async def on_messages(self, messages: List[dict], initial: bool):
+        """MailSync listener: fold new messages into their thread digests"""
+        by_thread: Dict[str, List[dict]] = {}
+        for message in messages:
+            by_thread.setdefault(message['thread_id'], []).append(message)
+        if not by_thread:
+            return
+        index = dict(self._index())
+        for thread_id, thread_messages in by_thread.items():
+            key = KEY_PREFIX + thread_id
+            digest = self.store.get(key) or self._empty(thread_id)
+            for message in thread_messages:
+                self._add(digest, message)
+            self.store.set(key, digest)
+            index[thread_id] = digest['last_timestamp']
+
+        ranked = sorted(index.items(), key=lambda entry: entry[1], reverse=True)
+        self.store.set(INDEX_KEY, [list(entry) for entry in ranked[:self.max_threads]])
+        for thread_id, _ in ranked[self.max_threads:]:
+            self.store.delete(KEY_PREFIX + thread_id)
+
+    def _index(self) -> List[list]:
+        """The recency index, rebuilt from the stored digests if it is missing"""
+        index = self.store.get(INDEX_KEY)
+        if index is None:
+            digests = [digest for _, digest in self.store.items(KEY_PREFIX)]
+            digests.sort(key=lambda digest: digest['last_timestamp'], reverse=True)
+            index = [[digest['thread_id'], digest['last_timestamp']] for digest in digests]
+        return index
+
+    def _empty(self, thread_id: str) -> dict:
+        return {
+            'thread_id': thread_id,
+            'subject': '',
+            'participants': [],
+            'message_count': 0,
+            'message_ids': [],
+            'snippets': [],
+            'excerpt': '',
+            'last_date': '',
+            'last_timestamp': 0.0,
+        }
+
+    def _add(self, digest: dict, message: dict):
+        if message['id'] in digest['message_ids']:
+            return
+        digest['message_ids'].append(message['id'])
+        digest['message_count'] += 1
+
+        for name, address in getaddresses([message['from_email'], *message.get('to', [])]):
+            if address and address.lower() not in (p['email'] for p in digest['participants']):
+                digest['participants'].append({'name': name, 'email': address.lower()})
+
+        timestamp = _timestamp(message.get('date', ''))
+        digest['snippets'].append({
+            'id': message['id'],
+            'from': message['from_email'],
+            'date': message.get('date', ''),
+            'snippet': message.get('snippet', ''),
+            'timestamp': timestamp,
+        })
+        digest['snippets'].sort(key=lambda item: item['timestamp'])
+        digest['snippets'] = digest['snippets'][-self.snippets_per_thread:]
+
+        if timestamp >= digest['last_timestamp']:
+            digest['subject'] = message.get('subject', '') or digest['subject']
+            digest['excerpt'] = excerpt(message.get('body', '') or message.get('snippet', ''), self.excerpt_chars)
+            digest['last_date'] = message.get('date', '')
+            digest['last_timestamp'] = timestamp
+
+    def list(self, limit: int = 20) -> List[dict]:
+        """Most recently active thread digests, newest first"""
+        digests = []
+        for thread_id, _ in self._index()[:limit]:
+            digest = self.store.get(KEY_PREFIX + thread_id)
+            if digest is not None:
+                digests.append({key: value for key, value in digest.items() if key != 'message_ids'})
+        return digests
@@ -0,0 +1,348 @@
+"""
+Async Gmail Client - Native asyncio Gmail REST client on an httpx connection pool
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+import httpx
+
+from services.gmail_backends import UPLOAD_CHUNK_SIZE, UPLOAD_RETRIES, GmailApiError
+from services.logs import upstream_call
+
+DEFAULT_BASE_URL = 'https://gmail.googleapis.com'
+
+# Gmail API method -> (HTTP verb, path template under /gmail/v1/)
+ROUTES = {
+    'getProfile': ('GET', 'users/{userId}/profile'),
+    'messages.list': ('GET', 'users/{userId}/messages'),
+    'messages.get': ('GET', 'users/{userId}/messages/{id}'),
+    'messages.send': ('POST', 'users/{userId}/messages/send'),
+    'messages.batchModify': ('POST', 'users/{userId}/messages/batchModify'),
+    'messages.batchDelete': ('POST', 'users/{userId}/messages/batchDelete'),
+    'messages.attachments.get': ('GET', 'users/{userId}/messages/{messageId}/attachments/{id}'),
+    'drafts.list': ('GET', 'users/{userId}/drafts'),
+    'drafts.get': ('GET', 'users/{userId}/drafts/{id}'),
+    'drafts.create': ('POST', 'users/{userId}/drafts'),
+    'drafts.update': ('PUT', 'users/{userId}/drafts/{id}'),
+    'drafts.send': ('POST', 'users/{userId}/drafts/send'),
+    'drafts.delete': ('DELETE', 'users/{userId}/drafts/{id}'),
+    'labels.list': ('GET', 'users/{userId}/labels'),
+    'labels.get': ('GET', 'users/{userId}/labels/{id}'),
+    'threads.list': ('GET', 'users/{userId}/threads'),
+    'threads.get': ('GET', 'users/{userId}/threads/{id}'),
+    'history.list': ('GET', 'users/{userId}/history'),
+}
+
+# Gmail's batch endpoint accepts at most 100 calls per request
+MAX_BATCH_SIZE = 100
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _query_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+def _error_message(response_body: bytes) -> str:
+    try:
+        return json.loads(response_body)['error']['message']
+    except (ValueError, KeyError, TypeError):
+        return response_body[:200].decode('utf-8', 'replace')
+
+
+def _parse_headers(lines: List[str]) -> Dict[str, str]:
+    headers = {}
+    for line in lines:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def parse_multipart(content_type: str, body: bytes) -> List[Tuple[Dict[str, str], str, Dict[str, str], bytes]]:
+    """
+    Split a multipart/mixed batch body into embedded HTTP messages.
+
+    Returns (part headers, start line, headers, body) for each part, in order.
+    """
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        raise ValueError(f"No boundary in content type: {content_type}")
+    delimiter = b'--' + match.group(1).encode('ascii')
+
+    messages = []
+    for part in body.split(delimiter)[1:]:
+        if part.startswith(b'--'):
+            break
+        # The part's own MIME headers come first, then the embedded HTTP message
+        part_head, _, http_message = part.lstrip(b'\r\n').partition(b'\r\n\r\n')
+        head, _, payload = http_message.partition(b'\r\n\r\n')
+        lines = head.decode('utf-8', 'replace').split('\r\n')
+        messages.append((
+            _parse_headers(part_head.decode('utf-8', 'replace').split('\r\n')),
+            lines[0],
+            _parse_headers(lines[1:]),
+            payload.rstrip(b'\r\n'),
+        ))
+    return messages
+
+
+def encode_multipart(parts: List[bytes], boundary: str, id_prefix: str = 'item') -> bytes:
+    """Wrap embedded HTTP messages as a multipart/mixed body"""
+    chunks = []
+    for index, part in enumerate(parts):
+        chunks.append(
+            f"--{boundary}\r\nContent-Type: application/http\r\n"
+            f"Content-ID: <{id_prefix}{index}>\r\n\r\n".encode('ascii') + part + b'\r\n'
+        )
+    chunks.append(f"--{boundary}--\r\n".encode('ascii'))
+    return b''.join(chunks)
+
+
+class AsyncGmailClient:
+    """
+    Talks to the Gmail REST endpoints directly over one pooled
+    httpx.AsyncClient (HTTP/2 when the h2 package is installed), so many
+    concurrent calls share a few connections on a single event loop.
+
+    token_provider is an async callable returning a valid access token.
+    base_url and transport can point the client at a local mock server.
+    """
+
+    def __init__(self, token_provider: Callable[[], Awaitable[str]],
+                 base_url: Optional[str] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_connections: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        self.token_provider = token_provider
+        self.base_url = (base_url or os.getenv('GMAIL_API_BASE_URL', DEFAULT_BASE_URL)).rstrip('/')
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            transport=transport,
+            http2=transport is None and _http2_available(),
+            limits=httpx.Limits(
+                max_connections=max_connections or int(os.getenv('GMAIL_HTTP_MAX_CONNECTIONS', '20')),
+                max_keepalive_connections=max_connections or int(os.getenv('GMAIL_HTTP_MAX_CONNECTIONS', '20')),
+            ),
+            timeout=timeout or float(os.getenv('GOOGLE_HTTP_TIMEOUT', '30')),
+        )
+
+    def _build(self, method: str, params: Dict) -> Tuple[str, str, Dict, Optional[Any]]:
+        if method not in ROUTES:
+            raise ValueError(f"Unsupported Gmail method: {method}")
+        verb, template = ROUTES[method]
+        params = dict(params)
+        body = params.pop('body', None)
+        path_params = {name: quote(str(params.pop(name)), safe='')
+                       for name in re.findall(r'{(\w+)}', template)}
+        path = '/gmail/v1/' + template.format(**path_params)
+        query = {k: _query_value(v) for k, v in params.items() if v is not None}
+        return verb, path, query, body
+
+    async def call(self, method: str, **params) -> Any:
+        verb, path, query, body = self._build(method, params)
+        with upstream_call(method):
+            token = await self.token_provider()
+            try:
+                response = await self._client.request(
+                    verb, path, params=query, json=body,
+                    headers={'Authorization': f'Bearer {token}'}
+                )
+            except httpx.TransportError as error:
+                # Callers handle GmailApiError, as with the discovery backend
+                raise GmailApiError(503, f"Request failed: {error}") from error
+            if response.status_code >= 400:
+                raise GmailApiError(response.status_code, _error_message(response.content))
+            return response.json() if response.content else {}
+
+    async def send_media(self, path: str, metadata: Optional[Dict] = None,
+                         chunk_size: int = UPLOAD_CHUNK_SIZE) -> Dict:
+        """
+        Send an RFC 822 message file with Gmail's resumable upload protocol.
+
+        The file is read and PUT one chunk at a time. After a network error,
+        5xx or 429 the client asks the session how much it has received and
+        continues from there, with backoff, up to UPLOAD_RETRIES times in a row.
+        """
+        size = os.path.getsize(path)
+        token = await self.token_provider()
+        try:
+            response = await self._client.post(
+                '/upload/gmail/v1/users/me/messages/send',
+                params={'uploadType': 'resumable'},
+                json=metadata or {},
+                headers={
+                    'Authorization': f'Bearer {token}',
+                    'X-Upload-Content-Type': 'message/rfc822',
+                    'X-Upload-Content-Length': str(size),
+                }
+            )
+        except httpx.TransportError as error:
+            raise GmailApiError(503, f"Upload request failed: {error}") from error
+        if response.status_code >= 400:
+            raise GmailApiError(response.status_code, _error_message(response.content))
+        session_url = response.headers['location']
+
+        offset, failures, status_unknown = 0, 0, False
+        with open(path, 'rb') as source:
+            while True:
+                token = await self.token_provider()
+                headers = {'Authorization': f'Bearer {token}'}
+                try:
+                    if status_unknown:
+                        # Ask the session what it has; an empty PUT with "*" reports progress
+                        headers['Content-Range'] = f'bytes */{size}'
+                        response = await self._client.put(session_url, headers=headers)
+                    else:
+                        source.seek(offset)
+                        chunk = await asyncio.to_thread(source.read, chunk_size)
+                        end = offset + len(chunk) - 1
+                        headers['Content-Range'] = f'bytes {offset}-{end}/{size}' if chunk else f'bytes */{size}'
+                        response = await self._client.put(session_url, content=chunk, headers=headers)
+                except httpx.TransportError:
+                    response = None
+
+                if response is not None and response.status_code in (200, 201):
+                    return response.json()
+                if response is not None and response.status_code == 308:
+                    # "Range: bytes=0-N" is what the server has so far (absent: nothing yet)
+                    received = re.search(r'bytes=0-(\d+)', response.headers.get('range', ''))
+                    offset = int(received.group(1)) + 1 if received else 0
+                    failures, status_unknown = 0, False
+                    continue
+                if response is not None and response.status_code < 500 and response.status_code != 429:
+                    raise GmailApiError(response.status_code, _error_message(response.content))
+
+                failures += 1
+                if failures > UPLOAD_RETRIES:
+                    status = response.status_code if response is not None else 503
+                    raise GmailApiError(status, "Upload failed after retries")
+                await asyncio.sleep(min(2 ** failures, 30) * random.uniform(0.5, 1.0))
+                status_unknown = True
+
+    async def batch(self, calls: List[Tuple[str, Dict]], concurrency: int = 8) -> List[Any]:
+        """
+        Run calls through Gmail's batch endpoint, up to 100 per HTTP request.
+
+        Each result is the resource or a GmailApiError, in call order.
+        Chunks are sent concurrently, up to `concurrency` at once. A chunk
+        whose batch request fails as a whole gives each of its calls that
+        error (a network failure becomes a 503), and the other chunks still
+        return their results.
+        """
+        chunks = [calls[i:i + MAX_BATCH_SIZE] for i in range(0, len(calls), MAX_BATCH_SIZE)]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(chunk):
+            async with semaphore:
+                try:
+                    return await self._batch_chunk(chunk)
+                except GmailApiError as error:
+                    return [error] * len(chunk)
+                except httpx.TransportError as error:
+                    return [GmailApiError(503, f"Batch request failed: {error}")] * len(chunk)
+
+        results = await asyncio.gather(*[run(chunk) for chunk in chunks])
+        return [item for chunk_results in results for item in chunk_results]
+
+    async def _batch_chunk(self, calls: List[Tuple[str, Dict]]) -> List[Any]:
+        parts = []
+        for method, params in calls:
+            verb, path, query, body = self._build(method, params)
+            target = path + ('?' + urlencode(query, doseq=True) if query else '')
+            if body is not None:
+                payload = json.dumps(body).encode('utf-8')
+                parts.append(f"{verb} {target}\r\nContent-Type: application/json\r\n\r\n".encode('utf-8') + payload)
+            else:
+                parts.append(f"{verb} {target}\r\n\r\n".encode('utf-8'))
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        token = await self.token_provider()
+        with upstream_call('batch'):
+            response = await self._client.post(
+                '/batch/gmail/v1',
+                content=encode_multipart(parts, boundary),
+                headers={
+                    'Authorization': f'Bearer {token}',
+                    'Content-Type': f'multipart/mixed; boundary={boundary}',
+                }
+            )
+            if response.status_code >= 400:
+                raise GmailApiError(response.status_code, _error_message(response.content))
+
+        # Responses carry Content-ID "response-item<N>"; don't rely on their order
+        results: List[Any] = [GmailApiError(502, "Missing batch response")] * len(calls)
+        parts = parse_multipart(response.headers['content-type'], response.content)
+        for position, (part_headers, status_line, _, payload) in enumerate(parts):
+            match = re.search(r'item(\d+)', part_headers.get('content-id', ''))
+            index = int(match.group(1)) if match else position
+            if index >= len(calls):
+                continue
+            status = int(status_line.split()[1])
+            if status >= 400:
+                results[index] = GmailApiError(status, _error_message(payload))
+            else:
+                results[index] = json.loads(payload) if payload else {}
+        return results
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    # Convenience wrappers
+    async def list_messages(self, query: str = '', max_results: int = 100,
+                            page_token: Optional[str] = None, label_ids: Optional[List[str]] = None) -> Dict:
+        return await self.call('messages.list', userId='me', q=query, maxResults=max_results,
+                               pageToken=page_token, labelIds=label_ids)
+
+    async def get_message(self, message_id: str, format: str = 'full',
+                          metadata_headers: Optional[List[str]] = None) -> Dict:
+        return await self.call('messages.get', userId='me', id=message_id, format=format,
+                               metadataHeaders=metadata_headers)
+
+    async def send_message(self, raw: str, thread_id: Optional[str] = None) -> Dict:
+        body = {'raw': raw}
+        if thread_id:
+            body['threadId'] = thread_id
+        return await self.call('messages.send', userId='me', body=body)
+
+    async def get_attachment(self, message_id: str, attachment_id: str) -> Dict:
+        return await self.call('messages.attachments.get', userId='me', messageId=message_id,
+                               id=attachment_id)
+
+    async def list_labels(self) -> Dict:
+        return await self.call('labels.list', userId='me')
+
+    async def get_label(self, label_id: str) -> Dict:
+        return await self.call('labels.get', userId='me', id=label_id)
+
+    async def list_threads(self, query: str = '', max_results: int = 100,
+                           page_token: Optional[str] = None) -> Dict:
+        return await self.call('threads.list', userId='me', q=query, maxResults=max_results,
+                               pageToken=page_token)
+
+    async def get_thread(self, thread_id: str, format: str = 'full') -> Dict:
+        return await self.call('threads.get', userId='me', id=thread_id, format=format)
+
+    async def list_history(self, start_history_id: str, page_token: Optional[str] = None,
+                           history_types: Optional[List[str]] = None) -> Dict:
+        return await self.call('history.list', userId='me', startHistoryId=start_history_id,
+                               pageToken=page_token, historyTypes=history_types)
+
+    async def get_messages_batch(self, message_ids: List[str], format: str = 'full') -> List[Any]:
+        return await self.batch([
+            ('messages.get', {'userId': 'me', 'id': message_id, 'format': format})
+            for message_id in message_ids
+        ])
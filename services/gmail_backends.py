@@ -0,0 +1,93 @@
+"""
+Gmail Backends - Common call interface over the Gmail REST API
+
+A backend exposes `await call(method, **params)` where method is the Gmail
+API method name ('messages.list', 'messages.attachments.get', ...) and
+params use the API's own parameter names (userId, maxResults, q, body...).
+Results are the raw Gmail JSON resources, so GmailService shapes them the
+same way whichever backend is in use.
+"""
+import asyncio
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.logs import upstream_call
+
+# Resumable upload chunk size; Google requires a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = int(os.getenv('GMAIL_UPLOAD_CHUNK_KB', '8192')) // 256 * 256 * 1024
+# Retries per chunk after transient upload failures
+UPLOAD_RETRIES = 5
+
+
+class GmailApiError(Exception):
+    """An error response from the Gmail API"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Gmail API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class DiscoveryBackend:
+    """
+    Backend built on googleapiclient's discovery client.
+
+    Requests are executed in worker threads by `execute` (a blocking
+    callable that runs one googleapiclient request), so the event loop
+    never blocks on the network.
+    """
+
+    def __init__(self, service, execute: Callable):
+        self.service = service
+        self.execute = execute
+
+    def _request(self, method: str, params: Dict):
+        resource = self.service.users()
+        *path, action = method.split('.')
+        for name in path:
+            resource = getattr(resource, name)()
+        return getattr(resource, action)(**params)
+
+    async def call(self, method: str, **params) -> Any:
+        from googleapiclient.errors import HttpError
+
+        request = self._request(method, params)
+        with upstream_call(method):
+            try:
+                return await asyncio.to_thread(self.execute, request)
+            except HttpError as error:
+                raise GmailApiError(error.resp.status, error._get_reason()) from error
+
+    async def send_media(self, path: str, metadata: Optional[Dict] = None) -> Dict:
+        """
+        Send an RFC 822 message file through Gmail's resumable media upload.
+        The client reads and uploads one chunk at a time and resumes after
+        transient failures.
+        """
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import MediaFileUpload
+
+        media = MediaFileUpload(path, mimetype='message/rfc822', chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+        try:
+            request = self._request('messages.send', {'userId': 'me', 'body': metadata or {}, 'media_body': media})
+            return await asyncio.to_thread(self.execute, request, UPLOAD_RETRIES)
+        except HttpError as error:
+            raise GmailApiError(error.resp.status, error._get_reason()) from error
+        finally:
+            media.stream().close()
+
+    async def batch(self, calls: List[Tuple[str, Dict]], concurrency: int = 8) -> List[Any]:
+        """Run several calls; each result is the resource or a GmailApiError"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(method, params):
+            async with semaphore:
+                try:
+                    return await self.call(method, **params)
+                except GmailApiError as error:
+                    return error
+
+        return await asyncio.gather(*[run(method, params) for method, params in calls])
+
+    async def aclose(self):
+        pass
@@ -3,74 +3,196 @@ Gmail Service - Handles Gmail API operations
 """
 import os
 import base64
+import hashlib
 import json
-from typing import List, Optional
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow, Flow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 import asyncio
 from functools import lru_cache
 
+# The Google client libraries are slow to import, so they are imported
+# where first used instead of at module load (keeps cold starts fast)
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+from services import deadlines
+from services.gmail_backends import DiscoveryBackend, GmailApiError
+from services.google_transport import GoogleTransport
+from services.logs import get_logger, log_limited
+from services.profiling import span
+from services.shared_store import get_shared_store
+from services.singleflight import SingleFlight
+from services.message_cache import MessageCache
+from services.mime_builder import write_message
+from services.text_normalize import clean_reply_text, html_to_text
+
 # Gmail API scopes
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly',
           'https://www.googleapis.com/auth/gmail.send',
           'https://www.googleapis.com/auth/gmail.modify']
 
+logger = get_logger('gmail')
+
+# messages.batchModify / batchDelete accept at most 1000 ids per call
+BATCH_MUTATION_SIZE = 1000
+
+LABELS_KEY = 'gmail:labels'
+
+DRAFT_PREFIX = 'draft:'
+# Set (with a TTL) when the draft cache was last reconciled with drafts.list
+DRAFTS_SYNCED_KEY = 'drafts:synced'
+# Ids of messages sent through this service, so automation can tell them apart
+SENT_HERE_PREFIX = 'sent-here:'
+SENT_HERE_TTL = 7 * 86400
+DRAFT_FIELDS = ('to', 'cc', 'bcc', 'subject', 'body', 'html', 'thread_id')
+
+# Built-in label ids, accepted in any case
+SYSTEM_LABELS = {'INBOX', 'UNREAD', 'STARRED', 'IMPORTANT', 'SENT', 'DRAFT', 'SPAM', 'TRASH',
+                 'CATEGORY_PERSONAL', 'CATEGORY_SOCIAL', 'CATEGORY_PROMOTIONS',
+                 'CATEGORY_UPDATES', 'CATEGORY_FORUMS'}
+
 
 class GmailService:
     def __init__(self):
         self.credentials_path = os.getenv('GOOGLE_CREDENTIALS_PATH', 'credentials.json')
         self.token_path = os.getenv('GOOGLE_TOKEN_PATH', 'token.json')
         self.service = None
+        self._backend = None
+        # "discovery" (googleapiclient in worker threads) or "httpx" (native async client)
+        self.backend_name = os.getenv('GMAIL_BACKEND', 'discovery').lower()
         self._credentials = None
+        self._auth_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._transport = GoogleTransport()
+        # Upper bound on message detail fetches running at once per request
+        self.fetch_concurrency = int(os.getenv('GMAIL_FETCH_CONCURRENCY', '8'))
         # Check for credentials in environment variable
         self.credentials_json = os.getenv('GOOGLE_CREDENTIALS')
+        self._env_client_config = None
+        self._file_client_config = None
+        # Seconds an authorization URL stays redeemable
+        self.oauth_flow_ttl = float(os.getenv('OAUTH_FLOW_TTL', '600'))
+        # Identical concurrent reads share one upstream call; optional micro-cache TTL in seconds
+        shared_cache = os.getenv('GMAIL_SHARED_CACHE', 'false').lower() in ('1', 'true', 'yes')
+        self._reads = SingleFlight(
+            ttl=float(os.getenv('GMAIL_READ_CACHE_TTL', '0')),
+            shared=get_shared_store() if shared_cache else None,
+            namespace='gmail-reads'
+        )
+        # Ids listed and details fetched so far by shared message listings, by read key
+        self._listing_progress: Dict[tuple, tuple] = {}
+        # Close tasks for backends replaced by a new authorization
+        self._retiring = set()
+        # Trimming quoted replies and signatures is heuristic and drops text, so it is opt-in
+        self.trim_replies = os.getenv('GMAIL_TRIM_REPLIES', 'false').lower() in ('1', 'true', 'yes')
+        # Hot tier of parsed messages (compact records, compressed bodies, byte budget)
+        self.message_cache = MessageCache()
+        self._attachments = None
+        # Label counters are cached across workers until new mail syncs or the TTL passes
+        self.labels_ttl = float(os.getenv('GMAIL_LABELS_TTL', '60'))
+        # Drafts are reconciled with Gmail when listed, at most this often (seconds)
+        self.drafts_ttl = float(os.getenv('GMAIL_DRAFTS_TTL', '30'))
+        # Messages above this size are sent with the resumable media upload
+        self.simple_send_max_bytes = int(os.getenv('GMAIL_SIMPLE_SEND_MAX_KB', '4096')) * 1024
+        # Largest number of messages one bulk modify/trash call may touch
+        self.bulk_max_messages = int(os.getenv('GMAIL_BULK_MAX_MESSAGES', '5000'))
 
-    async def _get_service(self):
-        """Get or create Gmail API service"""
-        if self.service is None:
+    async def _get_backend(self):
+        """Get or create the Gmail API backend"""
+        if self._backend is None:
             await self._authenticate()
-        return self.service
+        return self._backend
 
     async def _authenticate(self):
-        """Authenticate and create Gmail API service"""
-        creds = None
-        
-        # Load existing token
-        if os.path.exists(self.token_path):
-            try:
-                creds = Credentials.from_authorized_user_file(self.token_path, SCOPES)
-            except Exception as e:
-                print(f"Error loading credentials: {e}")
-        
-        # If there are no (valid) credentials available, let the user log in
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
+        """Authenticate and create Gmail API backend"""
+        await asyncio.to_thread(self._build_backend)
+
+    def _build_backend(self):
+        """Load credentials and build the Gmail API backend (blocking; run in a thread)"""
+        from google.oauth2.credentials import Credentials
+
+        with self._auth_lock:
+            if self._backend is not None:
+                return
+            creds = None
+
+            # Load existing token
+            if os.path.exists(self.token_path):
                 try:
-                    creds.refresh(Request())
-                except Exception as e:
-                    print(f"Error refreshing credentials: {e}")
-                    creds = None
+                    creds = Credentials.from_authorized_user_file(self.token_path, SCOPES)
+                except Exception:
+                    logger.exception("Error loading credentials", extra={'path': self.token_path})
             
-            if not creds:
-                raise Exception(
-                    "Gmail not authenticated. Please use /gmail/auth/url to get authorization URL, "
-                    "then use /gmail/auth/callback with the authorization code."
-                )
+            # If there are no (valid) credentials available, let the user log in
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    try:
+                        creds = self._refresh_credentials(creds)
+                    except Exception:
+                        logger.exception("Error refreshing credentials")
+                        creds = None
+
+                if not creds:
+                    raise Exception(
+                        "Gmail not authenticated. Please use /gmail/auth/url to get authorization URL, "
+                        "then use /gmail/auth/callback with the authorization code."
+                    )
             
-            # Save the credentials for the next run
-            with open(self.token_path, 'w') as token:
-                token.write(creds.to_json())
-        
+            self._install_credentials(creds)
+
+    def _install_credentials(self, creds: "Credentials"):
+        """Build the configured backend around these credentials"""
         self._credentials = creds
-        self.service = build('gmail', 'v1', credentials=creds)
+        if self.backend_name == 'httpx':
+            from services.gmail_async_client import AsyncGmailClient
+            self._backend = AsyncGmailClient(token_provider=self._access_token)
+        else:
+            from googleapiclient.discovery import build
+            self.service = build(
+                'gmail', 'v1',
+                http=self._transport.authorized_http(creds),
+                cache_discovery=False
+            )
+            self._backend = DiscoveryBackend(self.service, self._execute_sync)
+
+    def use_service(self, service):
+        """Use an already built googleapiclient service (or a compatible fake)"""
+        self.service = service
+        self._backend = DiscoveryBackend(service, self._execute_sync)
+
+    def use_backend(self, backend):
+        """Use a ready-made backend, e.g. an AsyncGmailClient pointed at a mock server"""
+        self._backend = backend
+
+    async def _access_token(self) -> str:
+        """Current access token, refreshed (once across workers) when expired"""
+        creds = self._credentials
+        if not creds.valid:
+            await asyncio.to_thread(self._refresh_credentials, creds)
+        return creds.token
+
+    def warm_up(self) -> bool:
+        """Import the Google client and build the API client ahead of the first request"""
+        try:
+            self._build_backend()
+            return True
+        except Exception as e:
+            logger.info("Gmail warm-up skipped: %s", e)
+            return False
 
     async def is_authenticated(self) -> bool:
         """Check if Gmail is authenticated"""
+        # Reading the token and refreshing it (cross-worker lock, network) block
+        return await asyncio.to_thread(self._check_authenticated)
+
+    def _check_authenticated(self) -> bool:
+        """Load the saved token and refresh it if expired (blocking; run in a thread)"""
+        from google.oauth2.credentials import Credentials
+
         try:
             if os.path.exists(self.token_path):
                 creds = Credentials.from_authorized_user_file(self.token_path, SCOPES)
@@ -78,38 +200,86 @@ class GmailService:
                     return True
                 elif creds and creds.expired and creds.refresh_token:
                     try:
-                        creds.refresh(Request())
-                        with open(self.token_path, 'w') as token:
-                            token.write(creds.to_json())
+                        self._refresh_credentials(creds)
                         return True
-                    except:
+                    except Exception:
                         return False
             return False
-        except:
+        except Exception:
             return False
 
+    def _refresh_credentials(self, creds: "Credentials") -> "Credentials":
+        """
+        Refresh an expired token once across all workers.
+
+        Workers serialize on a shared lock; whoever gets it second finds the
+        token file already refreshed and adopts that token instead of
+        refreshing again. creds is updated in place, so HTTP clients already
+        bound to it pick up the new token.
+        """
+        from google.oauth2.credentials import Credentials
+
+        with self._refresh_lock, get_shared_store().lock('gmail-token-refresh', timeout=30):
+            if creds.valid:
+                return creds
+            if os.path.exists(self.token_path):
+                try:
+                    latest = Credentials.from_authorized_user_file(self.token_path, SCOPES)
+                    if latest and latest.valid:
+                        creds.token = latest.token
+                        creds.expiry = latest.expiry
+                        return creds
+                except Exception:
+                    pass
+
+            creds.refresh(self._transport.auth_request())
+            with open(self.token_path, 'w') as token:
+                token.write(creds.to_json())
+            return creds
+
+    def _execute_sync(self, request, num_retries: int = 0):
+        """Run a googleapiclient request over this thread's pooled connection"""
+        creds = self._credentials
+        if creds is None:
+            return request.execute(num_retries=num_retries)
+        if not creds.valid and creds.refresh_token:
+            self._refresh_credentials(creds)
+        return request.execute(http=self._transport.authorized_http(creds), num_retries=num_retries)
+
     def _get_credentials_data(self) -> dict:
-        """Get credentials data from file or environment variable"""
+        """
+        Get OAuth client config from the environment variable or the file.
+
+        Parsed once; the file is only re-read when its mtime or size changes.
+        """
         # First try environment variable
         if self.credentials_json:
-            try:
-                return json.loads(self.credentials_json)
-            except json.JSONDecodeError:
-                pass
+            if self._env_client_config is None:
+                try:
+                    self._env_client_config = json.loads(self.credentials_json)
+                except json.JSONDecodeError:
+                    self._env_client_config = {}
+            if self._env_client_config:
+                return self._env_client_config
         
         # Fall back to file
-        if os.path.exists(self.credentials_path):
+        try:
+            stat = os.stat(self.credentials_path)
+        except OSError:
+            return None
+        fingerprint = (stat.st_mtime_ns, stat.st_size)
+        if self._file_client_config is None or self._file_client_config[0] != fingerprint:
             try:
                 with open(self.credentials_path, 'r') as f:
-                    return json.load(f)
+                    data = json.load(f)
             except Exception:
-                pass
-        
-        return None
+                data = None
+            self._file_client_config = (fingerprint, data)
+        return self._file_client_config[1]
     
-    def _detect_client_type(self) -> str:
-        """Detect OAuth client type from credentials file"""
-        creds_data = self._get_credentials_data()
+    def _detect_client_type(self, creds_data: Optional[dict] = None) -> str:
+        """Detect OAuth client type from credentials data"""
+        creds_data = creds_data or self._get_credentials_data()
         if not creds_data:
             return 'installed'  # Default
         
@@ -121,9 +291,32 @@ class GmailService:
         else:
             # Default to installed for backward compatibility
             return 'installed'
+
+    def _build_flow(self, creds_data: dict, redirect_uri: Optional[str] = None,
+                    code_verifier: Optional[str] = None):
+        """OAuth flow for the configured client type"""
+        from google_auth_oauthlib.flow import InstalledAppFlow, Flow
+
+        # PKCE: authorization_url() generates a verifier unless one is given
+        pkce = {'code_verifier': code_verifier, 'autogenerate_code_verifier': code_verifier is None}
+        if self._detect_client_type(creds_data) == 'installed':
+            # Desktop/Installed app flow
+            flow = InstalledAppFlow.from_client_config(creds_data, SCOPES, **pkce)
+            flow.redirect_uri = 'urn:ietf:wg:oauth:2.0:oob'
+        else:
+            # Web application flow - use Railway redirect by default
+            flow = Flow.from_client_config(creds_data, SCOPES, **pkce)
+            flow.redirect_uri = redirect_uri or 'https://web-production-5b9f.up.railway.app/oauth2callback'
+        return flow
     
-    async def get_authorization_url(self) -> str:
-        """Get OAuth authorization URL"""
+    async def get_authorization_url(self) -> Tuple[str, str]:
+        """
+        Get OAuth authorization URL and its state.
+
+        The flow's state and PKCE code verifier are kept in the shared store
+        for OAUTH_FLOW_TTL seconds, so whichever worker receives the callback
+        can finish the exchange. The callback has to bring the state back.
+        """
         creds_data = self._get_credentials_data()
         if not creds_data:
             raise Exception(
@@ -131,42 +324,60 @@ class GmailService:
                 "or provide credentials.json file. Download OAuth 2.0 credentials from Google Cloud Console."
             )
         
-        client_type = self._detect_client_type()
+        flow = self._build_flow(creds_data)
+        auth_url, state = flow.authorization_url(prompt='consent', access_type='offline')
         
-        # Create flow from credentials data (not file)
-        if client_type == 'installed':
-            # Desktop/Installed app flow
-            flow = InstalledAppFlow.from_client_config(creds_data, SCOPES)
-            flow.redirect_uri = 'urn:ietf:wg:oauth:2.0:oob'  # For installed apps
-        else:
-            # Web application flow - use Railway redirect
-            flow = Flow.from_client_config(creds_data, SCOPES)
-            # Use Railway redirect URI
-            flow.redirect_uri = 'https://web-production-5b9f.up.railway.app/oauth2callback'
-        
-        auth_url, _ = flow.authorization_url(prompt='consent', access_type='offline')
-        return auth_url
+        pending = {'state': state, 'code_verifier': flow.code_verifier, 'redirect_uri': flow.redirect_uri}
+        get_shared_store().set(f"oauth-flow:{state}", pending, ttl=self.oauth_flow_ttl)
+        return auth_url, state
 
-    async def handle_oauth_callback(self, code: str, redirect_uri: Optional[str] = None):
+    def _take_pending_flow(self, state: Optional[str]) -> dict:
+        """
+        Claim the in-flight flow for state; each is usable once. Without its
+        PKCE verifier the code can't be exchanged, so an unknown or expired
+        state raises ValueError.
+        """
+        store = get_shared_store()
+        pending = store.get(f"oauth-flow:{state}") if state else None
+        if pending is None:
+            raise ValueError("Authorization expired or not recognised. Restart from /gmail/auth/url.")
+        store.delete(f"oauth-flow:{state}")
+        return pending
+
+    async def handle_oauth_callback(self, code: str, state: Optional[str]):
         """Handle OAuth callback and store credentials"""
         creds_data = self._get_credentials_data()
         if not creds_data:
             raise Exception("Credentials not found. Please set GOOGLE_CREDENTIALS environment variable or provide credentials.json file.")
         
-        client_type = self._detect_client_type()
+        pending = self._take_pending_flow(state)
+        flow = self._build_flow(creds_data, pending['redirect_uri'], pending['code_verifier'])
         
-        # Create flow from credentials data (not file)
-        if client_type == 'installed':
-            # Desktop/Installed app flow
-            flow = InstalledAppFlow.from_client_config(creds_data, SCOPES)
-            flow.redirect_uri = 'urn:ietf:wg:oauth:2.0:oob'
-        else:
-            # Web application flow
-            flow = Flow.from_client_config(creds_data, SCOPES)
-            # Use provided redirect_uri or default to Railway URL
-            flow.redirect_uri = redirect_uri or 'https://web-production-5b9f.up.railway.app/oauth2callback'
-        
-        # Fetch token
+        # Token exchange and file write are blocking; keep them off the event loop
+        previous = self._backend
+        await asyncio.to_thread(self._exchange_code, flow, code)
+        self._reads.clear()
+        if previous is not None and previous is not self._backend:
+            self._retire_backend(previous)
+
+    def _retire_backend(self, backend):
+        """
+        Close a replaced backend's connections once requests still running on
+        it have had time to finish (GOOGLE_HTTP_TIMEOUT)
+        """
+        async def close_later():
+            await asyncio.sleep(float(os.getenv('GOOGLE_HTTP_TIMEOUT', '30')))
+            try:
+                await backend.aclose()
+            except Exception:
+                logger.exception("Error closing the previous Gmail client")
+
+        task = asyncio.create_task(close_later())
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    def _exchange_code(self, flow, code: str):
+        """Fetch the token, save it and build the backend (blocking; run in a thread)"""
         flow.fetch_token(code=code)
         creds = flow.credentials
         
@@ -174,146 +385,778 @@ class GmailService:
         with open(self.token_path, 'w') as token:
             token.write(creds.to_json())
         
-        self._credentials = creds
-        self.service = build('gmail', 'v1', credentials=creds)
+        with self._auth_lock:
+            self._install_credentials(creds)
 
     async def get_messages(self, max_results: int = 10, query: Optional[str] = None) -> List[dict]:
         """Get Gmail messages"""
-        service = await self._get_service()
+        query_key = ' '.join(query.split()) if query else ''
+        key = ('messages', max_results, query_key)
+        try:
+            return await self._reads.do(key, lambda: self._fetch_messages(max_results, query_key, key))
+        except deadlines.DeadlineExceeded:
+            # The shared fetch carries on for other callers; answer with what it has so far
+            ids, fetched = self._listing_progress.get(key, ([], {}))
+            partial = [fetched[message_id] for message_id in ids if fetched.get(message_id)]
+            raise deadlines.DeadlineExceeded(partial=partial,
+                                             missing=len(ids) - len(fetched) if ids else max_results)
+
+    async def _fetch_messages(self, max_results: int, query: str, key=None) -> List[dict]:
+        """Fetch a page of messages with their details"""
+        backend = await self._get_backend()
         
         try:
             # Build query
             query_str = query if query else ''
             
             # Get message list
-            results = service.users().messages().list(
-                userId='me',
-                maxResults=max_results,
-                q=query_str
-            ).execute()
-            
-            messages = results.get('messages', [])
-            
-            # Get full message details
-            message_list = []
-            for msg in messages:
-                message = await self._get_message_details(service, msg['id'])
-                if message:
-                    message_list.append(message)
+            with span("gmail.upstream.messages.list"):
+                results = await deadlines.within(backend.call(
+                    'messages.list',
+                    userId='me',
+                    maxResults=max_results,
+                    q=query_str
+                ))
             
-            return message_list
-        except HttpError as error:
+            message_ids = [msg['id'] for msg in results.get('messages', [])]
+            fetched = {}
+            if key is not None:
+                self._listing_progress[key] = (message_ids, fetched)
+            return await self._fetch_details(backend, message_ids, fetched)
+        except GmailApiError as error:
+            raise Exception(f"An error occurred: {error}")
+        finally:
+            if key is not None:
+                self._listing_progress.pop(key, None)
+
+    async def _fetch_details(self, backend, message_ids: List[str],
+                             fetched: Optional[dict] = None) -> List[dict]:
+        """
+        Fetch message details, a bounded number at a time; each one is also
+        recorded in fetched (by id) as it arrives.
+
+        Under a request deadline, fetches still running when the budget runs
+        out are cancelled and DeadlineExceeded carries the ones that finished.
+        """
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
+        fetched = {} if fetched is None else fetched
+
+        async def fetch(message_id):
+            async with semaphore:
+                fetched[message_id] = await self._get_message_details(backend, message_id)
+                return fetched[message_id]
+
+        tasks = [asyncio.ensure_future(fetch(message_id)) for message_id in message_ids]
+        if not tasks:
+            return []
+        try:
+            _, pending = await asyncio.wait(tasks, timeout=deadlines.budget())
+        finally:
+            for task in tasks:
+                task.cancel()
+        details = [task.result() for task in tasks if task.done() and not task.cancelled()]
+        if pending:
+            raise deadlines.DeadlineExceeded(partial=[message for message in details if message],
+                                             missing=len(pending))
+        return [message for message in details if message]
+
+    async def get_messages_by_ids(self, message_ids: List[str]) -> List[dict]:
+        """Get details for specific messages; missing ones are skipped"""
+        backend = await self._get_backend()
+        return await self._fetch_details(backend, message_ids)
+
+    async def get_profile(self) -> dict:
+        """Get the mailbox profile (address, totals, current history id)"""
+        backend = await self._get_backend()
+        try:
+            with span("gmail.upstream.getProfile"):
+                return await backend.call('getProfile', userId='me')
+        except GmailApiError as error:
             raise Exception(f"An error occurred: {error}")
 
-    async def _get_message_details(self, service, message_id: str) -> Optional[dict]:
+    async def list_history(self, start_history_id: str) -> Tuple[List[str], str]:
+        """
+        Ids of messages added since start_history_id, and the latest history id.
+
+        Raises GmailApiError (status 404) when start_history_id is too old and
+        the caller has to resync from scratch.
+        """
+        backend = await self._get_backend()
+        added: List[str] = []
+        history_id = start_history_id
+        page_token = None
+        while True:
+            with span("gmail.upstream.history.list"):
+                page = await backend.call(
+                    'history.list',
+                    userId='me',
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded'],
+                    pageToken=page_token
+                )
+            for record in page.get('history', []):
+                for item in record.get('messagesAdded', []):
+                    if item['message']['id'] not in added:
+                        added.append(item['message']['id'])
+            history_id = page.get('historyId', history_id)
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return added, history_id
+
+    async def _get_message_details(self, backend, message_id: str) -> Optional[dict]:
         """Get detailed message information"""
+        cached = self.message_cache.get(message_id)
+        if cached is not None:
+            return cached
         try:
-            message = service.users().messages().get(
-                userId='me',
-                id=message_id,
-                format='full'
-            ).execute()
+            with span("gmail.upstream.messages.get"):
+                message = await backend.call(
+                    'messages.get',
+                    userId='me',
+                    id=message_id,
+                    format='full'
+                )
             
             # Extract headers
             headers = message['payload'].get('headers', [])
             subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
             from_email = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
             to_emails = [h['value'] for h in headers if h['name'] == 'To']
+            cc_emails = [h['value'] for h in headers if h['name'] == 'Cc']
             date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
             
             # Extract body
-            body = self._extract_body(message['payload'])
+            with span("gmail.decode_body"):
+                body, raw_size = self._normalized_body(message['payload'])
+                attachments = self._attachment_parts(message['payload'])
             
-            return {
+            details = {
                 'id': message['id'],
                 'thread_id': message['threadId'],
                 'from_email': from_email,
                 'to': to_emails,
+                'cc': cc_emails,
                 'subject': subject,
                 'body': body,
                 'date': date,
-                'snippet': message.get('snippet', '')
+                'snippet': message.get('snippet', ''),
+                'label_ids': message.get('labelIds', []),
+                'body_raw_size': raw_size,
+                'body_size': len(body.encode('utf-8')),
+                'attachments': attachments
             }
-        except Exception as e:
-            print(f"Error getting message details: {e}")
+            self.message_cache.put(details)
+            return details
+        except Exception:
+            # One unreadable message shouldn't fail a whole listing; it is skipped, but logged
+            log_limited(logger, logging.ERROR, 'message-details', "Error getting message details",
+                        exc_info=True, extra={'message_id': message_id})
             return None
 
-    def _extract_body(self, payload: dict) -> str:
-        """Extract email body from payload"""
-        body = ""
-        
-        if 'parts' in payload:
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/plain':
-                    data = part['body'].get('data')
-                    if data:
-                        body = base64.urlsafe_b64decode(data).decode('utf-8')
-                        break
-                elif part['mimeType'] == 'text/html' and not body:
-                    data = part['body'].get('data')
-                    if data:
-                        body = base64.urlsafe_b64decode(data).decode('utf-8')
-        else:
-            if payload['mimeType'] == 'text/plain':
-                data = payload['body'].get('data')
-                if data:
-                    body = base64.urlsafe_b64decode(data).decode('utf-8')
-        
-        return body
+    def _extract_body(self, payload: dict) -> Tuple[str, bool]:
+        """Extract the email body from a payload: (text, is_html), plain text preferred"""
+        html = None
+        stack = [payload]
+        while stack:
+            part = stack.pop(0)
+            if part.get('parts'):
+                stack[:0] = part['parts']
+                continue
+            data = part.get('body', {}).get('data')
+            if not data or part.get('filename'):
+                continue
+            if part['mimeType'] == 'text/plain':
+                return base64.urlsafe_b64decode(data).decode('utf-8', 'replace'), False
+            if part['mimeType'] == 'text/html' and html is None:
+                html = base64.urlsafe_b64decode(data).decode('utf-8', 'replace')
+        return (html, True) if html is not None else ('', False)
+
+    def _attachment_parts(self, payload: dict) -> List[dict]:
+        """Metadata of every attachment in a payload (the data itself isn't fetched)"""
+        attachments = []
+        stack = [payload]
+        while stack:
+            part = stack.pop(0)
+            stack[:0] = part.get('parts', [])
+            attachment_id = part.get('body', {}).get('attachmentId')
+            if part.get('filename') and attachment_id:
+                attachments.append({
+                    'attachment_id': attachment_id,
+                    'filename': part['filename'],
+                    'mime_type': part.get('mimeType', 'application/octet-stream'),
+                    'size': part['body'].get('size', 0)
+                })
+        return attachments
+
+    def _normalized_body(self, payload: dict) -> Tuple[str, int]:
+        """
+        Plain-text body and the raw body size in bytes: HTML becomes text,
+        and with trim_replies set quoted replies and signatures are trimmed.
+        """
+        raw, is_html = self._extract_body(payload)
+        text = html_to_text(raw, trim_quotes=self.trim_replies) if is_html else raw
+        if self.trim_replies:
+            text = clean_reply_text(text)
+
+        return text, len(raw.encode('utf-8'))
 
     async def get_message(self, message_id: str) -> dict:
         """Get a specific message by ID"""
-        service = await self._get_service()
-        message = await self._get_message_details(service, message_id)
+        message_id = message_id.strip()
+        return await self._reads.do(('message', message_id), lambda: self._fetch_message(message_id))
+
+    async def _fetch_message(self, message_id: str) -> dict:
+        """Fetch a single message's details"""
+        backend = await self._get_backend()
+        message = await self._get_message_details(backend, message_id)
         if not message:
             raise Exception(f"Message {message_id} not found")
         return message
 
+    def _attachment_store(self):
+        if self._attachments is None:
+            from services.attachment_store import AttachmentStore
+            self._attachments = AttachmentStore(get_shared_store())
+        return self._attachments
+
+    async def get_attachment(self, message_id: str, attachment_id: str) -> dict:
+        """
+        Download an attachment into the disk cache (once) and return its entry:
+        path, size, sha256, filename and mime_type.
+        """
+        store = self._attachment_store()
+        entry = store.lookup(message_id, attachment_id)
+        if entry is None:
+            entry = await self._reads.do(
+                ('attachment', message_id, attachment_id),
+                lambda: self._fetch_attachment(message_id, attachment_id)
+            )
+        return dict(entry, path=store.path_for(entry['sha256']))
+
+    async def _fetch_attachment(self, message_id: str, attachment_id: str) -> dict:
+        """Fetch attachment data and its metadata, and write it to the disk cache"""
+        backend = await self._get_backend()
+        try:
+            with span("gmail.upstream.messages.attachments.get"):
+                attachment, message = await asyncio.gather(
+                    backend.call('messages.attachments.get', userId='me',
+                                 messageId=message_id, id=attachment_id),
+                    self.get_message(message_id)
+                )
+        except GmailApiError as error:
+            raise Exception(f"An error occurred: {error}")
+
+        info = next((a for a in message['attachments'] if a['attachment_id'] == attachment_id), None)
+        # Gmail may issue a fresh attachment id per fetch; fall back to the only attachment
+        if info is None and len(message['attachments']) == 1:
+            info = message['attachments'][0]
+        filename = info['filename'] if info else attachment_id
+        mime_type = info['mime_type'] if info else 'application/octet-stream'
+
+        with span("gmail.attachment.store"):
+            return await asyncio.to_thread(
+                self._attachment_store().put_base64,
+                message_id, attachment_id, attachment.get('data', ''), filename, mime_type
+            )
+
+    async def get_labels(self, refresh: bool = False) -> dict:
+        """All labels with message/thread total and unread counts"""
+        store = get_shared_store()
+        if not refresh:
+            cached = store.get(LABELS_KEY)
+            if cached is not None:
+                return cached
+        return await self._reads.do(('labels',), self._fetch_labels)
+
+    async def _fetch_labels(self) -> dict:
+        """labels.list, then every labels.get in one batch for the counters"""
+        backend = await self._get_backend()
+        try:
+            with span("gmail.upstream.labels.list"):
+                listing = await backend.call('labels.list', userId='me')
+            with span("gmail.upstream.labels.get"):
+                details = await backend.batch([
+                    ('labels.get', {'userId': 'me', 'id': label['id']})
+                    for label in listing.get('labels', [])
+                ])
+        except GmailApiError as error:
+            raise Exception(f"An error occurred: {error}")
+        # A label deleted since the listing has no counters; any other failure
+        # would cache zeros, so it fails the whole read
+        failed = next((detail for detail in details
+                       if isinstance(detail, GmailApiError) and detail.status != 404), None)
+        if failed is not None:
+            raise Exception(f"An error occurred: {failed}")
+
+        labels = []
+        for label, detail in zip(listing.get('labels', []), details):
+            if isinstance(detail, GmailApiError):
+                detail = label
+            labels.append({
+                'id': label['id'],
+                'name': label.get('name', label['id']),
+                'type': label.get('type', 'user'),
+                'messages_total': detail.get('messagesTotal', 0),
+                'messages_unread': detail.get('messagesUnread', 0),
+                'threads_total': detail.get('threadsTotal', 0),
+                'threads_unread': detail.get('threadsUnread', 0)
+            })
+        result = {'labels': labels, 'cached_at': time.time()}
+        get_shared_store().set(LABELS_KEY, result, ttl=self.labels_ttl)
+        return result
+
+    def invalidate_labels(self):
+        """Drop cached label counters (after mutations or newly synced mail)"""
+        self._reads.forget(('labels',))
+        get_shared_store().delete(LABELS_KEY)
+
+    async def on_messages_synced(self, messages: List[dict], initial: bool):
+        """MailSync listener: new mail changes label counts"""
+        if messages:
+            self.invalidate_labels()
+
+    async def resolve_label_ids(self, labels: List[str]) -> List[str]:
+        """Map label names (case-insensitive) or ids to label ids"""
+        if not labels:
+            return []
+        known = (await self.get_labels())['labels']
+        by_id = {label['id'] for label in known}
+        by_name = {label['name'].lower(): label['id'] for label in known}
+        resolved = []
+        for label in labels:
+            if label in by_id or label.upper() in SYSTEM_LABELS:
+                resolved.append(label.upper() if label.upper() in SYSTEM_LABELS else label)
+            elif label.lower() in by_name:
+                resolved.append(by_name[label.lower()])
+            else:
+                raise Exception(f"Unknown label: {label}")
+        return resolved
+
+    async def resolve_message_ids(self, ids: Optional[List[str]] = None, query: Optional[str] = None,
+                                  max_messages: Optional[int] = None) -> List[str]:
+        """Explicit ids plus every message matching query (deduplicated, capped at max_messages)"""
+        limit = min(max_messages or self.bulk_max_messages, self.bulk_max_messages)
+        resolved = list(dict.fromkeys(message_id.strip() for message_id in ids or []))
+        if query and query.strip():
+            backend = await self._get_backend()
+            seen = set(resolved)
+            page_token = None
+            while len(resolved) < limit:
+                with span("gmail.upstream.messages.list"):
+                    page = await backend.call(
+                        'messages.list',
+                        userId='me',
+                        q=' '.join(query.split()),
+                        maxResults=min(500, limit - len(resolved)),
+                        pageToken=page_token
+                    )
+                for msg in page.get('messages', []):
+                    if msg['id'] not in seen:
+                        seen.add(msg['id'])
+                        resolved.append(msg['id'])
+                page_token = page.get('nextPageToken')
+                if not page_token:
+                    break
+        return resolved[:limit]
+
+    async def _batch_mutate(self, method: str, message_ids: List[str], **body) -> Tuple[dict, set]:
+        """
+        Run a batch mutation in chunks of 1000 ids (the API limit); returns
+        the aggregated outcome and the ids that succeeded.
+        """
+        backend = await self._get_backend()
+        chunks = [message_ids[i:i + BATCH_MUTATION_SIZE]
+                  for i in range(0, len(message_ids), BATCH_MUTATION_SIZE)]
+        semaphore = asyncio.Semaphore(4)
+
+        async def run(chunk):
+            async with semaphore:
+                try:
+                    with span(f"gmail.upstream.{method}"):
+                        await backend.call(method, userId='me', body=dict(body, ids=chunk))
+                    return chunk, None
+                except Exception as error:
+                    # One chunk failing (API error, timeout, dropped connection)
+                    # doesn't undo the others, which Gmail has already applied
+                    return chunk, str(error)
+
+        results = await asyncio.gather(*[run(chunk) for chunk in chunks])
+        succeeded = [message_id for chunk, error in results if error is None for message_id in chunk]
+        errors = [error for _, error in results if error is not None]
+        return {
+            'matched': len(message_ids),
+            'succeeded': len(succeeded),
+            'failed': len(message_ids) - len(succeeded),
+            'requests': len(chunks),
+            'errors': errors
+        }, set(succeeded)
+
+    async def modify_messages(self, ids: Optional[List[str]] = None, query: Optional[str] = None,
+                              add_label_ids: Optional[List[str]] = None,
+                              remove_label_ids: Optional[List[str]] = None,
+                              max_messages: Optional[int] = None) -> dict:
+        """Add/remove labels on many messages with messages.batchModify"""
+        add_label_ids = await self.resolve_label_ids(add_label_ids or [])
+        remove_label_ids = await self.resolve_label_ids(remove_label_ids or [])
+        message_ids = await self.resolve_message_ids(ids, query, max_messages)
+        result, succeeded = await self._batch_mutate(
+            'messages.batchModify', message_ids,
+            addLabelIds=add_label_ids, removeLabelIds=remove_label_ids
+        )
+        self._apply_label_changes(succeeded, add_label_ids, remove_label_ids)
+        self.invalidate_labels()
+        return result
+
+    async def trash_messages(self, ids: Optional[List[str]] = None, query: Optional[str] = None,
+                             permanent: bool = False, max_messages: Optional[int] = None) -> dict:
+        """
+        Move many messages to the trash (batchModify adding TRASH), or delete
+        them for good with messages.batchDelete when permanent is set.
+        Permanent deletion needs the full https://mail.google.com/ scope.
+        """
+        message_ids = await self.resolve_message_ids(ids, query, max_messages)
+        if permanent:
+            result, succeeded = await self._batch_mutate('messages.batchDelete', message_ids)
+            self._drop_cached_messages(succeeded)
+        else:
+            result, succeeded = await self._batch_mutate(
+                'messages.batchModify', message_ids,
+                addLabelIds=['TRASH'], removeLabelIds=['INBOX']
+            )
+            self._apply_label_changes(succeeded, ['TRASH'], ['INBOX'])
+        self.invalidate_labels()
+        return result
+
+    def _apply_label_changes(self, message_ids: set, add: List[str], remove: List[str]):
+        """Patch label ids of cached messages to match a successful batchModify"""
+        def relabel(message):
+            if message['id'] not in message_ids:
+                return message
+            labels = [label for label in message.get('label_ids', []) if label not in remove]
+            return dict(message, label_ids=labels + [label for label in add if label not in labels])
+
+        for message_id in message_ids:
+            self.message_cache.relabel(message_id, add, remove)
+        hidden = {'TRASH', 'SPAM'} & set(add)
+
+        def patch(key, value):
+            if key[0] == 'message':
+                return relabel(value)
+            if key[0] == 'messages':
+                # Cached queries may no longer match; keep only unfiltered listings
+                if key[2]:
+                    return None
+                # Plain listings leave out trash and spam
+                return [relabel(message) for message in value
+                        if not (hidden and message['id'] in message_ids)]
+            return value
+
+        self._reads.update(patch)
+
+    def _drop_cached_messages(self, message_ids: set):
+        """Forget deleted messages everywhere they may be cached"""
+        for message_id in message_ids:
+            self.message_cache.discard(message_id)
+
+        def patch(key, value):
+            if key[0] == 'message':
+                return None if value['id'] in message_ids else value
+            if key[0] == 'messages':
+                return [message for message in value if message['id'] not in message_ids]
+            if key[0] == 'attachment':
+                return None if key[1] in message_ids else value
+            return value
+
+        self._reads.update(patch)
+
     async def send_email(self, to: str, subject: str, body: str,
                         cc: Optional[List[str]] = None,
-                        bcc: Optional[List[str]] = None) -> str:
-        """Send an email"""
-        service = await self._get_service()
+                        bcc: Optional[List[str]] = None,
+                        html: Optional[str] = None,
+                        attachments: Optional[List[dict]] = None) -> str:
+        """
+        Send an email.
+
+        html adds a text/html alternative. Each attachment is a dict with
+        'filename', optional 'mime_type' and one of 'path', 'file' or 'data',
+        or a 'message_id' + 'attachment_id' pair to forward an attachment
+        of an existing message.
+        """
+        backend = await self._get_backend()
         
         try:
-            # Create message
-            message = MIMEText(body)
-            message['to'] = to
-            message['subject'] = subject
-            
-            if cc:
-                message['cc'] = ', '.join(cc)
-            if bcc:
-                message['bcc'] = ', '.join(bcc)
-            
-            # Encode message
-            raw_message = base64.urlsafe_b64encode(
-                message.as_bytes()
-            ).decode('utf-8')
-            
-            # Send message
-            send_message = service.users().messages().send(
-                userId='me',
-                body={'raw': raw_message}
-            ).execute()
+            if not html and not attachments:
+                # Create message
+                message = MIMEText(body)
+                message['to'] = to
+                message['subject'] = subject
+
+                if cc:
+                    message['cc'] = ', '.join(cc)
+                if bcc:
+                    message['bcc'] = ', '.join(bcc)
+
+                # Encode message
+                raw_message = base64.urlsafe_b64encode(
+                    message.as_bytes()
+                ).decode('utf-8')
+
+                # Send message
+                with span("gmail.upstream.messages.send"):
+                    send_message = await backend.call(
+                        'messages.send',
+                        userId='me',
+                        body={'raw': raw_message}
+                    )
+            else:
+                attachments = await self._resolve_attachments(attachments or [])
+                with span("gmail.build_mime"):
+                    path, size = await asyncio.to_thread(
+                        write_message, to, subject, body, html, cc, bcc, attachments
+                    )
+                try:
+                    send_message = await self._send_file(backend, path, size)
+                finally:
+                    os.unlink(path)
             
+            self._reads.clear()
+            self._mark_sent_here(send_message['id'])
             return send_message['id']
-        except HttpError as error:
+        except GmailApiError as error:
+            raise Exception(f"An error occurred: {error}")
+
+    def _mark_sent_here(self, message_id: str):
+        get_shared_store().set(SENT_HERE_PREFIX + message_id, True, ttl=SENT_HERE_TTL)
+
+    def was_sent_here(self, message_id: str) -> bool:
+        """Whether a message was sent through this service (in the last week)"""
+        return bool(get_shared_store().get(SENT_HERE_PREFIX + message_id))
+
+    async def _resolve_attachments(self, attachments: List[dict]) -> List[dict]:
+        """Point attachments forwarded from existing messages at their cached files"""
+        resolved = []
+        for attachment in attachments:
+            if attachment.get('message_id') and attachment.get('attachment_id'):
+                cached = await self.get_attachment(attachment['message_id'], attachment['attachment_id'])
+                attachment = {
+                    'filename': attachment.get('filename') or cached['filename'],
+                    'mime_type': attachment.get('mime_type') or cached['mime_type'],
+                    'path': cached['path']
+                }
+            resolved.append(attachment)
+        return resolved
+
+    async def _send_file(self, backend, path: str, size: int, thread_id: Optional[str] = None) -> dict:
+        """
+        Send a message file: small ones inline with messages.send, larger ones
+        through the resumable media upload so memory stays flat.
+        """
+        metadata = {'threadId': thread_id} if thread_id else {}
+        if size <= self.simple_send_max_bytes:
+            with open(path, 'rb') as f:
+                raw_message = base64.urlsafe_b64encode(f.read()).decode('utf-8')
+            with span("gmail.upstream.messages.send"):
+                return await backend.call('messages.send', userId='me', body=dict(metadata, raw=raw_message))
+        with span("gmail.upstream.messages.send_media"):
+            return await backend.send_media(path, metadata)
+
+    # Drafts: content is cached in the shared store under 'draft:<id>' so edits
+    # can be diffed locally and only changed drafts go upstream
+    def _draft_fingerprint(self, draft: dict) -> str:
+        content = {field: draft.get(field) for field in DRAFT_FIELDS}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _draft_raw(self, draft: dict) -> str:
+        """Base64url RFC 822 message for a draft"""
+        path, _ = write_message(
+            draft.get('to') or '', draft.get('subject') or '', draft.get('body') or '',
+            draft.get('html'), draft.get('cc'), draft.get('bcc')
+        )
+        try:
+            with open(path, 'rb') as f:
+                return base64.urlsafe_b64encode(f.read()).decode('utf-8')
+        finally:
+            os.unlink(path)
+
+    def _cache_draft(self, draft: dict, result: dict) -> dict:
+        """Store a draft's content together with the ids Gmail assigned"""
+        message = result.get('message', {})
+        draft = dict(
+            draft,
+            id=result['id'],
+            message_id=message.get('id'),
+            thread_id=message.get('threadId', draft.get('thread_id')),
+            updated_at=time.time()
+        )
+        draft['fingerprint'] = self._draft_fingerprint(draft)
+        get_shared_store().set(DRAFT_PREFIX + draft['id'], draft)
+        return draft
+
+    async def create_draft(self, to: Optional[str] = None, subject: str = '', body: str = '',
+                           cc: Optional[List[str]] = None, bcc: Optional[List[str]] = None,
+                           html: Optional[str] = None, thread_id: Optional[str] = None) -> dict:
+        """Create a Gmail draft and cache its content"""
+        backend = await self._get_backend()
+        draft = {'to': to, 'subject': subject, 'body': body, 'cc': cc, 'bcc': bcc,
+                 'html': html, 'thread_id': thread_id}
+        message = {'raw': self._draft_raw(draft)}
+        if thread_id:
+            message['threadId'] = thread_id
+        try:
+            with span("gmail.upstream.drafts.create"):
+                result = await backend.call('drafts.create', userId='me', body={'message': message})
+        except GmailApiError as error:
+            raise Exception(f"An error occurred: {error}")
+        return dict(self._cache_draft(draft, result), changed=True)
+
+    async def update_draft(self, draft_id: str, **changes) -> dict:
+        """
+        Apply field changes (None means unchanged) to a draft. Gmail is only
+        called when the content actually differs from the cached copy.
+        """
+        draft = await self._get_cached_draft(draft_id)
+        updated = dict(draft, **{k: v for k, v in changes.items() if v is not None and k in DRAFT_FIELDS})
+        if self._draft_fingerprint(updated) == draft['fingerprint']:
+            return dict(draft, changed=False)
+
+        backend = await self._get_backend()
+        message = {'raw': self._draft_raw(updated)}
+        if updated.get('thread_id'):
+            message['threadId'] = updated['thread_id']
+        try:
+            with span("gmail.upstream.drafts.update"):
+                result = await backend.call('drafts.update', userId='me', id=draft_id,
+                                            body={'id': draft_id, 'message': message})
+        except GmailApiError as error:
+            raise self._draft_error(draft_id, error)
+        return dict(self._cache_draft(updated, result), changed=True)
+
+    async def _get_cached_draft(self, draft_id: str) -> dict:
+        """Cached draft content, loaded from Gmail on a miss"""
+        draft = get_shared_store().get(DRAFT_PREFIX + draft_id)
+        if draft is None:
+            backend = await self._get_backend()
+            try:
+                with span("gmail.upstream.drafts.get"):
+                    result = await backend.call('drafts.get', userId='me', id=draft_id, format='full')
+            except GmailApiError as error:
+                raise self._draft_error(draft_id, error)
+            draft = self._cache_draft(self._draft_from_message(result['message']), result)
+        return draft
+
+    def _draft_error(self, draft_id: str, error: GmailApiError) -> Exception:
+        """
+        The exception to raise for a failed draft call: KeyError when the
+        draft is gone (sent or deleted elsewhere), after dropping its cached copy.
+        """
+        if error.status == 404:
+            get_shared_store().delete(DRAFT_PREFIX + draft_id)
+            return KeyError(draft_id)
+        return Exception(f"An error occurred: {error}")
+
+    def _draft_from_message(self, message: dict) -> dict:
+        """Draft fields from a Gmail message resource"""
+        headers = {h['name'].lower(): h['value'] for h in message['payload'].get('headers', [])}
+        text, is_html = self._extract_body(message['payload'])
+        split = lambda value: [a.strip() for a in value.split(',')] if value else None
+        return {
+            'to': headers.get('to'),
+            'cc': split(headers.get('cc')),
+            'bcc': split(headers.get('bcc')),
+            'subject': headers.get('subject', ''),
+            'body': html_to_text(text, trim_quotes=False) if is_html else text,
+            'html': text if is_html else None,
+            'thread_id': message.get('threadId')
+        }
+
+    async def list_drafts(self, refresh: bool = False) -> List[dict]:
+        """
+        Drafts, newest first, from the cache. The cache is reconciled with
+        drafts.list first when refresh is set or the last reconcile is older
+        than drafts_ttl, so drafts made, edited, sent or deleted in Gmail show up.
+        """
+        store = get_shared_store()
+        if refresh or store.get(DRAFTS_SYNCED_KEY) is None:
+            await self._sync_drafts(store)
+        drafts = [draft for _, draft in store.items(DRAFT_PREFIX)]
+        return sorted(drafts, key=lambda draft: draft['updated_at'], reverse=True)
+
+    async def _sync_drafts(self, store):
+        """
+        Reconcile cached drafts with drafts.list: drafts gone upstream are
+        dropped, and new ones or ones whose message changed (edited in
+        Gmail) are fetched in one batch.
+        """
+        backend = await self._get_backend()
+        upstream = {}
+        page_token = None
+        try:
+            while True:
+                with span("gmail.upstream.drafts.list"):
+                    listing = await backend.call('drafts.list', userId='me', maxResults=500,
+                                                 pageToken=page_token)
+                for draft in listing.get('drafts', []):
+                    upstream[draft['id']] = draft.get('message', {}).get('id')
+                page_token = listing.get('nextPageToken')
+                if not page_token:
+                    break
+        except GmailApiError as error:
             raise Exception(f"An error occurred: {error}")
+        cached = {key[len(DRAFT_PREFIX):]: draft for key, draft in store.items(DRAFT_PREFIX)}
+        for draft_id in cached.keys() - upstream.keys():
+            store.delete(DRAFT_PREFIX + draft_id)
+        stale = sorted(draft_id for draft_id, message_id in upstream.items()
+                       if draft_id not in cached or cached[draft_id].get('message_id') != message_id)
+        if stale:
+            with span("gmail.upstream.drafts.get"):
+                results = await backend.batch([
+                    ('drafts.get', {'userId': 'me', 'id': draft_id, 'format': 'full'})
+                    for draft_id in stale
+                ])
+            for result in results:
+                if not isinstance(result, GmailApiError):
+                    self._cache_draft(self._draft_from_message(result['message']), result)
+        store.set(DRAFTS_SYNCED_KEY, time.time(), ttl=self.drafts_ttl)
+
+    async def send_draft(self, draft_id: str) -> str:
+        """Send a draft as is with one drafts.send call"""
+        backend = await self._get_backend()
+        try:
+            with span("gmail.upstream.drafts.send"):
+                message = await backend.call('drafts.send', userId='me', body={'id': draft_id})
+        except GmailApiError as error:
+            raise self._draft_error(draft_id, error)
+        get_shared_store().delete(DRAFT_PREFIX + draft_id)
+        self._reads.clear()
+        self.invalidate_labels()
+        self._mark_sent_here(message['id'])
+        return message['id']
+
+    async def delete_draft(self, draft_id: str):
+        """Delete a draft"""
+        backend = await self._get_backend()
+        try:
+            with span("gmail.upstream.drafts.delete"):
+                await backend.call('drafts.delete', userId='me', id=draft_id)
+        except GmailApiError as error:
+            if error.status != 404:
+                raise Exception(f"An error occurred: {error}")
+        get_shared_store().delete(DRAFT_PREFIX + draft_id)
 
     async def reply_to_email(self, thread_id: str, body: str,
                             in_reply_to: Optional[str] = None) -> str:
         """Reply to an email thread"""
-        service = await self._get_service()
+        backend = await self._get_backend()
         
         try:
             # Get original message to extract headers
-            original_message = service.users().messages().get(
+            original_message = await backend.call(
+                'messages.get',
                 userId='me',
                 id=thread_id,
                 format='metadata',
                 metadataHeaders=['From', 'Subject', 'Message-ID']
-            ).execute()
+            )
             
             headers = original_message['payload'].get('headers', [])
             from_email = next((h['value'] for h in headers if h['name'] == 'From'), '')
@@ -334,15 +1177,19 @@ class GmailService:
             ).decode('utf-8')
             
             # Send reply
-            send_message = service.users().messages().send(
-                userId='me',
-                body={
-                    'raw': raw_message,
-                    'threadId': thread_id
-                }
-            ).execute()
+            with span("gmail.upstream.messages.send"):
+                send_message = await backend.call(
+                    'messages.send',
+                    userId='me',
+                    body={
+                        'raw': raw_message,
+                        'threadId': thread_id
+                    }
+                )
             
+            self._reads.clear()
+            self._mark_sent_here(send_message['id'])
             return send_message['id']
-        except HttpError as error:
+        except GmailApiError as error:
             raise Exception(f"An error occurred: {error}")
 
@@ -0,0 +1,59 @@
+"""
+Google Transport - Pooled, keep-alive HTTP for Google API calls and OAuth refreshes
+"""
+import os
+import threading
+from typing import Optional
+
+
+class GoogleTransport:
+    """
+    Shared HTTP plumbing for the Gmail client.
+
+    httplib2 connections are not thread-safe, so each worker thread gets its
+    own long-lived authorized Http object; its connections stay open between
+    calls and TLS handshakes only happen once per thread. Token refreshes go
+    through one pooled requests.Session instead of a new session per refresh.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, pool_size: Optional[int] = None):
+        self.timeout = timeout or float(os.getenv('GOOGLE_HTTP_TIMEOUT', '30'))
+        self.pool_size = pool_size or int(os.getenv('GOOGLE_HTTP_POOL_SIZE', '16'))
+        self._local = threading.local()
+        self._session = None
+        self._auth_request = None
+        self._lock = threading.Lock()
+
+    def authorized_http(self, credentials):
+        """Return this thread's authorized httplib2 client for the given credentials"""
+        http = getattr(self._local, 'http', None)
+        if http is None or self._local.credentials is not credentials:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+
+            http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=self.timeout))
+            self._local.http = http
+            self._local.credentials = credentials
+        return http
+
+    def session(self):
+        """Return the pooled requests.Session shared by all threads"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def auth_request(self):
+        """Return a google-auth Request bound to the pooled session (for token refresh)"""
+        if self._auth_request is None:
+            from google.auth.transport.requests import Request
+
+            self._auth_request = Request(session=self.session())
+        return self._auth_request
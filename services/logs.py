@@ -0,0 +1,212 @@
+"""
+Logs - Queue-based structured (JSON) logging with request context
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+request_id_var: ContextVar[Optional[str]] = ContextVar('log_request_id', default=None)
+route_var: ContextVar[Optional[str]] = ContextVar('log_route', default=None)
+upstream_var: ContextVar[Optional[str]] = ContextVar('log_upstream', default=None)
+
+# LogRecord attributes that aren't user fields
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+LOGGER_NAME = 'gpt_backend'
+
+
+class ContextFilter(logging.Filter):
+    """Stamp records with the request id, route and upstream call of the caller"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.route = route_var.get()
+        record.upstream = upstream_var.get()
+        stats.count(record)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; extra= fields are included as they are"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread. Only the message is rendered here
+    (in the caller); tracebacks are kept apart so they stay a separate field.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogStats:
+    """Counts of records by level and logger, including suppressed ones"""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.suppressed: Counter = Counter()
+
+    def count(self, record: logging.LogRecord):
+        self.counts[(record.levelname, record.name)] += 1
+
+    def snapshot(self) -> Dict:
+        return {
+            'records': [{'level': level, 'logger': name, 'count': count}
+                        for (level, name), count in sorted(self.counts.items())],
+            'suppressed': dict(self.suppressed),
+        }
+
+
+stats = LogStats()
+
+
+class RateLimiter:
+    """
+    Lets one record per key through every `interval` seconds. The next
+    record let through carries how many were suppressed in between.
+    """
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval if interval is not None else float(os.getenv('LOG_RATE_LIMIT_SECONDS', '10'))
+        self._next: Dict[str, float] = {}
+        self._suppressed: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> Optional[int]:
+        """Number of records suppressed since the last one, or None to drop this one"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next.get(key, 0.0):
+                self._suppressed[key] += 1
+                stats.suppressed[key] += 1
+                return None
+            self._next[key] = now + self.interval
+            return self._suppressed.pop(key, 0)
+
+
+_limiter = RateLimiter()
+
+
+def log_limited(logger: logging.Logger, level: int, key: str, msg: str, *args, **kwargs):
+    """Log at most once per LOG_RATE_LIMIT_SECONDS for `key` (use on paths that can fail in a loop)"""
+    if not logger.isEnabledFor(level):
+        return
+    suppressed = _limiter.allow(key)
+    if suppressed is None:
+        return
+    if suppressed:
+        kwargs['extra'] = dict(kwargs.get('extra') or {}, suppressed=suppressed)
+    logger.log(level, msg, *args, **kwargs)
+
+
+def log_sampled(logger: logging.Logger, level: int, rate: float, msg: str, *args, **kwargs):
+    """Log a random `rate` fraction of calls (use on paths that run on every request)"""
+    if rate > 0 and logger.isEnabledFor(level) and (rate >= 1 or random.random() < rate):
+        kwargs['extra'] = dict(kwargs.get('extra') or {}, sample_rate=rate)
+        logger.log(level, msg, *args, **kwargs)
+
+
+UPSTREAM_SAMPLE_RATE = float(os.getenv('LOG_UPSTREAM_SAMPLE', '0.01'))
+_upstream_logger = logging.getLogger(f'{LOGGER_NAME}.upstream')
+
+
+@contextmanager
+def upstream_call(method: str):
+    """Tag logs with the Gmail method being called; log failures and a sample of timings"""
+    token = upstream_var.set(method)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        status = getattr(e, 'status', None)
+        log_limited(
+            _upstream_logger, logging.WARNING, f'upstream:{method}:{status}',
+            "Upstream call failed: %s", e,
+            extra={'status': status, 'duration_ms': round((time.perf_counter() - started) * 1000, 3)}
+        )
+        raise
+    else:
+        log_sampled(
+            _upstream_logger, logging.INFO, UPSTREAM_SAMPLE_RATE, "Upstream call",
+            extra={'duration_ms': round((time.perf_counter() - started) * 1000, 3)}
+        )
+    finally:
+        upstream_var.reset(token)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_pid: Optional[int] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging():
+    """
+    Route the app's loggers through a queue to a background thread that
+    formats and writes them, so logging never blocks the event loop on
+    stderr. Safe to call more than once (and again after a fork).
+    """
+    global _listener, _listener_pid
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+
+        stream = logging.StreamHandler(sys.stderr)
+        if os.getenv('LOG_FORMAT', 'json').lower() == 'text':
+            stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+        else:
+            stream.setFormatter(JsonFormatter())
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        handler = _QueueHandler(log_queue)
+        handler.addFilter(ContextFilter())
+
+        logger = logging.getLogger(LOGGER_NAME)
+        for old in list(logger.handlers):
+            logger.removeHandler(old)
+        logger.addHandler(handler)
+        logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener_pid = os.getpid()
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the app's namespace, e.g. get_logger('gmail')"""
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
@@ -0,0 +1,358 @@
+"""
+Mail Export - Resumable streaming export of a mailbox to mbox or gzipped JSONL
+"""
+import asyncio
+import base64
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from typing import List, Optional
+
+from services.deadlines import deadline_var
+from services.gmail_backends import GmailApiError
+from services.logs import get_logger
+from services.profiling import span
+
+logger = get_logger('mail_export')
+
+KEY_PREFIX = 'export:'
+FORMATS = {'mbox': '.mbox', 'jsonl': '.jsonl.gz'}
+# Messages fetched per batch request, and written out as they arrive
+CHUNK_SIZE = 100
+
+# mboxrd: body lines starting with "From " (after any '>') get one more '>'
+FROM_LINE = re.compile(rb'^(>*From )', re.MULTILINE)
+
+
+def _mbox_entry(message: dict, raw: bytes) -> bytes:
+    received = time.gmtime(int(message.get('internalDate', 0)) / 1000)
+    body = FROM_LINE.sub(rb'>\1', raw.replace(b'\r\n', b'\n'))
+    if not body.endswith(b'\n'):
+        body += b'\n'
+    return f"From {message['id']}@gmail {time.asctime(received)}\n".encode('ascii') + body + b'\n'
+
+
+def _jsonl_entry(message: dict) -> bytes:
+    record = {
+        'id': message['id'],
+        'thread_id': message.get('threadId'),
+        'label_ids': message.get('labelIds', []),
+        'internal_date': int(message.get('internalDate', 0)),
+        'size_estimate': message.get('sizeEstimate'),
+        'raw': message['raw'],
+    }
+    return json.dumps(record).encode('utf-8') + b'\n'
+
+
+class LeaseLost(Exception):
+    """Another worker took over the job (this one stalled past its lease)"""
+
+
+def _stopped(job: dict, status: str, error: Optional[str] = None) -> dict:
+    """A running job moved to a final state, with its run time added up"""
+    now = time.time()
+    return dict(job, status=status, error=error, resumed_at=None, finished_at=now,
+                elapsed=job['elapsed'] + now - (job.get('resumed_at') or now))
+
+
+class MailExport:
+    """
+    Export jobs that page through messages.list and fetch each page with
+    format='raw' through the batch API.
+
+    A page is fetched in batch-sized chunks, and each chunk is appended to
+    the output as soon as it arrives (for JSONL, as one gzip member, so the
+    file is always a valid multi-member gzip); only a few chunks are held
+    in memory at once. After the whole page the file is synced and the job
+    is checkpointed in the shared store: the next page token and the file
+    size. A resumed job truncates the file back to the last checkpoint and
+    carries on from that page, so nothing is written twice.
+
+    A job runs in the worker that started (or resumed) it, under a lease
+    renewed before every write. A worker that finds its lease taken stops
+    the job there and leaves it to the new owner. `watch` periodically
+    resumes jobs whose worker died; progress can be read from any worker.
+    """
+
+    def __init__(self, gmail_service, store, directory: Optional[str] = None,
+                 page_size: Optional[int] = None, concurrency: Optional[int] = None):
+        self.gmail_service = gmail_service
+        self.store = store
+        self.directory = directory or os.getenv(
+            'EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'gpt_backend_exports')
+        )
+        self.page_size = page_size or min(500, int(os.getenv('EXPORT_PAGE_SIZE', '250')))
+        self.concurrency = concurrency or int(os.getenv('EXPORT_CONCURRENCY', '4'))
+        self.lease = 120.0
+        self.resume_interval = float(os.getenv('EXPORT_RESUME_INTERVAL', str(self.lease)))
+        self._owner = f"export:{uuid.uuid4().hex}"
+        self._tasks = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = self.store.get(KEY_PREFIX + job_id)
+        return self._with_rates(job) if job else None
+
+    def list(self) -> List[dict]:
+        jobs = [self._with_rates(job) for _, job in self.store.items(KEY_PREFIX)]
+        return sorted(jobs, key=lambda job: job['created_at'], reverse=True)
+
+    def _with_rates(self, job: dict) -> dict:
+        elapsed = job['elapsed']
+        if job['status'] == 'running' and job.get('resumed_at'):
+            elapsed += time.time() - job['resumed_at']
+        estimate = job.get('estimated_total')
+        return dict(
+            job,
+            elapsed=round(elapsed, 3),
+            messages_per_second=round(job['exported'] / elapsed, 2) if elapsed else None,
+            bytes_per_second=round(job['bytes'] / elapsed, 1) if elapsed else None,
+            progress=round(min(job['exported'] / estimate, 1.0), 4) if estimate else None,
+        )
+
+    def start(self, export_format: str = 'jsonl', query: Optional[str] = None,
+              max_messages: Optional[int] = None) -> dict:
+        """Create an export job and start it in the background"""
+        if export_format not in FORMATS:
+            raise ValueError(f"Unknown format '{export_format}' (use mbox or jsonl)")
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'format': export_format,
+            'query': ' '.join(query.split()) if query else '',
+            'max_messages': max_messages,
+            'path': os.path.join(self.directory, job_id + FORMATS[export_format]),
+            'status': 'running',
+            'page_token': None,
+            'offset': 0,
+            'pages': 0,
+            'exported': 0,
+            'skipped': 0,
+            'bytes': 0,
+            'estimated_total': None,
+            'error': None,
+            'created_at': time.time(),
+            'resumed_at': time.time(),
+            'elapsed': 0.0,
+            'finished_at': None,
+        }
+        self.store.set(KEY_PREFIX + job_id, job)
+        self._spawn(job_id)
+        return self.get(job_id)
+
+    def resume(self, job_id: str) -> dict:
+        """Restart a failed or interrupted job from its last checkpoint"""
+        job = self.store.get(KEY_PREFIX + job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if job['status'] in ('done', 'cancelled'):
+            raise ValueError(f"Export {job_id} is {job['status']}")
+        if job_id in self._tasks:
+            return self.get(job_id)
+        if not self.store.try_acquire(KEY_PREFIX + job_id, lease=self.lease, owner=self._owner):
+            raise ValueError(f"Export {job_id} is running in another worker")
+        job.update(status='running', error=None, resumed_at=time.time())
+        self.store.set(KEY_PREFIX + job_id, job)
+        self._spawn(job_id)
+        return self.get(job_id)
+
+    def resume_interrupted(self):
+        """Pick up jobs left 'running' by a worker that died (their lease ran out)"""
+        for _, job in self.store.items(KEY_PREFIX):
+            if job['status'] == 'running' and job['id'] not in self._tasks:
+                try:
+                    self.resume(job['id'])
+                    logger.info("Resuming export", extra={'export_id': job['id'], 'exported': job['exported']})
+                except ValueError:
+                    pass
+
+    async def watch(self):
+        """Resume interrupted jobs now and every `resume_interval` seconds"""
+        while True:
+            try:
+                self.resume_interrupted()
+            except Exception:
+                logger.exception("Could not resume interrupted exports")
+            await asyncio.sleep(self.resume_interval)
+
+    def cancel(self, job_id: str) -> bool:
+        """Stop a job after its current page; the partial file is kept"""
+        def mark(job):
+            if job is None:
+                return None, False
+            return _stopped(job, 'cancelled') if job['status'] == 'running' else job, True
+
+        return self.store.update(KEY_PREFIX + job_id, mark)
+
+    def _spawn(self, job_id: str):
+        self.store.try_acquire(KEY_PREFIX + job_id, lease=self.lease, owner=self._owner)
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str):
+        # The job outlives the request that started it, and its deadline
+        deadline_var.set(None)
+        key = KEY_PREFIX + job_id
+        try:
+            backend = await self.gmail_service._get_backend()
+            job = self.store.get(key)
+            await asyncio.to_thread(self._truncate, job['path'], job['offset'])
+            if job['estimated_total'] is None and not job['query']:
+                # A whole-mailbox export knows its size up front
+                with span("gmail.upstream.getProfile"):
+                    profile = await backend.call('getProfile', userId='me')
+                total = profile.get('messagesTotal')
+                self._update(key, estimated_total=min(total, job['max_messages'] or total))
+            while True:
+                job = self.store.get(key)
+                if job['status'] != 'running':
+                    return
+                self._hold(key)
+                limit = job['max_messages']
+                remaining = limit - job['exported'] - job['skipped'] if limit else self.page_size
+                if remaining <= 0:
+                    break
+
+                with span("export.page"):
+                    page = await self._list_page(backend, job, min(self.page_size, remaining))
+                    exported, skipped = await self._export_page(backend, key, job, page.get('messages', []))
+                    offset = await asyncio.to_thread(self._sync, job['path'])
+                self._hold(key)
+
+                checkpoint = {
+                    'page_token': page.get('nextPageToken'),
+                    'offset': offset,
+                    'pages': job['pages'] + 1,
+                    'exported': job['exported'] + exported,
+                    'skipped': job['skipped'] + skipped,
+                    'bytes': offset,
+                }
+                if job['estimated_total'] is None:
+                    estimate = page.get('resultSizeEstimate')
+                    checkpoint['estimated_total'] = min(estimate, limit) if estimate and limit else estimate or limit
+                self._update(key, **checkpoint)
+                if not checkpoint['page_token']:
+                    break
+            self._finish(key, 'done')
+            logger.info("Export finished", extra={'export_id': job_id})
+        except LeaseLost:
+            # The job stays 'running'; the worker holding the lease carries it on
+            logger.warning("Export taken over by another worker", extra={'export_id': job_id})
+        except asyncio.CancelledError:
+            self._finish(key, 'failed', error='Interrupted')
+            raise
+        except Exception as e:
+            logger.exception("Export failed", extra={'export_id': job_id})
+            self._finish(key, 'failed', error=str(e))
+        finally:
+            self.store.release(key, self._owner)
+
+    async def _list_page(self, backend, job: dict, size: int) -> dict:
+        params = {'userId': 'me', 'maxResults': size}
+        if job['page_token']:
+            params['pageToken'] = job['page_token']
+        if job['query']:
+            params['q'] = job['query']
+        with span("gmail.upstream.messages.list"):
+            return await backend.call('messages.list', **params)
+
+    def _hold(self, key: str):
+        """Renew the job's lease, or raise LeaseLost if another worker has it"""
+        if not self.store.try_acquire(key, lease=self.lease, owner=self._owner):
+            raise LeaseLost(key)
+
+    async def _export_page(self, backend, key: str, job: dict, refs: List[dict]):
+        """
+        Fetch a page chunk by chunk, `concurrency` chunks at a time, and
+        append each chunk once it has arrived. Returns (exported, skipped).
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        write_lock = asyncio.Lock()
+        counts = [0, 0]
+
+        async def export_chunk(chunk):
+            async with semaphore:
+                messages, skipped = await self._fetch_raw(backend, chunk)
+                data = self._encode(job['format'], messages)
+                async with write_lock:
+                    self._hold(key)
+                    await asyncio.to_thread(self._append, job['path'], data)
+            counts[0] += len(messages)
+            counts[1] += skipped
+
+        tasks = [asyncio.ensure_future(export_chunk(refs[i:i + CHUNK_SIZE]))
+                 for i in range(0, len(refs), CHUNK_SIZE)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # A failed chunk fails the page; don't leave the others writing
+            for task in tasks:
+                task.cancel()
+        return counts[0], counts[1]
+
+    async def _fetch_raw(self, backend, refs: List[dict]):
+        """
+        Raw messages for a chunk, in list order. Failed fetches are retried
+        once; messages deleted meanwhile (404) are skipped, other errors
+        fail the page so the job can be resumed from it later.
+        """
+        ids = [ref['id'] for ref in refs]
+        results = {}
+        pending = ids
+        for attempt in range(2):
+            with span("gmail.upstream.messages.get"):
+                fetched = await backend.batch(
+                    [('messages.get', {'userId': 'me', 'id': message_id, 'format': 'raw'}) for message_id in pending]
+                )
+            results.update(zip(pending, fetched))
+            pending = [message_id for message_id in pending
+                       if isinstance(results[message_id], GmailApiError) and results[message_id].status != 404]
+            if not pending:
+                break
+            await asyncio.sleep(1 + attempt)
+        if pending:
+            raise results[pending[0]]
+        messages = [results[message_id] for message_id in ids if not isinstance(results[message_id], GmailApiError)]
+        return messages, len(ids) - len(messages)
+
+    def _encode(self, export_format: str, messages: List[dict]) -> bytes:
+        if export_format == 'mbox':
+            return b''.join(
+                _mbox_entry(message, base64.urlsafe_b64decode(message['raw'] + '=' * (-len(message['raw']) % 4)))
+                for message in messages
+            )
+        # One gzip member per chunk keeps the file valid after every write
+        return gzip.compress(b''.join(_jsonl_entry(message) for message in messages), compresslevel=6) if messages else b''
+
+    def _append(self, path: str, data: bytes):
+        """Append a chunk (made durable by _sync at the end of the page)"""
+        with open(path, 'ab') as out:
+            out.write(data)
+
+    def _sync(self, path: str) -> int:
+        """Make the page durable before it is checkpointed; returns the file size"""
+        with open(path, 'ab') as out:
+            os.fsync(out.fileno())
+            return out.tell()
+
+    def _truncate(self, path: str, offset: int):
+        """Drop anything written after the last checkpoint"""
+        with open(path, 'ab') as out:
+            out.truncate(offset)
+
+    def _update(self, key: str, **fields):
+        def apply(job):
+            return dict(job, **fields), None
+        self.store.update(key, apply)
+
+    def _finish(self, key: str, status: str, error: Optional[str] = None):
+        def apply(job):
+            if job is None or job['status'] != 'running':
+                return job, None
+            return _stopped(job, status, error), None
+        self.store.update(key, apply)
@@ -0,0 +1,331 @@
+"""
+Mail Rules - Header/body predicates and actions run over newly synced mail
+"""
+import re
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.logs import get_logger
+
+logger = get_logger('mail_rules')
+
+RULES_KEY = 'mail-rules'
+NOTIFICATIONS_KEY = 'mail-rules:notifications'
+
+FIELDS = ('from', 'to', 'subject', 'body', 'snippet', 'label', 'attachment')
+ADDRESS_FIELDS = ('from', 'to')
+OPS = ('contains', 'equals', 'regex', 'domain')
+ACTIONS = ('label', 'remove_label', 'archive', 'mark_read', 'forward', 'notify', 'start_app')
+
+# Your own outgoing mail and drafts only match rules that ask for them with a label condition
+OWN_MAIL_LABELS = frozenset({'SENT', 'DRAFT'})
+
+# Label changes made by the simple actions: (add, remove)
+LABEL_ACTIONS = {
+    'archive': ((), ('INBOX',)),
+    'mark_read': ((), ('UNREAD',)),
+}
+
+
+def _field_values(message: dict, field: str) -> List[str]:
+    """Lower-cased values of a message field (several for to/labels/attachments)"""
+    if field == 'from':
+        return [message.get('from_email', '').lower()]
+    if field == 'to':
+        return [value.lower() for value in message.get('to', [])]
+    if field == 'label':
+        return [label.lower() for label in message.get('label_ids', [])]
+    if field == 'attachment':
+        return [a['filename'].lower() for a in message.get('attachments', [])]
+    return [(message.get(field) or '').lower()]
+
+
+def _pattern(condition: dict) -> str:
+    """Regex source for one condition, matched against a lower-cased value"""
+    value = condition['value'].lower()
+    op = condition.get('op', 'contains')
+    if op == 'contains':
+        return re.escape(value)
+    if op == 'equals':
+        return '^' + re.escape(value) + '$'
+    if op == 'domain':
+        # The address ends where the domain can't continue (a comma, space, '>' or the end)
+        return '@' + re.escape(value.lstrip('@')) + r'(?![\w.-])'
+    return condition['value']
+
+
+class CompiledRules:
+    """
+    All enabled rules compiled together.
+
+    Every condition becomes a regex, and the literal conditions (contains,
+    equals, domain) on each field are also joined into one alternation, so
+    a field is scanned once to tell whether any rule can match at all. User
+    regexes stay separate checks: joined, their inline flags and group
+    numbers would break. Most mail matches no rule, so those scans are all
+    it costs; the individual conditions are only checked for fields that hit.
+    """
+
+    def __init__(self, rules: List[dict]):
+        self.rules = [rule for rule in rules if rule.get('enabled', True)]
+        self.conditions: List[Tuple[str, re.Pattern, bool]] = []
+        self.rule_conditions: List[List[int]] = []
+        # Per rule, which of SENT/DRAFT it explicitly matches on
+        self.rule_scopes: List[frozenset] = []
+        literals: Dict[str, List[str]] = {}
+        regexes: Dict[str, List[re.Pattern]] = {}
+        for rule in self.rules:
+            indexes = []
+            for condition in rule['conditions']:
+                is_regex = condition.get('op') == 'regex'
+                pattern = re.compile(_pattern(condition), re.IGNORECASE if is_regex else 0)
+                self.conditions.append((condition['field'], pattern, condition.get('negate', False)))
+                indexes.append(len(self.conditions) - 1)
+                if condition.get('negate', False):
+                    continue
+                if is_regex:
+                    regexes.setdefault(condition['field'], []).append(pattern)
+                else:
+                    literals.setdefault(condition['field'], []).append(pattern.pattern)
+            self.rule_conditions.append(indexes)
+            self.rule_scopes.append(frozenset(
+                condition['value'].upper() for condition in rule['conditions']
+                if condition['field'] == 'label' and not condition.get('negate', False)
+                and condition['value'].upper() in OWN_MAIL_LABELS
+            ))
+        # Per field: the joined literal alternation (if any), then each user regex
+        self.prefilters: Dict[str, List[re.Pattern]] = {
+            field: ([re.compile('|'.join(literals[field]))] if field in literals else []) + regexes.get(field, [])
+            for field in set(literals) | set(regexes)
+        }
+        # Negated conditions can make a rule match without any field hitting
+        self.always_check = any(
+            (any if rule.get('match') == 'any' else all)(self.conditions[i][2] for i in indexes)
+            for rule, indexes in zip(self.rules, self.rule_conditions)
+        )
+
+    def match(self, message: dict) -> List[dict]:
+        """Rules that match a message, in order (stopping after a rule with stop=True)"""
+        own = OWN_MAIL_LABELS.intersection(message.get('label_ids', ()))
+        values = {}
+        hit = False
+        for field, patterns in self.prefilters.items():
+            values[field] = _field_values(message, field)
+            if any(pattern.search(value) for pattern in patterns for value in values[field]):
+                hit = True
+                break
+        if not hit and not self.always_check:
+            return []
+
+        results: Dict[int, bool] = {}
+
+        def check(index: int) -> bool:
+            if index not in results:
+                field, pattern, negate = self.conditions[index]
+                if field not in values:
+                    values[field] = _field_values(message, field)
+                found = any(pattern.search(value) for value in values[field])
+                results[index] = found != negate
+            return results[index]
+
+        matched = []
+        for rule, indexes, scope in zip(self.rules, self.rule_conditions, self.rule_scopes):
+            if own and not own <= scope:
+                continue
+            combine = any if rule.get('match') == 'any' else all
+            if indexes and combine(check(i) for i in indexes):
+                matched.append(rule)
+                if rule.get('stop'):
+                    break
+        return matched
+
+
+def validate_rule(rule: dict):
+    """Raise ValueError if a rule is malformed"""
+    if not rule.get('conditions'):
+        raise ValueError("A rule needs at least one condition")
+    if not rule.get('actions'):
+        raise ValueError("A rule needs at least one action")
+    if rule.get('match', 'all') not in ('all', 'any'):
+        raise ValueError("match must be 'all' or 'any'")
+    for condition in rule['conditions']:
+        if condition.get('field') not in FIELDS:
+            raise ValueError(f"Unknown field '{condition.get('field')}' (use one of {', '.join(FIELDS)})")
+        op = condition.get('op', 'contains')
+        if op not in OPS:
+            raise ValueError(f"Unknown op '{op}' (use one of {', '.join(OPS)})")
+        if op == 'domain' and condition['field'] not in ADDRESS_FIELDS:
+            raise ValueError("The domain op only applies to from and to")
+        if not condition.get('value'):
+            raise ValueError("Conditions need a value")
+        if op == 'regex':
+            try:
+                re.compile(condition['value'])
+            except re.error as e:
+                raise ValueError(f"Invalid regex '{condition['value']}': {e}")
+    for action in rule['actions']:
+        kind = action.get('type')
+        if kind not in ACTIONS:
+            raise ValueError(f"Unknown action '{kind}' (use one of {', '.join(ACTIONS)})")
+        if kind in ('label', 'remove_label') and not action.get('label'):
+            raise ValueError(f"The {kind} action needs a label")
+        if kind == 'forward' and not action.get('to'):
+            raise ValueError("The forward action needs a 'to' address")
+        if kind == 'start_app' and not action.get('app'):
+            raise ValueError("The start_app action needs an app")
+
+
+class MailRules:
+    """
+    Rules stored in the shared store and run by MailSync over each batch of
+    newly synced messages (the initial seed of old mail is skipped).
+
+    The compiled matcher is rebuilt only when the rules change. Label
+    changes from all matches in a batch are grouped, so each distinct
+    change is one batchModify call however many messages it covers.
+    Forwards are one send each; notifications are kept in a short list
+    clients can read without touching Gmail; start_app goes through the
+    app control service.
+    """
+
+    def __init__(self, gmail_service, store, app_control: Optional[Callable] = None,
+                 notification_limit: int = 100):
+        self.gmail_service = gmail_service
+        self.store = store
+        self.app_control = app_control
+        self.notification_limit = notification_limit
+        self._compiled: Optional[CompiledRules] = None
+        self._compiled_version = None
+
+    def list(self) -> List[dict]:
+        return (self.store.get(RULES_KEY) or {}).get('rules', [])
+
+    async def add(self, rule: dict) -> dict:
+        """Validate a rule, resolve its label names to ids and save it"""
+        validate_rule(rule)
+        rule = dict(rule, id=uuid.uuid4().hex[:12], created_at=time.time())
+        rule['match'] = rule.get('match') or 'all'
+        for action in rule['actions']:
+            if action.get('label'):
+                action['label_id'] = (await self.gmail_service.resolve_label_ids([action['label']]))[0]
+        for condition in rule['conditions']:
+            if condition['field'] == 'label' and condition.get('op', 'contains') in ('contains', 'equals'):
+                # Messages carry label ids, so match on the id (exactly)
+                condition['value'] = (await self.gmail_service.resolve_label_ids([condition['value']]))[0]
+                condition['op'] = 'equals'
+
+        def append(current):
+            current = current or {'version': 0, 'rules': []}
+            return {'version': current['version'] + 1, 'rules': current['rules'] + [rule]}, None
+
+        self.store.update(RULES_KEY, append)
+        return rule
+
+    def remove(self, rule_id: str) -> bool:
+        def drop(current):
+            current = current or {'version': 0, 'rules': []}
+            rules = [rule for rule in current['rules'] if rule['id'] != rule_id]
+            return {'version': current['version'] + 1, 'rules': rules}, len(rules) != len(current['rules'])
+
+        return self.store.update(RULES_KEY, drop)
+
+    def compiled(self) -> CompiledRules:
+        """The matcher for the current rules, recompiled only after a change"""
+        stored = self.store.get(RULES_KEY) or {'version': 0, 'rules': []}
+        if self._compiled is None or stored['version'] != self._compiled_version:
+            self._compiled = CompiledRules(stored['rules'])
+            self._compiled_version = stored['version']
+        return self._compiled
+
+    async def on_messages(self, messages: List[dict], initial: bool):
+        """MailSync listener: run the rules over new messages"""
+        if not messages or initial:
+            return
+        compiled = self.compiled()
+        if not compiled.rules:
+            return
+
+        label_changes: Dict[Tuple[tuple, tuple], List[str]] = {}
+        followups = []
+        for message in messages:
+            if self.gmail_service.was_sent_here(message['id']):
+                # Our own sends (forwards included) would otherwise re-trigger rules
+                continue
+            for rule in compiled.match(message):
+                for action in rule['actions']:
+                    kind = action['type']
+                    if kind in LABEL_ACTIONS:
+                        change = LABEL_ACTIONS[kind]
+                    elif kind == 'label':
+                        change = ((action['label_id'],), ())
+                    elif kind == 'remove_label':
+                        change = ((), (action['label_id'],))
+                    else:
+                        followups.append((rule, action, message))
+                        continue
+                    label_changes.setdefault(change, []).append(message['id'])
+
+        for (add, remove), message_ids in label_changes.items():
+            try:
+                await self.gmail_service.modify_messages(
+                    ids=list(dict.fromkeys(message_ids)),
+                    add_label_ids=list(add),
+                    remove_label_ids=list(remove)
+                )
+            except Exception:
+                logger.exception("Rule label change failed", extra={'add': add, 'remove': remove})
+
+        for rule, action, message in followups:
+            try:
+                await self._run_action(rule, action, message)
+            except Exception:
+                logger.exception("Rule action failed", extra={
+                    'rule_id': rule['id'], 'action': action['type'], 'message_id': message['id']
+                })
+
+    async def _run_action(self, rule: dict, action: dict, message: dict):
+        kind = action['type']
+        if kind == 'forward':
+            await self.gmail_service.send_email(
+                to=action['to'],
+                subject=f"Fwd: {message['subject']}",
+                body=(
+                    "---------- Forwarded message ---------\n"
+                    f"From: {message['from_email']}\n"
+                    f"Date: {message['date']}\n"
+                    f"Subject: {message['subject']}\n"
+                    f"To: {', '.join(message['to'])}\n\n"
+                    f"{message['body']}"
+                )
+            )
+        elif kind == 'notify':
+            self._notify(rule, message)
+        elif kind == 'start_app' and self.app_control is not None:
+            result = await self.app_control().start_app(action['app'])
+            if not result['success']:
+                raise Exception(result['message'])
+
+    def _notify(self, rule: dict, message: dict):
+        notification = {
+            'id': uuid.uuid4().hex[:12],
+            'at': time.time(),
+            'rule_id': rule['id'],
+            'rule': rule.get('name', ''),
+            'message_id': message['id'],
+            'thread_id': message['thread_id'],
+            'from_email': message['from_email'],
+            'subject': message['subject'],
+            'snippet': message.get('snippet', ''),
+        }
+
+        def push(current):
+            return ((current or []) + [notification])[-self.notification_limit:], None
+
+        self.store.update(NOTIFICATIONS_KEY, push)
+        logger.info("Rule notification", extra={'rule_id': rule['id'], 'message_id': message['id']})
+
+    def notifications(self, since: Optional[float] = None) -> List[dict]:
+        """Recent notifications, newest last, optionally only those after `since` (a timestamp)"""
+        items = self.store.get(NOTIFICATIONS_KEY) or []
+        return [item for item in items if since is None or item['at'] > since]
@@ -0,0 +1,115 @@
+"""
+Mail Sync - Background incremental sync of new Gmail messages
+"""
+import asyncio
+import contextvars
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, List, Optional
+
+from services.gmail_backends import GmailApiError
+from services.logs import get_logger
+from services.profiling import span
+
+Listener = Callable[[List[dict], bool], Awaitable[None]]
+
+logger = get_logger('mail_sync')
+
+HISTORY_KEY = 'mail-sync:history-id'
+SYNCED_AT_KEY = 'mail-sync:synced-at'
+
+
+class MailSync:
+    """
+    Polls the Gmail history API and hands newly added messages to listeners.
+
+    The first run (or a run after the history id expired) seeds listeners
+    with the most recent messages, flagged initial=True. The history id
+    lives in the shared store and one worker at a time holds the 'mail-sync'
+    lease, so a multi-worker deployment still makes one set of upstream calls.
+    """
+
+    def __init__(self, gmail_service, store, interval: Optional[float] = None,
+                 seed_count: Optional[int] = None):
+        self.gmail_service = gmail_service
+        self.store = store
+        self.interval = interval or float(os.getenv('MAIL_SYNC_INTERVAL', '60'))
+        self.seed_count = seed_count or int(os.getenv('MAIL_SYNC_SEED', '50'))
+        self._listeners: List[Listener] = []
+        self._owner = f"mail-sync:{uuid.uuid4().hex}"
+        self._pass: Optional[asyncio.Task] = None
+
+    def add_listener(self, listener: Listener):
+        """Register an async callback(messages, initial) for synced messages"""
+        self._listeners.append(listener)
+
+    @property
+    def history_id(self) -> Optional[str]:
+        return self.store.get(HISTORY_KEY)
+
+    @property
+    def synced_at(self) -> Optional[float]:
+        return self.store.get(SYNCED_AT_KEY)
+
+    async def sync_once(self) -> int:
+        """Run one sync pass; return the number of messages handed to listeners"""
+        history_id = self.history_id
+        initial = history_id is None
+        if not initial:
+            try:
+                message_ids, latest = await self.gmail_service.list_history(history_id)
+            except GmailApiError as error:
+                if error.status != 404:
+                    raise
+                # History id too old: start over from the current mailbox
+                initial = True
+        if initial:
+            profile = await self.gmail_service.get_profile()
+            latest = profile['historyId']
+            with span("mail_sync.seed"):
+                messages = await self.gmail_service.get_messages(max_results=self.seed_count)
+        else:
+            messages = await self.gmail_service.get_messages_by_ids(message_ids) if message_ids else []
+
+        for listener in self._listeners:
+            # One failing listener must not hold back the others or the history id
+            try:
+                await listener(messages, initial)
+            except Exception:
+                logger.exception("Mail sync listener failed", extra={'listener': getattr(listener, '__qualname__', None)})
+        self.store.set(HISTORY_KEY, str(latest))
+        self.store.set(SYNCED_AT_KEY, time.time())
+        return len(messages)
+
+    def start_pass(self) -> asyncio.Task:
+        """
+        This worker's running sync pass, or a new one. A pass only syncs if
+        it gets the 'mail-sync' lease, so requests that want fresh data can't
+        start a second pass here or on another worker.
+        """
+        if self._pass is None or self._pass.done():
+            # A fresh context, so a pass started by a request doesn't inherit its deadline
+            self._pass = asyncio.get_running_loop().create_task(
+                self._leased_pass(), context=contextvars.Context()
+            )
+        return self._pass
+
+    async def _leased_pass(self) -> bool:
+        if not self.store.try_acquire('mail-sync', lease=self.interval * 3, owner=self._owner):
+            return False
+        try:
+            await self.sync_once()
+        except Exception:
+            logger.exception("Mail sync failed")
+        return True
+
+    async def run(self):
+        """Sync forever, every `interval` seconds, while holding the shared lease"""
+        while True:
+            await self.start_pass()
+            await asyncio.sleep(self.interval)
+
+    def release(self):
+        """Give up the sync lease so another worker can take over"""
+        self.store.release('mail-sync', self._owner)
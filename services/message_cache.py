@@ -0,0 +1,176 @@
+"""
+Message Cache - Byte-budgeted in-process LRU of compact message records
+"""
+import os
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Bodies shorter than this aren't worth compressing
+COMPRESS_MIN_BYTES = 256
+# Rough cost of one entry in the LRU's own bookkeeping (hash slot + linked-list node)
+ENTRY_OVERHEAD = 100
+
+
+def _intern_all(values) -> tuple:
+    return tuple(sys.intern(value) for value in values)
+
+
+class MessageRecord:
+    """
+    One message in the shape GmailService returns, packed tightly: slots
+    instead of a dict, header strings interned (senders, recipients,
+    subjects and labels repeat across a mailbox), tuples instead of lists
+    and the body zlib-compressed.
+    """
+
+    __slots__ = ('id', 'thread_id', 'from_email', 'to', 'cc', 'subject', 'date', 'snippet',
+                 'label_ids', 'body', 'compressed', 'body_raw_size', 'body_size',
+                 'attachments', 'cached_at', 'nbytes')
+
+    def __init__(self, message: dict):
+        self.id = message['id']
+        self.thread_id = sys.intern(message['thread_id'])
+        self.from_email = sys.intern(message['from_email'])
+        self.to = _intern_all(message['to'])
+        self.cc = _intern_all(message.get('cc', []))
+        self.subject = sys.intern(message['subject'])
+        self.date = message['date']
+        self.snippet = message.get('snippet', '')
+        self.label_ids = _intern_all(message.get('label_ids', []))
+        encoded = message['body'].encode('utf-8')
+        self.compressed = len(encoded) >= COMPRESS_MIN_BYTES
+        self.body = zlib.compress(encoded, 1) if self.compressed else encoded
+        self.body_raw_size = message.get('body_raw_size')
+        self.body_size = message.get('body_size', len(encoded))
+        self.attachments = tuple(
+            (a['attachment_id'], sys.intern(a['filename']), sys.intern(a['mime_type']), a['size'])
+            for a in message.get('attachments', [])
+        )
+        self.cached_at = time.monotonic()
+        self.nbytes = self._measure()
+
+    def _measure(self) -> int:
+        """Approximate memory held by this record (interned strings count in full)"""
+        size = ENTRY_OVERHEAD + sys.getsizeof(self) + sys.getsizeof(self.body) + sys.getsizeof(self.id)
+        for value in (self.thread_id, self.from_email, self.subject, self.date, self.snippet):
+            size += sys.getsizeof(value)
+        size += sys.getsizeof(self.to) + sum(sys.getsizeof(value) for value in self.to)
+        size += sys.getsizeof(self.cc) + sum(sys.getsizeof(value) for value in self.cc)
+        size += sys.getsizeof(self.label_ids)
+        size += sum(sys.getsizeof(a) + sys.getsizeof(a[0]) for a in self.attachments)
+        return size
+
+    def to_dict(self) -> dict:
+        body = zlib.decompress(self.body) if self.compressed else self.body
+        return {
+            'id': self.id,
+            'thread_id': self.thread_id,
+            'from_email': self.from_email,
+            'to': list(self.to),
+            'cc': list(self.cc),
+            'subject': self.subject,
+            'body': body.decode('utf-8'),
+            'date': self.date,
+            'snippet': self.snippet,
+            'label_ids': list(self.label_ids),
+            'body_raw_size': self.body_raw_size,
+            'body_size': self.body_size,
+            'attachments': [
+                {'attachment_id': aid, 'filename': filename, 'mime_type': mime_type, 'size': size}
+                for aid, filename, mime_type, size in self.attachments
+            ],
+        }
+
+
+class MessageCache:
+    """
+    Hot tier of message records for one worker, evicting least recently
+    used records once their total size passes max_bytes. Message content
+    never changes, but labels do, so records expire after ttl seconds.
+
+    Used from the event loop only (no awaits inside), so it needs no lock.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            float(os.getenv('GMAIL_HOT_CACHE_MB', '32')) * 1024 * 1024
+        )
+        self.ttl = ttl if ttl is not None else float(os.getenv('GMAIL_HOT_CACHE_TTL', '300'))
+        self._records: "OrderedDict[str, MessageRecord]" = OrderedDict()
+        self.bytes = 0
+        self.body_bytes = 0
+        self.body_stored_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, message_id: str) -> Optional[dict]:
+        record = self._records.get(message_id)
+        if record is not None and time.monotonic() - record.cached_at > self.ttl:
+            self._remove(message_id)
+            self.expirations += 1
+            record = None
+        if record is None:
+            self.misses += 1
+            return None
+        self._records.move_to_end(message_id)
+        self.hits += 1
+        return record.to_dict()
+
+    def put(self, message: dict):
+        if self.max_bytes <= 0:
+            return
+        record = MessageRecord(message)
+        if record.nbytes > self.max_bytes:
+            return
+        self._remove(record.id)
+        self._records[record.id] = record
+        self._account(record, 1)
+        while self.bytes > self.max_bytes:
+            _, oldest = self._records.popitem(last=False)
+            self._account(oldest, -1)
+            self.evictions += 1
+
+    def relabel(self, message_id: str, add: List[str], remove: List[str]):
+        """Apply a label change to a cached record in place"""
+        record = self._records.get(message_id)
+        if record is not None:
+            labels = [label for label in record.label_ids if label not in remove]
+            record.label_ids = _intern_all(labels + [label for label in add if label not in labels])
+
+    def discard(self, message_id: str):
+        self._remove(message_id)
+
+    def clear(self):
+        self._records.clear()
+        self.bytes = self.body_bytes = self.body_stored_bytes = 0
+
+    def _remove(self, message_id: str):
+        record = self._records.pop(message_id, None)
+        if record is not None:
+            self._account(record, -1)
+
+    def _account(self, record: MessageRecord, sign: int):
+        self.bytes += sign * record.nbytes
+        self.body_bytes += sign * record.body_size
+        self.body_stored_bytes += sign * len(record.body)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._records),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'body_bytes': self.body_bytes,
+            'body_stored_bytes': self.body_stored_bytes,
+        }
@@ -0,0 +1,114 @@
+"""
+MIME Builder - Writes outgoing messages to disk without holding attachments in memory
+"""
+import base64
+import io
+import mimetypes
+import os
+import tempfile
+import uuid
+from email.message import EmailMessage
+from email.policy import SMTP
+from typing import BinaryIO, List, Optional, Tuple
+
+# Raw bytes per base64 line (57 bytes -> 76 characters), lines written per read
+LINE_BYTES = 57
+READ_LINES = 1024
+
+
+def _open_source(attachment: dict) -> Tuple[BinaryIO, bool]:
+    """File object for an attachment given as 'path', 'file' or 'data'; (file, should close)"""
+    if attachment.get('path'):
+        return open(attachment['path'], 'rb'), True
+    if attachment.get('file') is not None:
+        attachment['file'].seek(0)
+        return attachment['file'], False
+    return io.BytesIO(attachment.get('data') or b''), True
+
+
+def _write_base64(source: BinaryIO, out: BinaryIO):
+    """Base64 encode a stream in 76-character lines, a block at a time"""
+    while True:
+        block = source.read(LINE_BYTES * READ_LINES)
+        if not block:
+            return
+        for start in range(0, len(block), LINE_BYTES):
+            out.write(base64.b64encode(block[start:start + LINE_BYTES]) + b'\r\n')
+
+
+def _header_bytes(message: EmailMessage) -> bytes:
+    """Just the header block of a message, ending with the blank line"""
+    return b''.join(SMTP.fold_binary(name, value) for name, value in message.items()) + b'\r\n'
+
+
+def _body_part(text: str, html: Optional[str]) -> EmailMessage:
+    part = EmailMessage(policy=SMTP)
+    part.set_content(text)
+    if html:
+        part.add_alternative(html, subtype='html')
+    return part
+
+
+def write_message(to: str, subject: str, text: str, html: Optional[str] = None,
+                  cc: Optional[List[str]] = None, bcc: Optional[List[str]] = None,
+                  attachments: Optional[List[dict]] = None,
+                  headers: Optional[dict] = None) -> Tuple[str, int]:
+    """
+    Write an RFC 822 message to a temporary file; return (path, size).
+
+    The text and optional HTML body form a multipart/alternative part.
+    Attachments (dicts with 'filename', optional 'mime_type', and one of
+    'path', 'file' or 'data') are base64 encoded straight from their source
+    into the file, so memory use doesn't grow with their size. The caller
+    deletes the file.
+    """
+    head = EmailMessage(policy=SMTP)
+    head['To'] = to
+    if cc:
+        head['Cc'] = ', '.join(cc)
+    if bcc:
+        head['Bcc'] = ', '.join(bcc)
+    head['Subject'] = subject
+    for name, value in (headers or {}).items():
+        head[name] = value
+
+    fd, path = tempfile.mkstemp(suffix='.eml')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            body = _body_part(text, html)
+            if not attachments:
+                for name, value in head.items():
+                    body[name] = value
+                out.write(body.as_bytes(policy=SMTP))
+                return path, out.tell()
+
+            boundary = f"=_part_{uuid.uuid4().hex}"
+            head['MIME-Version'] = '1.0'
+            head['Content-Type'] = f'multipart/mixed; boundary="{boundary}"'
+            out.write(_header_bytes(head))
+            out.write(f"--{boundary}\r\n".encode('ascii'))
+            out.write(body.as_bytes(policy=SMTP))
+
+            for attachment in attachments:
+                filename = attachment.get('filename') or 'attachment'
+                mime_type = (attachment.get('mime_type')
+                             or mimetypes.guess_type(filename)[0]
+                             or 'application/octet-stream')
+                part = EmailMessage(policy=SMTP)
+                part['Content-Type'] = mime_type
+                part.add_header('Content-Disposition', 'attachment', filename=filename)
+                part['Content-Transfer-Encoding'] = 'base64'
+                out.write(f"\r\n--{boundary}\r\n".encode('ascii'))
+                out.write(_header_bytes(part))
+                source, should_close = _open_source(attachment)
+                try:
+                    _write_base64(source, out)
+                finally:
+                    if should_close:
+                        source.close()
+
+            out.write(f"\r\n--{boundary}--\r\n".encode('ascii'))
+            return path, out.tell()
+    except BaseException:
+        os.unlink(path)
+        raise
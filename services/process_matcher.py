@@ -0,0 +1,143 @@
+"""
+Process Matcher - Exact per-app process matching over a shared process snapshot
+"""
+import os
+import re
+import time
+from typing import Dict, List, Optional, Union
+
+import psutil
+
+# Errors that mean "this process can't be inspected", not "matching failed"
+PROCESS_ERRORS = (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess)
+
+
+def _normalize_name(name: str) -> str:
+    name = name.lower()
+    return name[:-4] if name.endswith('.exe') else name
+
+
+def _normalize_path(path: str) -> str:
+    return os.path.normcase(os.path.realpath(path))
+
+
+class ProcessSnapshot:
+    """
+    A single pass over the process table.
+
+    Only pid and name are collected up front; exe, cmdline and cgroup are
+    fetched on first use for the processes that actually need them and
+    memoized for the lifetime of the snapshot.
+    """
+
+    def __init__(self):
+        self.taken_at = time.monotonic()
+        self.processes = []
+        for proc in psutil.process_iter(['pid', 'name']):
+            try:
+                if proc.info['name'] is not None:
+                    self.processes.append(proc)
+            except PROCESS_ERRORS:
+                pass
+        self._attrs: Dict[int, Dict[str, object]] = {}
+
+    def age(self) -> float:
+        return time.monotonic() - self.taken_at
+
+    def _lazy(self, proc, attr: str, fetch):
+        cached = self._attrs.setdefault(proc.pid, {})
+        if attr not in cached:
+            try:
+                cached[attr] = fetch()
+            except PROCESS_ERRORS + (OSError,):
+                cached[attr] = None
+        return cached[attr]
+
+    def name(self, proc) -> str:
+        return proc.info['name']
+
+    def exe(self, proc) -> Optional[str]:
+        return self._lazy(proc, 'exe', proc.exe)
+
+    def cmdline(self, proc) -> Optional[str]:
+        args = self._lazy(proc, 'cmdline', proc.cmdline)
+        return ' '.join(args) if args else None
+
+    def cgroup(self, proc) -> Optional[str]:
+        def read_cgroup():
+            with open(f"/proc/{proc.pid}/cgroup", 'r') as f:
+                return f.read()
+        return self._lazy(proc, 'cgroup', read_cgroup)
+
+
+class ProcessMatcher:
+    """
+    Compiled match rules for one app.
+
+    Every configured rule must match (rules are ANDed). Rules are checked
+    cheapest first, so lazily fetched attributes are only read for
+    processes that already passed the name check.
+    """
+
+    def __init__(self, name: Union[str, List[str], None] = None, exe: Optional[str] = None,
+                 cmdline: Optional[str] = None, unit: Optional[str] = None):
+        names = [name] if isinstance(name, str) else name or []
+        # Any of these process names
+        self.names = frozenset(_normalize_name(n) for n in names if n)
+        self.exe = _normalize_path(exe) if exe else None
+        self.cmdline = re.compile(cmdline) if cmdline else None
+        self.unit = unit
+
+    @classmethod
+    def from_config(cls, config: Dict, resolved_path: Optional[str] = None) -> "ProcessMatcher":
+        """
+        Build a matcher from an app config.
+
+        Apps may define a "match" block with any of "name" (one name or a
+        list of alternatives), "exe", "cmdline" (regex) and "unit" (systemd
+        unit or cgroup name); wrappers that start a differently named
+        process (google-chrome runs as chrome) need one. Without one, the
+        process name must equal the executable's file name, or the name of
+        the file it links to.
+        """
+        rules = config.get("match")
+        if rules:
+            return cls(
+                name=rules.get("name"),
+                exe=rules.get("exe"),
+                cmdline=rules.get("cmdline"),
+                unit=rules.get("unit"),
+            )
+        path = resolved_path or config.get("path", "")
+        names = [os.path.basename(path)]
+        if os.path.islink(path):
+            names.append(os.path.basename(os.path.realpath(path)))
+        return cls(name=names)
+
+    def is_empty(self) -> bool:
+        return not (self.names or self.exe or self.cmdline or self.unit)
+
+    def matches(self, snapshot: ProcessSnapshot, proc) -> bool:
+        if self.is_empty():
+            return False
+        if self.names and _normalize_name(snapshot.name(proc)) not in self.names:
+            return False
+        if self.unit:
+            cgroup = snapshot.cgroup(proc)
+            if not cgroup or not any(
+                self.unit in line.rsplit(':', 1)[-1].split('/') for line in cgroup.splitlines()
+            ):
+                return False
+        if self.exe:
+            exe = snapshot.exe(proc)
+            if not exe or _normalize_path(exe) != self.exe:
+                return False
+        if self.cmdline:
+            cmdline = snapshot.cmdline(proc)
+            if not cmdline or not self.cmdline.search(cmdline):
+                return False
+        return True
+
+    def find(self, snapshot: ProcessSnapshot) -> List:
+        """Return the processes in the snapshot that match"""
+        return [proc for proc in snapshot.processes if self.matches(snapshot, proc)]
@@ -0,0 +1,171 @@
+"""
+Profiling - Per-request stage timings and slow-request sampling
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar('request_trace', default=None)
+_span_depth: ContextVar[int] = ContextVar('span_depth', default=0)
+
+# Leaf frames of threads that are parked, not working
+IDLE_FRAMES = {('thread.py', '_worker'), ('threading.py', 'wait')}
+
+
+class RequestTrace:
+    """Stage timings (spans) and stack samples collected for one request"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.stacks: Counter = Counter()
+        self.duration_ms = 0.0
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def summary(self, max_stacks: int = 20) -> Dict:
+        top_level = sum(s['duration_ms'] for s in self.spans if s['depth'] == 0)
+        return {
+            'method': self.method,
+            'path': self.path,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration_ms, 3),
+            'spans': self.spans,
+            # Routing, request/response validation and JSON encoding
+            'unaccounted_ms': round(max(self.duration_ms - top_level, 0.0), 3),
+            'stacks': [
+                {'stack': stack, 'samples': count}
+                for stack, count in self.stacks.most_common(max_stacks)
+            ],
+        }
+
+
+@contextmanager
+def span(name: str):
+    """Time a stage of the current request; a no-op outside a traced request"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    depth = _span_depth.get()
+    token = _span_depth.set(depth + 1)
+    offset = trace.elapsed_ms()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _span_depth.reset(token)
+        trace.spans.append({
+            'name': name,
+            'depth': depth,
+            'offset_ms': round(offset, 3),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+        })
+
+
+class SlowRequestProfiler:
+    """
+    Records a trace for every request and keeps the slow ones.
+
+    Requests slower than threshold_ms land in a bounded ring. While enabled,
+    a background thread samples the stacks of all threads every
+    sample_interval_ms and attributes them to the requests in flight, which
+    gives a cheap statistical profile of where slow requests spend time.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        self.threshold_ms = float(os.getenv('SLOW_REQUEST_MS', '1000'))
+        self.sample_interval_ms = float(os.getenv('PROFILE_SAMPLE_MS', '5'))
+        self.ring = deque(maxlen=int(os.getenv('SLOW_REQUEST_RING', '50')))
+        self._active: Dict[int, RequestTrace] = {}
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def configure(self, enabled: Optional[bool] = None, threshold_ms: Optional[float] = None,
+                  sample_interval_ms: Optional[float] = None):
+        """Change settings at runtime"""
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        if sample_interval_ms is not None:
+            self.sample_interval_ms = sample_interval_ms
+        if enabled is not None:
+            self.enabled = enabled
+
+    def start(self, method: str, path: str) -> Optional[RequestTrace]:
+        if not self.enabled:
+            return None
+        trace = RequestTrace(method, path)
+        _current_trace.set(trace)
+        with self._lock:
+            self._active[id(trace)] = trace
+        self._ensure_sampler()
+        return trace
+
+    def finish(self, trace: Optional[RequestTrace]):
+        if trace is None:
+            return
+        trace.duration_ms = trace.elapsed_ms()
+        with self._lock:
+            self._active.pop(id(trace), None)
+        if trace.duration_ms >= self.threshold_ms:
+            self.ring.append(trace.summary())
+
+    def snapshot(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold_ms,
+            'sample_interval_ms': self.sample_interval_ms,
+            'capacity': self.ring.maxlen,
+            'requests': list(self.ring),
+        }
+
+    def clear(self):
+        self.ring.clear()
+
+    def _ensure_sampler(self):
+        if self._sampler is not None and self._sampler.is_alive():
+            return
+        with self._lock:
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample_loop, name='slow-request-sampler', daemon=True)
+                self._sampler.start()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while self.enabled:
+            time.sleep(self.sample_interval_ms / 1000.0)
+            if not self._active:
+                continue
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                code = frame.f_code
+                if thread_id == own_id or (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stacks.append(_collapse(frame))
+            # Counting under the lock means finished traces never change afterwards
+            with self._lock:
+                for trace in self._active.values():
+                    trace.stacks.update(stacks)
+
+
+def _collapse(frame, limit: int = 40) -> str:
+    """Render a frame as a collapsed stack (root first, ';'-separated)"""
+    parts = []
+    while frame is not None and len(parts) < limit:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+profiler = SlowRequestProfiler()
@@ -0,0 +1,168 @@
+"""
+Shared Store - Local cross-worker state (key/value, counters, locks) on SQLite
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class LockTimeout(Exception):
+    """Raised when a shared lock can't be acquired in time"""
+
+
+class SharedStore:
+    """
+    Small key/value store shared by all workers on the same host.
+
+    Backed by a SQLite file in WAL mode, so reads don't block each other
+    and each write is a short transaction. Connections are opened lazily
+    per thread and per process, so the store is safe to create before
+    the server forks its workers.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv(
+            'SHARED_STORE_PATH', os.path.join(tempfile.gettempdir(), 'gpt_backend_shared.db')
+        )
+        self._local = threading.local()
+        self._owner = uuid.uuid4().hex
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run statements in one write transaction (serialized across workers)"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._connect().execute(
+            'SELECT value, expires_at FROM kv WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        self._connect().execute(
+            'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), expires_at)
+        )
+
+    def items(self, prefix: str) -> List[Tuple[str, Any]]:
+        """All live (key, value) pairs whose key starts with prefix"""
+        rows = self._connect().execute(
+            'SELECT key, value FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)',
+            (prefix, prefix + '\uffff', time.time())
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def delete(self, key: str):
+        self._connect().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to an integer counter and return the new value"""
+        with self.transaction() as conn:
+            row = conn.execute('SELECT value, expires_at FROM kv WHERE key = ?', (key,)).fetchone()
+            expired = row is None or (row[1] is not None and row[1] <= time.time())
+            value = (0 if expired else json.loads(row[0])) + amount
+            expires_at = (time.time() + ttl if ttl else None) if expired else row[1]
+            conn.execute(
+                'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at)
+            )
+        return value
+
+    def update(self, key: str, fn: Callable[[Any], Tuple[Any, Any]], ttl: Optional[float] = None) -> Any:
+        """
+        Atomic read-modify-write: fn(current value or None) returns
+        (new value, result); the new value is stored and result returned.
+        """
+        with self.transaction() as conn:
+            row = conn.execute('SELECT value, expires_at FROM kv WHERE key = ?', (key,)).fetchone()
+            expired = row is None or (row[1] is not None and row[1] <= time.time())
+            value, result = fn(None if expired else json.loads(row[0]))
+            conn.execute(
+                'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + ttl if ttl else None)
+            )
+        return result
+
+    def purge_expired(self):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,))
+            conn.execute('DELETE FROM locks WHERE expires_at <= ?', (now,))
+
+    def try_acquire(self, name: str, lease: float = 60.0, owner: Optional[str] = None) -> Optional[str]:
+        """
+        Take a named lock if it's free or its lease ran out; return the owner
+        token. Passing the same owner again renews the lease.
+        """
+        owner = owner or f"{self._owner}:{os.getpid()}:{threading.get_ident()}"
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute('SELECT owner, expires_at FROM locks WHERE name = ?', (name,)).fetchone()
+            if row is not None and row[1] > now and row[0] != owner:
+                return None
+            conn.execute(
+                'INSERT OR REPLACE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)',
+                (name, owner, now + lease)
+            )
+        return owner
+
+    def release(self, name: str, owner: str):
+        self._connect().execute('DELETE FROM locks WHERE name = ? AND owner = ?', (name, owner))
+
+    @contextmanager
+    def lock(self, name: str, timeout: float = 30.0, lease: float = 60.0):
+        """
+        Hold a named lock across all workers. The lease bounds how long a
+        crashed holder can block everyone else.
+        """
+        deadline = time.monotonic() + timeout
+        owner = self.try_acquire(name, lease)
+        while owner is None:
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"Timed out waiting for shared lock '{name}'")
+            time.sleep(0.05)
+            owner = self.try_acquire(name, lease)
+        try:
+            yield
+        finally:
+            self.release(name, owner)
+
+
+_store: Optional[SharedStore] = None
+
+
+def get_shared_store() -> SharedStore:
+    """Return the process-wide shared store"""
+    global _store
+    if _store is None:
+        _store = SharedStore()
+    return _store
@@ -0,0 +1,127 @@
+"""
+Single-flight - Coalesces identical concurrent calls into one upstream call
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from services.deadlines import deadline_var, within
+from services.logs import get_logger, log_limited
+
+logger = get_logger('singleflight')
+
+
+class SingleFlight:
+    """
+    Shares one in-flight task among all callers using the same key.
+
+    With ttl > 0 successful results are also kept in a small micro-cache for
+    that many seconds, so a burst of identical calls becomes a single
+    upstream call. Errors are never cached. A caller being cancelled does
+    not cancel the shared task for the other waiters, but once every
+    caller has gone (a disconnect or deadline), the shared task is
+    cancelled too instead of finishing work nobody will read.
+
+    The shared task runs without a request deadline, since it serves
+    callers with different ones; each caller stops waiting when its own
+    budget runs out (DeadlineExceeded).
+
+    If a shared store is given, cached results (which must be JSON
+    serializable) are also published there so other workers can reuse them.
+    """
+
+    def __init__(self, ttl: float = 0.0, max_entries: int = 256,
+                 shared=None, namespace: str = 'singleflight'):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.namespace = namespace
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self._cache: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def _shared_key(self, key: Hashable) -> str:
+        # The generation counter lets clear() drop every worker's entries at once
+        generation = self.shared.get(f"{self.namespace}:generation", 0)
+        return f"{self.namespace}:{generation}:{key!r}"
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for key, or join the call already in flight"""
+        if self.ttl > 0:
+            cached = self._cache.get(key)
+            if cached is not None:
+                expires_at, value = cached
+                if expires_at > time.monotonic():
+                    return value
+                del self._cache[key]
+            if self.shared is not None:
+                value = self.shared.get(self._shared_key(key))
+                if value is not None:
+                    return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            context = contextvars.copy_context()
+            context.run(deadline_var.set, None)
+            task = context.run(asyncio.ensure_future, fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await within(asyncio.shield(task))
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    task.cancel()
+
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None or self.ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.ttl, task.result())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        if self.shared is not None:
+            try:
+                self.shared.set(self._shared_key(key), task.result(), ttl=self.ttl)
+            except Exception as e:
+                log_limited(logger, logging.WARNING, 'singleflight-publish',
+                            "Error publishing shared cache entry: %s", e)
+
+    def forget(self, key: Hashable):
+        """Drop a cached result so the next call goes upstream"""
+        self._cache.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
+
+    def update(self, fn: Callable[[Hashable, Any], Any]):
+        """
+        Rewrite cached results in place: fn(key, value) returns the new value,
+        or None to drop the entry. Other workers' shared entries can't be
+        patched, so they are dropped.
+        """
+        now = time.monotonic()
+        for key, (expires_at, value) in list(self._cache.items()):
+            if expires_at <= now:
+                del self._cache[key]
+                continue
+            new_value = fn(key, value)
+            if new_value is None:
+                del self._cache[key]
+            else:
+                self._cache[key] = (expires_at, new_value)
+        if self.shared is not None:
+            self.shared.incr(f"{self.namespace}:generation")
+
+    def clear(self):
+        """Drop all cached results (in-flight calls are left alone)"""
+        self._cache.clear()
+        if self.shared is not None:
+            self.shared.incr(f"{self.namespace}:generation")
@@ -0,0 +1,61 @@
+"""
+Startup Report - Records where cold-start time goes
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Wall clock when this module was first imported (i.e. early in main's import)
+IMPORTED_AT = time.time()
+
+
+def _process_started_at() -> Optional[float]:
+    """Process creation time from /proc, without importing psutil"""
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        start_ticks = int(fields[19])
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupReport:
+    """Named startup phases with their durations, plus readiness markers"""
+
+    def __init__(self):
+        self.process_started_at = _process_started_at()
+        self.phases: List[Dict] = []
+        self.marks: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({
+                'name': name,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+    def mark(self, name: str):
+        """Record the first time a milestone is reached"""
+        self.marks.setdefault(name, time.time())
+
+    def report(self) -> Dict:
+        origin = self.process_started_at or IMPORTED_AT
+        return {
+            'process_started_at': self.process_started_at,
+            'phases': self.phases,
+            # Milestones as milliseconds since process start
+            'milestones_ms': {
+                name: round((at - origin) * 1000, 1) for name, at in self.marks.items()
+            },
+        }
+
+
+startup_report = StartupReport()
@@ -0,0 +1,155 @@
+"""
+Text Normalize - Cleans message bodies into compact plain text
+"""
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+
+# Lines that introduce a quoted earlier message; everything after them is dropped
+QUOTE_INTRO = re.compile(
+    r'^\s*(?:On\s.{1,200}\swrote:\s*$'
+    r'|-{2,}\s*Original Message\s*-{2,}'
+    r'|From:\s.+\n\s*(?:Sent|Date):\s)',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# In a forward the quoted message is the content, so nothing is trimmed
+FORWARD_MARKER = re.compile(
+    r'^\s*(?:-{2,}\s*Forwarded message\s*-{2,}|Begin forwarded message:)',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# The standard signature delimiter: a line that is exactly "-- "
+SIGNATURE_DELIMITER = re.compile(r'^-- $', re.MULTILINE)
+# Longest block after the delimiter still treated as a signature
+SIGNATURE_MAX_LINES = 10
+# Mobile sign-offs, only when they are the last line
+SIGN_OFF = re.compile(r'\n\s*(?:Sent from my \w+.*|Get Outlook for \w+.*)\s*$', re.IGNORECASE)
+
+BLANK_LINES = re.compile(r'\n\s*\n\s*(?:\n\s*)+')
+INLINE_SPACE = re.compile(r'[ \t\u00a0]+')
+HTML_SPACE = re.compile(r'\s+')
+
+
+def strip_quoted_reply(text: str) -> str:
+    """Drop quoted earlier messages: '>' lines and anything after an 'On ... wrote:' intro"""
+    if FORWARD_MARKER.search(text):
+        return text
+    match = QUOTE_INTRO.search(text)
+    if match:
+        text = text[:match.start()]
+    return '\n'.join(line for line in text.split('\n') if not line.lstrip().startswith('>'))
+
+
+def strip_signature(text: str) -> str:
+    """Drop a trailing signature block marked with "-- ", and a trailing mobile sign-off"""
+    text = SIGN_OFF.sub('', text)
+    delimiters = list(SIGNATURE_DELIMITER.finditer(text))
+    if delimiters:
+        start = delimiters[-1].start()
+        if text[start:].rstrip().count('\n') <= SIGNATURE_MAX_LINES:
+            text = text[:start]
+    return text
+
+
+def collapse_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines"""
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = INLINE_SPACE.sub(' ', text)
+    text = '\n'.join(line.strip() for line in text.split('\n'))
+    return BLANK_LINES.sub('\n\n', text).strip()
+
+
+def clean_reply_text(text: str) -> str:
+    """Plain text of just what the sender wrote: no quotes, no signature"""
+    return collapse_whitespace(strip_signature(strip_quoted_reply(text.replace('\r\n', '\n'))))
+
+
+def excerpt(text: str, max_chars: int) -> str:
+    """Cleaned text cut to max_chars at a word boundary"""
+    text = clean_reply_text(text)
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + '…'
+
+
+class _HTMLToText(HTMLParser):
+    """Collects readable text from HTML, skipping scripts, styles and quoted replies"""
+
+    SKIP_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template', 'svg'}
+    # Gmail/Apple/Outlook markup for quoted history and signatures
+    SKIP_CLASSES = {'gmail_quote', 'gmail_signature', 'gmail_extra', 'moz-cite-prefix', 'moz-signature'}
+    BLOCK_TAGS = {
+        'p', 'div', 'br', 'tr', 'table', 'ul', 'ol', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+        'blockquote', 'pre', 'hr', 'section', 'article', 'header', 'footer',
+    }
+    VOID_TAGS = {'br', 'hr', 'img', 'meta', 'link', 'input', 'col', 'area', 'base', 'wbr', 'source'}
+
+    def __init__(self, trim_quotes: bool):
+        super().__init__(convert_charrefs=True)
+        self.trim_quotes = trim_quotes
+        self.parts: List[str] = []
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+        self._links: List[Optional[str]] = []
+        self._link_start = 0
+
+    def _should_skip(self, tag: str, attrs: dict) -> bool:
+        if tag in self.SKIP_TAGS:
+            return True
+        if not self.trim_quotes:
+            return False
+        if tag == 'blockquote' and attrs.get('type') == 'cite':
+            return True
+        classes = set((attrs.get('class') or '').split())
+        return bool(classes & self.SKIP_CLASSES) or attrs.get('id') == 'divRplyFwdMsg'
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag and tag not in self.VOID_TAGS:
+                self._skip_depth += 1
+            return
+        attrs = dict(attrs)
+        if self._should_skip(tag, attrs):
+            if tag not in self.VOID_TAGS:
+                self._skip_tag, self._skip_depth = tag, 1
+            return
+        if tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+        if tag == 'li':
+            self.parts.append('- ')
+        elif tag == 'a':
+            self._links.append(attrs.get('href'))
+            self._link_start = len(self.parts)
+
+    def handle_endtag(self, tag):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        if tag == 'a' and self._links:
+            href = self._links.pop()
+            text = ''.join(self.parts[self._link_start:]).strip()
+            if href and href.startswith(('http://', 'https://')) and href != text:
+                self.parts.append(f" ({href})")
+        elif tag in self.BLOCK_TAGS and tag != 'li':
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if self._skip_tag is None:
+            self.parts.append(HTML_SPACE.sub(' ', data))
+
+
+def html_to_text(html: str, trim_quotes: bool = True) -> str:
+    """
+    Readable plain text from an HTML body: scripts and styles dropped, links
+    kept as "text (url)", whitespace collapsed. With trim_quotes, quoted
+    history and signature blocks marked up by common mail clients are dropped.
+    """
+    parser = _HTMLToText(trim_quotes)
+    parser.feed(html)
+    parser.close()
+    return collapse_whitespace(''.join(parser.parts))
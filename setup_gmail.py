@@ -25,7 +25,7 @@ async def setup_gmail():
     # Get authorization URL
     try:
         print("\n1. Getting authorization URL...")
-        auth_url = await gmail_service.get_authorization_url()
+        auth_url, state = await gmail_service.get_authorization_url()
         print(f"\n[OK] Authorization URL generated!")
         print(f"\nPlease visit this URL in your browser:")
         print(f"\n{auth_url}\n")
@@ -41,7 +41,7 @@ async def setup_gmail():
         
         # Handle callback
         print("\n2. Processing authorization code...")
-        await gmail_service.handle_oauth_callback(code)
+        await gmail_service.handle_oauth_callback(code, state)
         
         print("\n[OK] Gmail authentication successful!")
         print("You can now use the Gmail API endpoints.")
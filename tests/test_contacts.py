@@ -0,0 +1,93 @@
+"""
+Tests for the correspondent index
+"""
+import asyncio
+from email.utils import formatdate
+
+import pytest
+
+from services.contacts import ContactIndex
+from services.shared_store import SharedStore
+
+NOW = 1_700_000_000
+
+
+class _Service:
+    async def get_profile(self):
+        return {'emailAddress': 'me@example.com'}
+
+
+def message(message_id, sender, to=(), cc=(), sent=False, age_days=0):
+    return {'id': message_id, 'from_email': sender, 'to': list(to), 'cc': list(cc),
+            'label_ids': ['SENT'] if sent else ['INBOX'], 'date': formatdate(NOW - age_days * 86400)}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ContactIndex(_Service(), SharedStore(str(tmp_path / 'store.db')), half_life_days=30)
+
+
+def add(index, messages):
+    asyncio.run(index.on_messages(messages, False))
+    index.refresh()
+
+
+def emails(results):
+    return [contact['email'] for contact in results]
+
+
+def test_counts_names_and_skips_own_address(index):
+    add(index, [
+        message('1', 'Alice Smith <alice@example.com>', to=['me@example.com']),
+        message('2', 'Me <me@example.com>', to=['"Bob, Jr." <bob@other.org>', 'alice@example.com'], sent=True),
+    ])
+    alice, = index.search('alice')
+    assert alice['name'] == 'Alice Smith'
+    assert (alice['count'], alice['sent_count']) == (2, 1)
+    assert index.search('me@') == []
+    bob, = index.search('bob')
+    assert bob['name'] == 'Bob, Jr.'
+
+
+def test_prefix_matches_address_domain_and_name_words(index):
+    add(index, [message('1', 'Alice Smith <alice@example.com>'), message('2', 'Carol <carol@other.org>')])
+    assert emails(index.search('smi')) == ['alice@example.com']
+    assert emails(index.search('other.')) == ['carol@other.org']
+    assert emails(index.search('  ALICE  ')) == ['alice@example.com']
+    assert index.search('zed') == []
+
+
+def test_people_you_write_to_rank_above_senders(index):
+    add(index, [
+        message('1', 'Newsletter <news@example.com>'),
+        message('2', 'me@example.com', to=['friend@example.com'], sent=True),
+    ])
+    assert emails(index.search('')) == ['friend@example.com', 'news@example.com']
+
+
+def test_recent_contacts_outrank_old_frequent_ones(index):
+    add(index, [message(f"old{i}", 'old@example.com', age_days=365) for i in range(5)]
+        + [message('new', 'new@example.com')])
+    assert emails(index.search('')) == ['new@example.com', 'old@example.com']
+
+
+def test_a_message_is_counted_once(index):
+    first = message('1', 'alice@example.com')
+    add(index, [first])
+    add(index, [first])
+    assert index.search('alice')[0]['count'] == 1
+
+
+def test_broad_and_narrow_prefixes_agree(index):
+    add(index, [message(str(i), f"User {i} <u{i}@d{i % 3}.com>", age_days=i) for i in range(60)])
+    broad = index.search('u', limit=5)
+    assert emails(broad) == [f"u{i}@d{i % 3}.com" for i in range(5)]
+    assert emails(index.search('u1', limit=3)) == ['u1@d1.com', 'u10@d1.com', 'u11@d2.com']
+
+
+def test_search_uses_the_snapshot_until_refresh(index):
+    add(index, [message('1', 'alice@example.com')])
+    asyncio.run(index.on_messages([message('2', 'bob@example.com')], False))
+    assert index.search('bob') == []
+    index.refresh()
+    assert emails(index.search('bob')) == ['bob@example.com']
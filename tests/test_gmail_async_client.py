@@ -0,0 +1,166 @@
+"""
+Tests for AsyncGmailClient against the mock Gmail REST server
+"""
+import asyncio
+import hashlib
+import json
+import os
+
+import httpx
+import pytest
+
+from benchmarks.fakes import FakeGmail
+from benchmarks.mock_gmail_server import create_app
+from services import gmail_async_client
+from services.gmail_async_client import AsyncGmailClient, encode_multipart, parse_multipart
+from services.gmail_backends import GmailApiError
+
+
+async def token():
+    return 'test-token'
+
+
+def client_for(app) -> AsyncGmailClient:
+    return AsyncGmailClient(token, base_url='http://mock', transport=httpx.ASGITransport(app=app))
+
+
+def run(coro_fn, app):
+    async def main():
+        client = client_for(app)
+        try:
+            return await coro_fn(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def test_list_pages_through_messages():
+    fake = FakeGmail(message_count=25)
+
+    async def scenario(client):
+        first = await client.call('messages.list', userId='me', maxResults=10)
+        second = await client.call('messages.list', userId='me', maxResults=10, pageToken=first['nextPageToken'])
+        return first, second
+
+    first, second = run(scenario, create_app(fake))
+    assert [m['id'] for m in first['messages']] == [f"msg{i:06d}" for i in range(10)]
+    assert [m['id'] for m in second['messages']] == [f"msg{i:06d}" for i in range(10, 20)]
+
+
+def test_get_returns_the_message_and_raises_on_404():
+    fake = FakeGmail(message_count=3)
+
+    async def scenario(client):
+        message = await client.call('messages.get', userId='me', id='msg000001', format='full')
+        with pytest.raises(GmailApiError) as missing:
+            await client.call('messages.get', userId='me', id='nope', format='full')
+        return message, missing.value
+
+    message, error = run(scenario, create_app(fake))
+    assert message['id'] == 'msg000001'
+    assert message['payload']['headers'][0]['name'] == 'From'
+    assert error.status == 404
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        run(lambda client: client.call('messages.import', userId='me'), create_app(FakeGmail(1)))
+
+
+def test_batch_returns_results_in_call_order_across_chunks():
+    fake = FakeGmail(message_count=150)
+    ids = [f"msg{i:06d}" for i in range(150)]
+    calls = [('messages.get', {'userId': 'me', 'id': message_id, 'format': 'minimal'})
+             for message_id in ids[:75] + ['missing'] + ids[75:]]
+
+    results = run(lambda client: client.batch(calls), create_app(fake))
+    assert len(results) == 151
+    assert isinstance(results[75], GmailApiError) and results[75].status == 404
+    assert [r['id'] for r in results[:75] + results[76:]] == ids
+
+
+def test_batch_maps_a_failed_chunk_to_per_call_errors():
+    fake = FakeGmail(message_count=150)
+    app = create_app(fake)
+    batches = []
+
+    async def first_batch_fails(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].startswith('/batch/'):
+            batches.append(scope['path'])
+            if len(batches) == 1:
+                await send({'type': 'http.response.start', 'status': 500,
+                            'headers': [(b'content-type', b'application/json')]})
+                await send({'type': 'http.response.body', 'body': b'{"error": {"message": "boom"}}'})
+                return
+        await app(scope, receive, send)
+
+    calls = [('messages.get', {'userId': 'me', 'id': f"msg{i:06d}"}) for i in range(150)]
+    results = run(lambda client: client.batch(calls, concurrency=1), first_batch_fails)
+    failed = [r for r in results if isinstance(r, GmailApiError)]
+    assert len(failed) == 100 and all(error.status == 500 for error in failed)
+    assert [r['id'] for r in results[100:]] == [f"msg{i:06d}" for i in range(100, 150)]
+
+
+class Unreachable(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+
+def test_transport_errors_become_gmail_api_errors():
+    async def scenario():
+        client = AsyncGmailClient(token, base_url='http://mock', transport=Unreachable())
+        try:
+            with pytest.raises(GmailApiError) as call_error:
+                await client.call('messages.list', userId='me')
+            batch = await client.batch([('messages.get', {'userId': 'me', 'id': 'msg000001'})])
+            return call_error.value, batch
+        finally:
+            await client.aclose()
+
+    call_error, batch = asyncio.run(scenario())
+    assert call_error.status == 503
+    assert isinstance(batch[0], GmailApiError) and batch[0].status == 503
+
+
+def test_multipart_round_trip_matches_by_content_id():
+    parts = [b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{"n": %d}' % i for i in range(3)]
+    body = encode_multipart(parts, 'b0undary', id_prefix='response-item')
+    parsed = parse_multipart('multipart/mixed; boundary="b0undary"', body)
+    assert [headers['content-id'] for headers, _, _, _ in parsed] == [f"<response-item{i}>" for i in range(3)]
+    assert [json.loads(payload)['n'] for _, _, _, payload in parsed] == [0, 1, 2]
+    assert parsed[0][1] == 'HTTP/1.1 200 OK'
+    assert parsed[0][2] == {'content-type': 'application/json'}
+
+
+def test_multipart_without_boundary_is_rejected():
+    with pytest.raises(ValueError):
+        parse_multipart('multipart/mixed', b'')
+
+
+def _message_file(tmp_path, size):
+    path = tmp_path / 'message.eml'
+    path.write_bytes(os.urandom(size))
+    return str(path), hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_resumable_upload(tmp_path):
+    fake = FakeGmail(message_count=1)
+    path, digest = _message_file(tmp_path, 3 * 256 * 1024 + 123)
+    sent = run(lambda client: client.send_media(path, {'threadId': 'thr1'}, chunk_size=256 * 1024),
+               create_app(fake))
+    assert sent['threadId'] == 'thr1'
+    assert fake.sent[-1]['size'] == os.path.getsize(path)
+    assert fake.sent[-1]['sha256'] == digest
+
+
+def test_resumable_upload_resumes_after_errors(tmp_path, monkeypatch):
+    class NoJitter:
+        @staticmethod
+        def uniform(a, b):
+            return 0.0
+
+    monkeypatch.setattr(gmail_async_client, 'random', NoJitter)
+    fake = FakeGmail(message_count=1, error_rate=0.3, seed=3)
+    path, digest = _message_file(tmp_path, 6 * 256 * 1024)
+    run(lambda client: client.send_media(path, chunk_size=256 * 1024), create_app(fake))
+    assert fake.sent[-1]['sha256'] == digest
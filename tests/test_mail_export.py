@@ -0,0 +1,105 @@
+"""
+Tests for the export file formats
+"""
+import base64
+import gzip
+import json
+
+from services.mail_export import MailExport, _jsonl_entry, _mbox_entry
+
+
+def raw_message(message_id, raw: bytes, internal_date=1700000000000):
+    return {'id': message_id, 'threadId': 't' + message_id, 'labelIds': ['INBOX'],
+            'internalDate': str(internal_date), 'sizeEstimate': len(raw),
+            'raw': base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')}
+
+
+def test_mbox_entry_has_a_from_line_and_escapes_body_from_lines():
+    raw = b"Subject: hi\r\n\r\nFrom here on\r\n>From quoted\r\nend"
+    entry = _mbox_entry({'id': 'm1', 'internalDate': '0'}, raw)
+    lines = entry.split(b'\n')
+    assert lines[0] == b'From m1@gmail Thu Jan  1 00:00:00 1970'
+    assert lines[1:] == [b'Subject: hi', b'', b'>From here on', b'>>From quoted', b'end', b'', b'']
+
+
+def test_jsonl_entry():
+    message = raw_message('m1', b'Subject: x\r\n\r\nbody')
+    record = json.loads(_jsonl_entry(message))
+    assert record == {'id': 'm1', 'thread_id': 'tm1', 'label_ids': ['INBOX'], 'internal_date': 1700000000000,
+                      'size_estimate': 18, 'raw': message['raw']}
+
+
+def test_encode_mbox_decodes_unpadded_raw(tmp_path):
+    export = MailExport(None, None, directory=str(tmp_path))
+    messages = [raw_message('m1', b'Subject: a\r\n\r\none'), raw_message('m2', b'Subject: bb\r\n\r\ntwo!')]
+    data = export._encode('mbox', messages)
+    assert data.startswith(b'From m1@gmail ') and b'one\n\nFrom m2@gmail ' in data
+    assert b'Subject: bb\n\ntwo!\n' in data
+
+
+def test_encode_jsonl_chunks_concatenate_into_one_gzip_stream(tmp_path):
+    export = MailExport(None, None, directory=str(tmp_path))
+    chunks = [export._encode('jsonl', [raw_message(f"m{i}", b'x' * i) for i in range(start, start + 3)])
+              for start in (0, 3)]
+    assert export._encode('jsonl', []) == b''
+    lines = gzip.decompress(b''.join(chunks)).splitlines()
+    assert [json.loads(line)['id'] for line in lines] == [f"m{i}" for i in range(6)]
+
+
+class _Service:
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def _get_backend(self):
+        return self.backend
+
+
+def test_failed_export_resumes_from_its_checkpoint(tmp_path):
+    import asyncio
+
+    import httpx
+
+    from benchmarks.fakes import FakeGmail
+    from benchmarks.mock_gmail_server import create_app
+    from services.gmail_async_client import AsyncGmailClient
+    from services.shared_store import SharedStore
+
+    fake = FakeGmail(message_count=120, body_bytes=64)
+    app = create_app(fake)
+    failures = []
+
+    async def third_page_fails_once(scope, receive, send):
+        if scope['type'] == 'http' and b'pageToken=100' in scope.get('query_string', b'') and not failures:
+            failures.append(scope['path'])
+            await send({'type': 'http.response.start', 'status': 500,
+                        'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': b'{"error": {"message": "boom"}}'})
+            return
+        await app(scope, receive, send)
+
+    async def token():
+        return 'test-token'
+
+    async def scenario():
+        backend = AsyncGmailClient(token, base_url='http://mock', transport=httpx.ASGITransport(app=third_page_fails_once))
+        export = MailExport(_Service(backend), SharedStore(str(tmp_path / 'store.db')),
+                            directory=str(tmp_path / 'exports'), page_size=50)
+        try:
+            job = export.start('jsonl')
+            await export._tasks[job['id']]
+            failed = export.get(job['id'])
+            # A crash mid-page leaves bytes past the checkpoint
+            with open(failed['path'], 'ab') as out:
+                out.write(b'partial page')
+            export.resume(job['id'])
+            await export._tasks[job['id']]
+            return failed, export.get(job['id'])
+        finally:
+            await backend.aclose()
+
+    failed, done = asyncio.run(scenario())
+    assert failed['status'] == 'failed' and failed['pages'] == 2 and failed['exported'] == 100
+    assert done['status'] == 'done' and done['exported'] == 120 and done['pages'] == 3
+    with gzip.open(done['path']) as f:
+        ids = [json.loads(line)['id'] for line in f]
+    assert ids == [f"msg{i:06d}" for i in range(120)]
@@ -0,0 +1,112 @@
+"""
+Tests for the mail rules matcher and rule validation
+"""
+import pytest
+
+from services.mail_rules import CompiledRules, validate_rule
+
+
+def rule(*conditions, match='all', **extra):
+    return {'id': 'r1', 'conditions': list(conditions), 'actions': [{'type': 'notify'}],
+            'match': match, **extra}
+
+
+def message(**fields):
+    base = {'id': 'm1', 'from_email': 'Alice <alice@example.com>', 'to': [], 'subject': '',
+            'body': '', 'snippet': '', 'label_ids': ['INBOX'], 'attachments': []}
+    return dict(base, **fields)
+
+
+def matches(rules, msg):
+    return [r['id'] for r in CompiledRules(rules).match(msg)]
+
+
+@pytest.mark.parametrize('header', [
+    'alice@x.com, bob@y.com',
+    'bob@y.com, alice@x.com',
+    'Bob <bob@y.com>, Alice <alice@x.com>',
+    'Alice <alice@x.com>',
+    'alice@x.com',
+    'alice@x.com;bob@y.com',
+    'ALICE@X.COM',
+])
+def test_domain_matches_any_recipient(header):
+    rules = [rule({'field': 'to', 'op': 'domain', 'value': 'x.com'})]
+    assert matches(rules, message(to=[header])) == ['r1']
+
+
+@pytest.mark.parametrize('header', [
+    'alice@x.com.evil.org, bob@y.com',
+    'alice@x.community',
+    'alice@sub-x.com',
+    'bob@y.com',
+])
+def test_domain_is_exact(header):
+    rules = [rule({'field': 'to', 'op': 'domain', 'value': '@x.com'})]
+    assert matches(rules, message(to=[header])) == []
+
+
+def test_domain_on_from_with_display_name():
+    rules = [rule({'field': 'from', 'op': 'domain', 'value': 'example.com'})]
+    assert matches(rules, message()) == ['r1']
+
+
+def test_contains_equals_and_regex():
+    rules = [
+        rule({'field': 'subject', 'op': 'contains', 'value': 'Invoice'}, id='contains'),
+        rule({'field': 'subject', 'op': 'equals', 'value': 'invoice 42'}, id='equals'),
+        rule({'field': 'body', 'op': 'regex', 'value': r'order #\d+'}, id='regex'),
+    ]
+    assert matches(rules, message(subject='Invoice 42', body='Your ORDER #981')) == ['contains', 'equals', 'regex']
+    assert matches(rules, message(subject='Re: invoice 42')) == ['contains']
+
+
+def test_all_any_and_negate():
+    subject = {'field': 'subject', 'op': 'contains', 'value': 'report'}
+    sender = {'field': 'from', 'op': 'domain', 'value': 'other.com'}
+    all_rule = rule(subject, sender, id='all')
+    any_rule = rule(subject, sender, match='any', id='any')
+    not_rule = rule(dict(sender, negate=True), id='not')
+    assert matches([all_rule, any_rule, not_rule], message(subject='Weekly report')) == ['any', 'not']
+
+
+def test_stop_skips_later_rules():
+    condition = {'field': 'subject', 'op': 'contains', 'value': 'x'}
+    rules = [rule(condition, id='first', stop=True), rule(condition, id='second')]
+    assert matches(rules, message(subject='x')) == ['first']
+
+
+def test_disabled_rules_are_ignored():
+    rules = [rule({'field': 'subject', 'op': 'contains', 'value': 'x'}, enabled=False)]
+    assert matches(rules, message(subject='x')) == []
+
+
+def test_own_mail_needs_a_label_condition():
+    condition = {'field': 'subject', 'op': 'contains', 'value': 'x'}
+    sent = message(subject='x', label_ids=['SENT'])
+    assert matches([rule(condition)], sent) == []
+    scoped = rule(condition, {'field': 'label', 'op': 'equals', 'value': 'SENT'})
+    assert matches([scoped], sent) == ['r1']
+
+
+def test_attachment_and_label_fields():
+    rules = [
+        rule({'field': 'attachment', 'op': 'contains', 'value': '.pdf'}, id='pdf'),
+        rule({'field': 'label', 'op': 'equals', 'value': 'Label_7'}, id='label'),
+    ]
+    msg = message(attachments=[{'filename': 'Report.PDF'}], label_ids=['INBOX', 'Label_7'])
+    assert matches(rules, msg) == ['pdf', 'label']
+
+
+@pytest.mark.parametrize('bad, error', [
+    ({'actions': [{'type': 'notify'}]}, 'condition'),
+    ({'conditions': [{'field': 'subject', 'value': 'x'}]}, 'action'),
+    (rule({'field': 'cc', 'value': 'x'}), 'Unknown field'),
+    (rule({'field': 'subject', 'op': 'like', 'value': 'x'}), 'Unknown op'),
+    (rule({'field': 'subject', 'op': 'domain', 'value': 'x.com'}), 'domain op'),
+    (rule({'field': 'subject', 'op': 'regex', 'value': '('}), 'Invalid regex'),
+    (dict(rule({'field': 'subject', 'value': 'x'}), actions=[{'type': 'forward'}]), "'to'"),
+])
+def test_validate_rule_rejects(bad, error):
+    with pytest.raises(ValueError, match=error):
+        validate_rule(bad)
@@ -0,0 +1,78 @@
+"""
+Tests for the streaming MIME message writer
+"""
+import email
+import email.policy
+import io
+import os
+
+import pytest
+
+from services.mime_builder import write_message
+
+
+@pytest.fixture
+def written():
+    paths = []
+
+    def write(**kwargs):
+        path, size = write_message(**kwargs)
+        paths.append(path)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        assert len(raw) == size
+        return email.message_from_bytes(raw, policy=email.policy.default)
+
+    yield write
+    for path in paths:
+        os.unlink(path)
+
+
+def test_plain_message(written):
+    message = written(to='a@x.com', subject='Hi', text='Hello there', cc=['b@x.com', 'c@x.com'],
+                      headers={'In-Reply-To': '<m1@x.com>'})
+    assert message['To'] == 'a@x.com'
+    assert message['Cc'] == 'b@x.com, c@x.com'
+    assert message['In-Reply-To'] == '<m1@x.com>'
+    assert message.get_content_type() == 'text/plain'
+    assert message.get_content().strip() == 'Hello there'
+
+
+def test_html_alternative(written):
+    message = written(to='a@x.com', subject='Hi', text='plain', html='<p>rich</p>')
+    assert message.get_content_type() == 'multipart/alternative'
+    assert message.get_body(('html',)).get_content().strip() == '<p>rich</p>'
+    assert message.get_body(('plain',)).get_content().strip() == 'plain'
+
+
+def test_attachments_from_every_source(written, tmp_path):
+    on_disk = tmp_path / 'data.bin'
+    on_disk.write_bytes(os.urandom(200_000))
+    attachments = [
+        {'filename': 'report.pdf', 'data': b'%PDF-1.4 small'},
+        {'filename': 'data.bin', 'path': str(on_disk)},
+        {'filename': 'notes.txt', 'mime_type': 'text/markdown', 'file': io.BytesIO(b'# notes')},
+        {'filename': 'résumé final.docx', 'data': b''},
+    ]
+    message = written(to='a@x.com', subject='Files', text='See attached', html='<p>See attached</p>',
+                      attachments=attachments)
+    assert message.get_content_type() == 'multipart/mixed'
+    assert message.get_body(('plain',)).get_content().strip() == 'See attached'
+    parts = list(message.iter_attachments())
+    assert [part.get_filename() for part in parts] == ['report.pdf', 'data.bin', 'notes.txt', 'résumé final.docx']
+    assert [part.get_content_type() for part in parts] == [
+        'application/pdf', 'application/octet-stream', 'text/markdown',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    ]
+    payloads = [part.get_payload(decode=True) for part in parts]
+    assert payloads == [b'%PDF-1.4 small', on_disk.read_bytes(), b'# notes', b'']
+
+
+def test_base64_lines_stay_within_the_limit(tmp_path):
+    path, _ = write_message(to='a@x.com', subject='Big', text='x',
+                            attachments=[{'filename': 'a.bin', 'data': os.urandom(100_000)}])
+    try:
+        with open(path, 'rb') as f:
+            assert max(len(line.rstrip(b'\r\n')) for line in f) <= 78
+    finally:
+        os.unlink(path)
@@ -0,0 +1,28 @@
+"""
+Tests for Range header parsing on attachment downloads
+"""
+import pytest
+
+from main import _parse_range
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('bytes=990-5000', (990, 999)),
+    ('bytes=0-1,5-6', None),
+    ('items=0-1', None),
+    ('bytes=a-b', None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=5-2', 'bytes=2000-3000'])
+def test_unsatisfiable_ranges_raise(header):
+    with pytest.raises(ValueError):
+        _parse_range(header, 1000)
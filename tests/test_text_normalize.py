@@ -0,0 +1,80 @@
+"""
+Tests for message body normalization
+"""
+from services.text_normalize import (
+    clean_reply_text, collapse_whitespace, excerpt, html_to_text, strip_quoted_reply, strip_signature
+)
+
+
+def test_quoted_reply_after_intro_is_dropped():
+    text = "Sounds good.\n\nOn Mon, Jan 1, 2024 at 10:00 Alice <a@x.com> wrote:\n> earlier\n> text"
+    assert strip_quoted_reply(text).strip() == "Sounds good."
+
+
+def test_quote_lines_are_dropped_and_the_rest_kept():
+    text = "See below\n> quoted\nMy answer"
+    assert strip_quoted_reply(text) == "See below\nMy answer"
+
+
+def test_outlook_header_block_starts_the_quote():
+    text = "Thanks!\n\nFrom: Bob <b@x.com>\nSent: Monday\nTo: me\nSubject: hi\n\nold"
+    assert strip_quoted_reply(text).strip() == "Thanks!"
+
+
+def test_forwards_are_kept_whole():
+    text = "FYI\n\n---------- Forwarded message ---------\nFrom: Bob\n> quoted\nOn Mon Bob wrote:\nold"
+    assert strip_quoted_reply(text) == text
+
+
+def test_signature_after_delimiter_is_dropped():
+    assert strip_signature("Hello\n-- \nBob\nCEO").strip() == "Hello"
+
+
+def test_long_block_after_delimiter_is_kept():
+    text = "Hello\n-- \n" + "\n".join(f"line {i}" for i in range(20))
+    assert strip_signature(text) == text
+
+
+def test_dashes_without_the_trailing_space_are_not_a_signature():
+    text = "Score was 3--1\n--\nmore"
+    assert strip_signature(text) == text
+
+
+def test_mobile_sign_off_only_as_last_line():
+    assert strip_signature("On my way\n\nSent from my iPhone").strip() == "On my way"
+    text = "Sent from my iPhone earlier, the photo\nis attached"
+    assert strip_signature(text) == text
+
+
+def test_clean_reply_text_combines_the_steps():
+    text = "Hi Alice,\r\n\r\n\r\n\r\nSee  you   then.\r\n-- \r\nBob\r\n\r\nOn Mon, Alice wrote:\r\n> hi"
+    assert clean_reply_text(text) == "Hi Alice,\n\nSee you then."
+
+
+def test_collapse_whitespace():
+    assert collapse_whitespace("  a \t b c \n\n\n\n d  ") == "a b c\n\nd"
+
+
+def test_excerpt_cuts_at_a_word_boundary():
+    assert excerpt("one two three four", 100) == "one two three four"
+    assert excerpt("one two three four", 10) == "one two…"
+
+
+def test_html_to_text_drops_scripts_and_keeps_links():
+    html = ("<html><head><title>T</title><style>p{}</style></head><body>"
+            "<p>Hello&nbsp;<b>there</b></p><script>evil()</script>"
+            "<p>Read <a href='https://x.com/a'>the doc</a> or <a href='https://x.com/b'>https://x.com/b</a></p>"
+            "<ul><li>one</li><li>two</li></ul></body></html>")
+    assert html_to_text(html) == "Hello there\n\nRead the doc (https://x.com/a) or https://x.com/b\n\n- one\n- two"
+
+
+def test_html_quotes_and_signatures_are_trimmed_only_when_asked():
+    html = ("<div>Reply</div><div class='gmail_signature'>Bob</div>"
+            "<div class='gmail_quote'>On Mon <blockquote type='cite'><div>old</div></blockquote></div>")
+    assert html_to_text(html) == "Reply"
+    assert html_to_text(html, trim_quotes=False) == "Reply\n\nBob\n\nOn Mon\n\nold"
+
+
+def test_nested_skipped_tags_end_at_the_matching_close():
+    html = "<div class='gmail_quote'><div>a</div><div>b</div></div><div>after</div>"
+    assert html_to_text(html) == "after"